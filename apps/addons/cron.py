@@ -8,7 +8,7 @@ import time
 from datetime import datetime, timedelta
 
 from django.conf import settings
-from django.db import connections, transaction
+from django.db import connection, connections, transaction
 from django.db.models import Q, F, Avg
 
 import cronjobs
@@ -21,7 +21,9 @@ import amo
 from amo.celery import task
 from amo.decorators import write
 from amo.utils import chunked, walkfiles
-from addons.models import Addon, AppSupport, FrozenAddon, Persona
+from addons.models import (Addon, AddonRecommendation,
+                           AddonRecommendationChange, AppSupport,
+                           FrozenAddon, Persona)
 from files.models import File
 from lib.es.utils import raise_if_reindex_in_progress
 from stats.models import ThemeUserCount, UpdateCount
@@ -114,23 +116,18 @@ def update_addon_average_daily_users():
 def _update_addon_average_daily_users(data, **kw):
     task_log.info("[%s] Updating add-ons ADU totals." % (len(data)))
 
-    for pk, count in data:
-        try:
-            addon = Addon.objects.get(pk=pk)
-        except Addon.DoesNotExist:
-            # The processing input comes from metrics which might be out of
-            # date in regards to currently existing add-ons
-            m = "Got an ADU update (%s) but the add-on doesn't exist (%s)"
-            task_log.debug(m % (count, pk))
-            continue
-
+    counts = dict(data)
+    addons = _addons_to_update(counts)
+    values = {}
+    for addon in addons:
+        count = counts[addon.id]
         if (count - addon.total_downloads) > 10000:
             # Adjust ADU to equal total downloads so bundled add-ons don't
             # skew the results when sorting by users.
             task_log.info('Readjusted ADU count for addon %s' % addon.slug)
-            addon.update(average_daily_users=addon.total_downloads)
-        else:
-            addon.update(average_daily_users=count)
+            count = addon.total_downloads
+        values[addon.id] = (count,)
+    _bulk_update_addons(addons, values, 'average_daily_users')
 
 
 @cronjobs.register
@@ -183,21 +180,64 @@ def _update_addon_download_totals(data, **kw):
     task_log.info('[%s] Updating add-ons download+average totals.' %
                   (len(data)))
 
-    for pk, avg, sum in data:
-        try:
-            addon = Addon.objects.get(pk=pk)
-            # Don't trigger a save unless we have to. Since the query that
-            # sends us data doesn't filter out deleted addons, or the addon may
-            # be unpopular, this can reduce a lot of unnecessary save queries.
-            if (addon.average_daily_downloads != avg or
-                    addon.total_downloads != sum):
-                addon.update(average_daily_downloads=avg, total_downloads=sum)
-        except Addon.DoesNotExist:
-            # The processing input comes from metrics which might be out of
-            # date in regards to currently existing add-ons.
-            m = ("Got new download totals (total=%s,avg=%s) but the add-on"
-                 "doesn't exist (%s)" % (sum, avg, pk))
-            task_log.debug(m)
+    values = dict((pk, (avg, sum)) for pk, avg, sum in data)
+    addons = _addons_to_update(values)
+    _bulk_update_addons(addons, values, 'average_daily_downloads',
+                        'total_downloads')
+
+
+def _addons_to_update(data):
+    """
+    Return the add-ons whose ids are the keys of `data` in a single query.
+    """
+    addons = list(Addon.objects.no_cache().filter(id__in=data)
+                  .no_transforms())
+    # The processing input comes from metrics which might be out of date in
+    # regards to currently existing add-ons.
+    missing = set(data) - set(addon.id for addon in addons)
+    if missing:
+        task_log.debug('Got counters for add-ons that do not exist: %s' %
+                       sorted(missing))
+    return addons
+
+
+@write
+def _bulk_update_addons(addons, values, *fields):
+    """
+    Set `fields` of `addons` to `values`, a dict of add-on id to a tuple of
+    values in the order of `fields`.
+
+    Only the add-ons with changed values are written, all in one
+    UPDATE ... CASE query. The cache of those add-ons is then invalidated
+    and they are queued for indexing together, since the query doesn't send
+    any signal.
+    """
+    model_fields = [Addon._meta.get_field(field) for field in fields]
+    changed = {}
+    for addon in addons:
+        new = tuple(field.to_python(value) for field, value
+                    in zip(model_fields, values[addon.id]))
+        if new != tuple(getattr(addon, field) for field in fields):
+            changed[addon] = new
+    if not changed:
+        return
+
+    log.debug('Updating %s of %s add-ons' % (', '.join(fields), len(changed)))
+    sets, params = [], []
+    for idx, field in enumerate(model_fields):
+        sets.append('`%s` = CASE `id` %s END' % (
+            field.column, ' '.join(['WHEN %s THEN %s'] * len(changed))))
+        for addon, new in changed.items():
+            params.extend([addon.id, new[idx]])
+    ids = [addon.id for addon in changed]
+    cursor = connection.cursor()
+    cursor.execute('UPDATE `addons` SET %s WHERE `id` IN (%s)' % (
+        ', '.join(sets), ', '.join(['%s'] * len(ids))), params + ids)
+    transaction.commit_unless_managed()
+
+    Addon.objects.invalidate(*changed)
+    from . import tasks
+    tasks.index_queue.add(ids)
 
 
 def _change_last_updated(next):
@@ -341,18 +381,18 @@ def deliver_hotness():
               .values_list('addon').annotate(Avg('count')))
         thisweek = dict(qs.filter(date__gte=one_week))
         threeweek = dict(qs.filter(date__range=(four_weeks, one_week)))
+        values = {}
         for addon in addons:
             this, three = thisweek.get(addon.id, 0), threeweek.get(addon.id, 0)
             if this > 1000 and three > 1:
-                addon.update(hotness=(this - three) / float(three))
+                values[addon.id] = ((this - three) / float(three),)
             else:
-                addon.update(hotness=0)
-        # Let the database catch its breath.
-        time.sleep(10)
+                values[addon.id] = (0,)
+        _bulk_update_addons(addons, values, 'hotness')
 
 
-@cronjobs.register
-def recs():
+def _recs_addons():
+    """Return {addon: array of synced collection ids} to build recs from."""
     start = time.time()
     cursor = connections[multidb.get_slave()].cursor()
     cursor.execute("""
@@ -368,6 +408,15 @@ def recs():
     addons = _group_addons(qs)
     recs_log.info('%.2fs (groupby) : %s addons' %
                   ((time.time() - start), len(addons)))
+    return addons
+
+
+@cronjobs.register
+def recs(processes=1):
+    # Everything gets recomputed, forget about the changes seen so far.
+    changed = list(AddonRecommendationChange.objects
+                   .values_list('addon', flat=True))
+    addons = _recs_addons()
 
     if not len(addons):
         return
@@ -380,7 +429,6 @@ def recs():
     except Exception:
         log.error('Could not call ps', exc_info=True)
 
-    sim = recommend.similarity  # Locals are faster.
     sims, start, timers = {}, [time.time()], {'calc': [], 'sql': []}
 
     def write_recs():
@@ -395,32 +443,94 @@ def recs():
         timers['sql'].append(time.time() - calc)
         start[0] = time.time()
 
-    for idx, (addon, collections) in enumerate(addons.iteritems(), 1):
-        xs = [(other, sim(collections, cs))
-              for other, cs in addons.iteritems()]
-        # Sort by similarity and keep the top N.
-        others = sorted(xs, key=operator.itemgetter(1), reverse=True)
-        sims[addon] = [(k, v) for k, v in others[:11] if k != addon]
+    # Only add-ons sharing a collection are compared, keep the top 10.
+    similar = recommend.all_top_similar(addons, 10, processes=int(processes))
+    for idx, (addon, others) in enumerate(similar, 1):
+        sims[addon] = others
 
         if idx % 50 == 0:
             write_recs()
     else:
         write_recs()
 
+    _clear_recs_changes(changed)
+
     avg_len = sum(len(v) for v in addons.itervalues()) / float(len(addons))
     recs_log.info('%s addons: average length: %.2f' % (len(addons), avg_len))
     recs_log.info('Processing time: %.2fs' % sum(timers['calc']))
     recs_log.info('SQL time: %.2fs' % sum(timers['sql']))
 
 
+@cronjobs.register
+def recs_changed():
+    """
+    Recompute the recommendations affected by the synced collections that
+    changed since the last run, see `AddonRecommendationChange`.
+
+    That's the changed add-ons, the add-ons sharing a collection with them
+    and the add-ons they were recommended for.
+    """
+    changed = set(AddonRecommendationChange.objects
+                  .values_list('addon', flat=True))
+    if not changed:
+        return
+
+    addons = _recs_addons()
+    index = recommend.inverted_index(addons)
+    affected = set(changed)
+    for addon in changed:
+        for collection in addons.get(addon, []):
+            affected.update(index[collection])
+    affected.update(AddonRecommendation.objects
+                    .filter(other_addon__in=changed)
+                    .values_list('addon', flat=True))
+    recs_log.info('%s changed addons: %s affected addons' %
+                  (len(changed), len(affected)))
+
+    for chunk in chunked(sorted(affected), 50):
+        # Add-ons without recs anymore lose the ones they had.
+        _dump_recs(dict(
+            (addon, recommend.top_similar(addons, index, addon, 10)
+             if addon in addons else [])
+            for addon in chunk))
+
+    _clear_recs_changes(changed)
+
+
+def _clear_recs_changes(addon_ids):
+    # Changes made since `addon_ids` were read are left for the next run.
+    for chunk in chunked(addon_ids, 1000):
+        AddonRecommendationChange.objects.filter(addon__in=chunk).delete()
+
+
+def _same_recs(xs, ys):
+    # Scores are stored as single precision floats.
+    xs, ys = dict(xs), dict(ys)
+    return (set(xs) == set(ys) and
+            all(abs(xs[k] - ys[k]) < 1e-6 for k in xs))
+
+
 def _dump_recs(sims):
-    # Dump a dictionary of {addon: (other_addon, score)} into the
-    # addon_recommendations table.
+    # Dump a dictionary of {addon: [(other_addon, score)]} into the
+    # addon_recommendations table, skipping the add-ons whose
+    # recommendations didn't change.
+    if not sims:
+        return
     cursor = connections['default'].cursor()
-    addons = sims.keys()
+    cursor.execute("""
+        SELECT addon_id, other_addon_id, score
+        FROM addon_recommendations WHERE addon_id IN %s""", [sims.keys()])
+    existing = {}
+    for addon, other, score in cursor.fetchall():
+        existing.setdefault(addon, []).append((other, score))
+
+    addons = [addon for addon, others in sims.items()
+              if not _same_recs(others, existing.get(addon, []))]
+    if not addons:
+        return
     vals = [(addon, other, score)
-            for addon, others in sims.items()
-            for other, score in others]
+            for addon in addons
+            for other, score in sims[addon]]
     cursor.execute('BEGIN')
     cursor.execute('DELETE FROM addon_recommendations WHERE addon_id IN %s',
                    [addons])
@@ -449,14 +559,19 @@ def _group_addons(qs):
     return addons
 
 
-@cronjobs.register
-def reindex_addons(index=None, addon_type=None):
-    from . import tasks
+def _ids_to_index(addon_type=None):
     ids = (Addon.with_unlisted.values_list('id', flat=True)
            .filter(_current_version__isnull=False,
                    status__in=amo.VALID_STATUSES))
     if addon_type:
         ids = ids.filter(type=addon_type)
+    return ids
+
+
+@cronjobs.register
+def reindex_addons(index=None, addon_type=None):
+    from . import tasks
+    ids = _ids_to_index(addon_type)
     ts = [tasks.index_addons.subtask(args=[chunk], kwargs=dict(index=index))
           for chunk in chunked(sorted(list(ids)), 150)]
     TaskSet(ts).apply_async()
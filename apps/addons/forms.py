@@ -20,7 +20,8 @@ from amo.urlresolvers import reverse
 from amo.utils import slug_validator, slugify, sorted_groupby, remove_icons
 from addons.models import (Addon, AddonCategory, BlacklistedSlug, Category,
                            Persona)
-from addons.tasks import save_theme, save_theme_reupload
+from addons.tasks import (save_theme, save_theme_reupload,
+                          update_theme_payloads)
 from addons.utils import reverse_name_lookup
 from addons.widgets import IconWidgetRenderer, CategoriesSelectMultiple
 from devhub import tasks as devhub_tasks
@@ -684,6 +685,8 @@ class EditThemeForm(AddonFormBase):
                 save_theme_reupload.delay(
                     data['header_hash'], data['footer_hash'], addon)
 
+        update_theme_payloads.delay([addon.id])
+
         return data
 
 
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import collections
+import hashlib
 import itertools
 import json
 import os
@@ -11,13 +12,14 @@ from django.conf import settings
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.files.storage import default_storage as storage
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.dispatch import receiver
 from django.db.models import Max, Q, signals as dbsignals
 from django.utils.translation import trans_real as translation
 
 import caching.base as caching
 import commonware.log
+import dateutil.parser
 import json_field
 from django_statsd.clients import statsd
 from jinja2.filters import do_dictsort
@@ -36,6 +38,7 @@ from amo.utils import (attach_trans_dict, cache_ns_key, chunked, find_language,
                        to_language, urlparams)
 from amo.urlresolvers import get_outgoing_url, reverse
 from files.models import File
+from lib.recommend import TopRecommendations
 from reviews.models import Review
 import sharing.utils as sharing
 from stats.models import AddonShareCountTotal
@@ -416,6 +419,50 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         return cls.search().filter(
             is_disabled=False, status__in=amo.REVIEWED_STATUSES)
 
+    @classmethod
+    def from_search_result(cls, source):
+        """
+        Build an add-on from its document, as indexed by
+        `addons.search.extract`, without querying the database.
+
+        The fields, the name and summary, and the persona of themes are set,
+        enough for search suggestions. Listings also need the current
+        version, pass `Addon.attach_related_versions` to
+        `ES.source_objects()` to load them all at once. Anything else is
+        still loaded from the database when it's accessed.
+        """
+        fields = ('id', 'slug', 'type', 'status', 'icon_type',
+                  'average_daily_users', 'weekly_downloads', 'hotness',
+                  'bayesian_rating', 'average_rating', 'total_reviews',
+                  'default_locale', 'is_listed', 'premium_type', 'is_disabled',
+                  'ts_slowness', 'annoying', 'charity_id', 'paypal_id',
+                  'wants_contributions')
+        addon = cls(**dict((f, source[f]) for f in fields if f in source))
+        addon._current_version_id = source.get('current_version')
+        if source.get('persona'):
+            addon.persona = Persona(**source['persona'])
+        for field in ('created', 'last_updated', 'modified'):
+            value = source.get(field)
+            if isinstance(value, basestring):
+                value = dateutil.parser.parse(value)
+            if value:
+                setattr(addon, field, value)
+
+        # Like translations from the database, fall back to the default
+        # locale.
+        locales = (translation.get_language().lower(),
+                   (addon.default_locale or '').lower())
+        for field in ('name', 'summary'):
+            strings = dict((t['lang'].lower(), t)
+                           for t in source.get(field + '_translations', []))
+            for locale in locales:
+                if strings.get(locale, {}).get('string'):
+                    setattr(addon, field, Translation(
+                        locale=strings[locale]['lang'],
+                        localized_string=strings[locale]['string']))
+                    break
+        return addon
+
     @use_master
     def clean_slug(self, slug_field='slug'):
         if self.status == amo.STATUS_DELETED:
@@ -759,30 +806,13 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         if not app_id:
             return None
 
-        if platform:
-            # We include platform_id=1 always in the SQL so we skip it here.
-            platform = platform.lower()
-            if platform != 'all' and platform in amo.PLATFORM_DICT:
-                platform = amo.PLATFORM_DICT[platform].id
-            else:
-                platform = None
-
+        platform, compat_mode = self._compat_args(app_version, platform,
+                                                  compat_mode)
         log.debug(u'Checking compatibility for add-on ID:%s, APP:%s, V:%s, '
                   u'OS:%s, Mode:%s' % (self.id, app_id, app_version, platform,
                                        compat_mode))
-        valid_file_statuses = ','.join(map(str, self.valid_file_statuses))
-        data = dict(id=self.id, app_id=app_id, platform=platform,
-                    valid_file_statuses=valid_file_statuses)
-        if app_version:
-            data.update(version_int=version_int(app_version))
-        else:
-            # We can't perform the search queries for strict or normal without
-            # an app version.
-            compat_mode = 'ignore'
-
-        ns_key = cache_ns_key('d2c-versions:%s' % self.id)
-        cache_key = '%s:%s:%s:%s:%s' % (ns_key, app_id, app_version, platform,
-                                        compat_mode)
+        cache_key = self._compat_cache_key(self.id, app_id, app_version,
+                                           platform, compat_mode)
         version_id = cache.get(cache_key)
         if version_id is not None:
             log.debug(u'Found compatible version in cache: %s => %s' % (
@@ -795,22 +825,121 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
                 except Version.DoesNotExist:
                     pass
 
+        raw_sql, data = self._compat_sql(
+            'versions.*', 'addons.id = %(id)s', self.valid_file_statuses,
+            app_id, app_version, platform, compat_mode)
+        data['id'] = self.id
+        raw_sql.append('ORDER BY versions.id DESC LIMIT 1;')
+
+        version = Version.objects.raw(''.join(raw_sql) % data)
+        if version:
+            version = version[0]
+            version_id = version.id
+        else:
+            version = None
+            version_id = 0
+
+        log.debug(u'Caching compat version %s => %s' % (cache_key, version_id))
+        cache.set(cache_key, version_id, None)
+
+        return version
+
+    @classmethod
+    def compatible_version_ids(cls, addons, app_id, app_version=None,
+                               platform=None, compat_mode='strict'):
+        """
+        Like `compatible_version`, for many add-ons at once: returns a dict
+        of the newest compatible version id of each add-on, or None.
+
+        Add-ons missing from the cache are resolved with one query per set
+        of valid file statuses instead of one query per add-on.
+        """
+        if not app_id:
+            return dict((addon.id, None) for addon in addons)
+
+        platform, compat_mode = cls._compat_args(app_version, platform,
+                                                 compat_mode)
+        keys = dict((cls._compat_cache_key(addon.id, app_id, app_version,
+                                           platform, compat_mode), addon)
+                    for addon in addons)
+        cached = cache.get_many(keys.keys())
+        version_ids = dict((keys[key].id, version_id or None)
+                           for key, version_id in cached.items())
+
+        missing = [addon for key, addon in keys.items() if key not in cached]
+        for statuses, group in sorted_groupby(
+                missing, 'valid_file_statuses'):
+            ids = [addon.id for addon in group]
+            raw_sql, data = cls._compat_sql(
+                'versions.addon_id, MAX(versions.id)',
+                'addons.id IN (%(ids)s)', statuses, app_id, app_version,
+                platform, compat_mode)
+            data['ids'] = ','.join(map(str, ids))
+            raw_sql.append('GROUP BY versions.addon_id;')
+            cursor = connection.cursor()
+            cursor.execute(''.join(raw_sql) % data)
+            found = dict(cursor.fetchall())
+            for id_ in ids:
+                version_ids[id_] = found.get(id_)
+
+        cache.set_many(dict(
+            (key, version_ids[addon.id] or 0) for key, addon in keys.items()
+            if key not in cached), None)
+        return version_ids
+
+    @staticmethod
+    def _compat_args(app_version, platform, compat_mode):
+        """Normalize the platform and compat mode of a compatibility check."""
+        if platform:
+            # We include platform_id=1 always in the SQL so we skip it here.
+            platform = platform.lower()
+            if platform != 'all' and platform in amo.PLATFORM_DICT:
+                platform = amo.PLATFORM_DICT[platform].id
+            else:
+                platform = None
+        if not app_version:
+            # We can't perform the search queries for strict or normal without
+            # an app version.
+            compat_mode = 'ignore'
+        return platform, compat_mode
+
+    @staticmethod
+    def _compat_cache_key(addon_id, app_id, app_version, platform,
+                          compat_mode):
+        ns_key = cache_ns_key('d2c-versions:%s' % addon_id)
+        return '%s:%s:%s:%s:%s' % (ns_key, app_id, app_version, platform,
+                                   compat_mode)
+
+    @staticmethod
+    def _compat_sql(select, addons_filter, valid_file_statuses, app_id,
+                    app_version, platform, compat_mode):
+        """
+        Return the SQL, as a list of parts missing the ordering, and the
+        params of the compatible versions of the add-ons matched by
+        `addons_filter`.
+        """
+        data = dict(app_id=app_id, platform=platform,
+                    valid_file_statuses=','.join(map(str,
+                                                     valid_file_statuses)))
+        if app_version:
+            data.update(version_int=version_int(app_version))
+
         raw_sql = ["""
-            SELECT versions.*
+            SELECT %s
             FROM versions
             INNER JOIN addons
-                ON addons.id = versions.addon_id AND addons.id = %(id)s
+                ON addons.id = versions.addon_id AND %s
             INNER JOIN applications_versions
                 ON applications_versions.version_id = versions.id
             INNER JOIN appversions appmin
                 ON appmin.id = applications_versions.min
-                AND appmin.application_id = %(app_id)s
+                AND appmin.application_id = %%(app_id)s
             INNER JOIN appversions appmax
                 ON appmax.id = applications_versions.max
-                AND appmax.application_id = %(app_id)s
+                AND appmax.application_id = %%(app_id)s
             INNER JOIN files
                 ON files.version_id = versions.id AND
-                   (files.platform_id = 1"""]
+                   (files.platform_id = 1""" % (select, addons_filter)]
 
         if platform:
             raw_sql.append(' OR files.platform_id = %(platform)s')
@@ -852,20 +981,7 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         else:  # Not defined or 'strict'.
             raw_sql.append('AND appmax.version_int >= %(version_int)s ')
 
-        raw_sql.append('ORDER BY versions.id DESC LIMIT 1;')
-
-        version = Version.objects.raw(''.join(raw_sql) % data)
-        if version:
-            version = version[0]
-            version_id = version.id
-        else:
-            version = None
-            version_id = 0
-
-        log.debug(u'Caching compat version %s => %s' % (cache_key, version_id))
-        cache.set(cache_key, version_id, None)
-
-        return version
+        return raw_sql, data
 
     def increment_version(self):
         """Increment version number by 1."""
@@ -883,6 +999,18 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         key = cache_ns_key('d2c-versions:%s' % self.id, increment=True)
         log.info('Incrementing d2c-versions namespace for add-on [%s]: %s' % (
                  self.id, key))
+        self.invalidate_update_rdf()
+
+    def invalidate_update_rdf(self):
+        """Invalidates the cached /services/update responses.
+
+        Call this when there is an event that may change what update is
+        served for the add-on. See `services.update_cache`.
+        """
+        if not self.guid:
+            return
+        guid_hash = hashlib.md5(self.guid.encode('utf8').lower()).hexdigest()
+        cache_ns_key('update-rdf:%s' % guid_hash, increment=True)
 
     @property
     def current_version(self):
@@ -1552,7 +1680,7 @@ def version_changed(sender, **kw):
 def update_search_index(sender, instance, **kw):
     from . import tasks
     if not kw.get('raw'):
-        tasks.index_addons.delay([instance.id])
+        tasks.index_queue.add([instance.id])
 
 
 @Addon.on_change
@@ -1596,6 +1724,14 @@ def watch_disabled(old_attr={}, new_attr={}, instance=None, sender=None, **kw):
             f.hide_disabled_file()
 
 
+@Addon.on_change
+def watch_update_rdf(old_attr={}, new_attr={}, instance=None, sender=None,
+                     **kw):
+    fields = ('status', 'disabled_by_user', 'is_listed')
+    if any(old_attr.get(f) != new_attr.get(f) for f in fields):
+        instance.invalidate_update_rdf()
+
+
 @Addon.on_change
 def watch_developer_notes(old_attr={}, new_attr={}, instance=None, sender=None,
                           **kw):
@@ -1631,6 +1767,28 @@ def attach_tags(addons):
         addon_dict[addon].tag_list = [t[1] for t in tags]
 
 
+def attach_index_data(addons):
+    """
+    Attach what `addons.search.extract` needs and `Addon.transformer`
+    doesn't: the versions and authors of themes, whether they're in the
+    rereview queue, and empty author lists.
+    """
+    from editors.models import RereviewQueueTheme  # Circular import.
+    personas = dict((a.id, a) for a in addons if a.type == amo.ADDON_PERSONA)
+    if personas:
+        Addon.attach_related_versions(personas.values(), addon_dict=personas)
+        Addon.attach_listed_authors(personas.values(), addon_dict=personas)
+        rereview = set(RereviewQueueTheme.objects
+                       .filter(theme__addon__in=personas)
+                       .values_list('theme__addon', flat=True))
+        for addon in personas.values():
+            addon.has_theme_rereview = addon.id in rereview
+    for addon in addons:
+        # Add-ons without listed authors aren't given any.
+        if 'listed_authors' not in addon.__dict__:
+            addon.listed_authors = []
+
+
 class Persona(caching.CachingMixin, models.Model):
     """Personas-specific additions to the add-on model."""
     STATUS_CHOICES = amo.STATUS_CHOICES_PERSONA
@@ -1827,6 +1985,20 @@ class Persona(caching.CachingMixin, models.Model):
         return self.addon.listed_authors
 
 
+class ThemeUpdatePayload(amo.models.ModelBase):
+    """
+    The JSON served by the theme update service for a theme in a locale,
+    built by `addons.tasks.update_theme_payloads`.
+    """
+    addon = models.ForeignKey(Addon, related_name='+')
+    locale = models.CharField(max_length=10)
+    data = models.TextField()
+
+    class Meta:
+        db_table = 'theme_update_payloads'
+        unique_together = ('addon', 'locale')
+
+
 class AddonCategory(caching.CachingMixin, models.Model):
     addon = models.ForeignKey(Addon)
     category = models.ForeignKey('Category')
@@ -1872,6 +2044,46 @@ class AddonRecommendation(models.Model):
             d[addon] = dict((r['other_addon'], r['score']) for r in rows)
         return d
 
+    # The TopRecommendations of this process and when they were loaded.
+    _top = (None, 0)
+
+    @classmethod
+    def top(cls):
+        """
+        Get all the recommendations as TopRecommendations, kept in memory
+        and reloaded every `settings.RECOMMENDATIONS_TTL` seconds.
+        """
+        top, loaded = cls._top
+        if top is None or time.time() - loaded > settings.RECOMMENDATIONS_TTL:
+            cursor = connection.cursor()
+            cursor.execute('SELECT addon_id, other_addon_id, score '
+                           'FROM addon_recommendations ORDER BY addon_id')
+            top = TopRecommendations(cursor)
+            cls._top = top, time.time()
+        return top
+
+
+class AddonRecommendationChange(models.Model):
+    """
+    Add-ons whose synced collections changed since their recommendations
+    were last computed. See `addons.cron.recs_changed`.
+    """
+    addon = models.OneToOneField(Addon, primary_key=True, related_name='+')
+
+    class Meta:
+        db_table = 'addon_recommendation_changes'
+
+    @classmethod
+    def add(cls, addon_ids):
+        """Flag `addon_ids`, ignoring the add-ons already flagged."""
+        addon_ids = list(addon_ids)
+        if not addon_ids:
+            return
+        cursor = connection.cursor()
+        cursor.executemany(
+            'INSERT IGNORE INTO addon_recommendation_changes (addon_id) '
+            'VALUES (%s)', [(addon_id,) for addon_id in addon_ids])
+
 
 class AddonUser(caching.CachingMixin, models.Model):
     addon = models.ForeignKey(Addon)
@@ -2322,6 +2534,29 @@ models.signals.post_delete.connect(update_incompatible_versions,
                                    dispatch_uid='cor_update_incompatible')
 
 
+def compat_override_update_rdf(sender, instance, **kw):
+    """Overrides change the compatibility served to the add-on's updates."""
+    if kw.get('raw'):
+        return
+    if sender is CompatOverrideRange:
+        try:
+            instance = instance.compat
+        except CompatOverride.DoesNotExist:
+            # The whole override is being deleted, its own signal handles it.
+            return
+    if instance.addon_id:
+        instance.addon.invalidate_update_rdf()
+
+
+for sender in (CompatOverride, CompatOverrideRange):
+    models.signals.post_save.connect(
+        compat_override_update_rdf, sender=sender,
+        dispatch_uid='compat_override_update_rdf_%s' % sender.__name__)
+    models.signals.post_delete.connect(
+        compat_override_update_rdf, sender=sender,
+        dispatch_uid='compat_override_update_rdf_%s' % sender.__name__)
+
+
 def track_new_status(sender, instance, *args, **kw):
     if kw.get('raw'):
         # The addon is being loaded from a fixure.
@@ -6,12 +6,13 @@ from django.core.exceptions import ObjectDoesNotExist
 import amo
 import amo.search
 from amo.models import SearchMixin
-from addons.cron import reindex_addons
+from addons.cron import _ids_to_index
 from addons.models import Persona
 from bandwagon.cron import reindex_collections
 from bandwagon.models import Collection
 from compat.cron import compatibility_report
 from compat.models import AppCompat
+from lib.es.pipeline import ReindexPipeline
 from lib.es.utils import create_index
 from users.cron import reindex_users
 from users.models import UserProfile
@@ -27,8 +28,12 @@ def extract(addon):
     """Extract indexable attributes from an add-on."""
     attrs = ('id', 'slug', 'created', 'last_updated', 'weekly_downloads',
              'bayesian_rating', 'average_daily_users', 'status', 'type',
-             'hotness', 'is_disabled', 'is_listed', 'premium_type')
+             'hotness', 'is_disabled', 'is_listed', 'premium_type',
+             'average_rating', 'default_locale', 'icon_type', 'modified',
+             'total_reviews', 'ts_slowness', 'annoying', 'charity_id',
+             'paypal_id', 'wants_contributions')
     d = {attr: getattr(addon, attr) for attr in attrs}
+    d['current_version'] = addon._current_version_id
     # Coerce the Translation into a string.
     d['name_sort'] = unicode(addon.name).lower()
     translations = addon.translations
@@ -37,6 +42,14 @@ def extract(addon):
                                 in translations[addon.description_id]))
     d['summary'] = list(set(string for _, string
                             in translations[addon.summary_id]))
+    # Every translation, to build add-ons from their document without
+    # querying the database. See `Addon.from_search_result`.
+    d['name_translations'] = [{'lang': locale, 'string': string}
+                              for locale, string
+                              in translations[addon.name_id]]
+    d['summary_translations'] = [{'lang': locale, 'string': string}
+                                 for locale, string
+                                 in translations[addon.summary_id]]
     d['authors'] = [a.name for a in addon.listed_authors]
     d['device'] = getattr(addon, 'device_ids', [])
     # This is an extra query, not good for perf.
@@ -66,8 +79,18 @@ def extract(addon):
             d['weekly_downloads'] = addon.persona.popularity
             # Boost on popularity.
             d['boost'] = addon.persona.popularity ** .2
-            d['has_theme_rereview'] = (
-                addon.persona.rereviewqueuetheme_set.exists())
+            # What `Addon.from_search_result` needs for the persona's images.
+            d['persona'] = dict(
+                (field, getattr(addon.persona, field))
+                for field in ('id', 'persona_id', 'header', 'footer',
+                              'accentcolor', 'textcolor', 'author',
+                              'display_username', 'popularity', 'checksum'))
+            if hasattr(addon, 'has_theme_rereview'):
+                # Attached by `attach_index_data`.
+                d['has_theme_rereview'] = addon.has_theme_rereview
+            else:
+                d['has_theme_rereview'] = (
+                    addon.persona.rereviewqueuetheme_set.exists())
         except Persona.DoesNotExist:
             # The addon won't have a persona while it's being created.
             pass
@@ -138,6 +161,11 @@ def get_mappings():
             'platforms': {'type': 'integer', 'index_name': 'platform'},
             'appversion': {'properties': dict((app.id, appver)
                                               for app in amo.APP_USAGE)},
+            # Only stored to be read back, never searched.
+            'name_translations': {'type': 'object', 'enabled': False},
+            'summary_translations': {'type': 'object', 'enabled': False},
+            'persona': {'type': 'object', 'enabled': False},
+            'paypal_id': {'type': 'string', 'index': 'no'},
         },
     }
     # Add room for language-specific indexes.
@@ -165,9 +193,22 @@ def get_mappings():
     return dict((m._meta.db_table, mapping) for m in models)
 
 
+def reindex_addons_pipeline(index):
+    """
+    Index every add-on in `index` in waves of subtasks, resuming after the
+    add-ons already indexed if a previous run was interrupted.
+    """
+    from addons.tasks import reindex_addons_chunk  # Circular import.
+    ReindexPipeline(index, 'addons', _ids_to_index(),
+                    reindex_addons_chunk).run()
+
+
 def reindex(index):
-    indexers = [reindex_addons, reindex_collections, reindex_users,
-                compatibility_report]
+    # If indexing add-ons fails, stop there so the reindex can be resumed
+    # with `reindex --resume`.
+    log.info('Indexing addons')
+    reindex_addons_pipeline(index)
+    indexers = [reindex_collections, reindex_users, compatibility_report]
     for indexer in indexers:
         log.info('Indexing %r' % indexer.__name__)
         try:
@@ -4,8 +4,9 @@ import os
 
 from django.conf import settings
 from django.core.files.storage import default_storage as storage
-from django.db import transaction
+from django.db import connection, transaction
 
+from django_statsd.clients import statsd
 from PIL import Image
 
 import amo
@@ -15,16 +16,17 @@ from amo.celery import task
 from amo.decorators import set_modified_on, write
 from amo.helpers import user_media_path
 from amo.storage_utils import rm_stored_dir
-from amo.utils import cache_ns_key, ImageCheck, LocalFileStorage
+from amo.utils import cache_ns_key, chunked, ImageCheck, LocalFileStorage
+from lib.es.queue import IndexQueue
 from lib.es.utils import index_objects
 from versions.models import Version
 
 # pulling tasks from cron
 from . import cron  # noqa
 from . import search
-from .models import (Addon, attach_categories, attach_tags,
-                     attach_translations, CompatOverride, IncompatibleVersions,
-                     Preview)
+from .models import (Addon, attach_categories, attach_index_data,
+                     attach_tags, attach_translations, CompatOverride,
+                     IncompatibleVersions, Preview, ThemeUpdatePayload)
 
 
 log = logging.getLogger('z.task')
@@ -104,11 +106,55 @@ def delete_preview_files(id, **kw):
 @task(acks_late=True)
 def index_addons(ids, **kw):
     log.info('Indexing addons %s-%s. [%s]' % (ids[0], ids[-1], len(ids)))
-    transforms = (attach_categories, attach_tags, attach_translations)
+    transforms = (attach_categories, attach_tags, attach_translations,
+                  attach_index_data)
     index_objects(ids, Addon, search, kw.pop('index', None), transforms,
                   Addon.with_unlisted)
 
 
+@task(acks_late=True, ignore_result=False)  # Required for the reindex waves.
+def reindex_addons_chunk(ids, **kw):
+    """Index a chunk of a full reindex, see `lib.es.pipeline`."""
+    index_addons(ids, **kw)
+
+
+@task(acks_late=True)
+def flush_index_queue(**kw):
+    ids = index_queue.pop()
+    for chunk in chunked(ids, 150):
+        index_queued_addons.delay(chunk)
+
+
+@task(acks_late=True)
+def index_queued_addons(ids, **kw):
+    try:
+        with statsd.timer('es.queue.addons.flush'):
+            index_addons(ids)
+    except Exception:
+        # Index the add-ons one by one so that one failing add-on doesn't
+        # hold back the rest of the chunk.
+        log.warning('Could not index queued addons %s, indexing them one '
+                    'by one.' % ids, exc_info=True)
+        failed = []
+        for id_ in ids:
+            try:
+                index_addons([id_])
+            except Exception:
+                log.error('Could not index queued addon %s.' % id_,
+                          exc_info=True)
+                failed.append(id_)
+        # The ids are out of the queue already, put the failed ones back so
+        # that they are indexed with the next window.
+        index_queue.requeue(failed)
+        ids = [id_ for id_ in ids if id_ not in failed]
+    if ids:
+        index_queue.indexed(ids)
+
+
+# Add-ons saved by `addons.models.update_search_index` are indexed in bulk.
+index_queue = IndexQueue('addons', index_addons, flush_index_queue)
+
+
 @task
 def unindex_addons(ids, **kw):
     for addon in ids:
@@ -261,6 +307,10 @@ def update_incompatible_appversions(data, **kw):
     # Increment namespace cache of compat versions.
     for addon_id in addon_ids:
         cache_ns_key('d2c-versions:%s' % addon_id, increment=True)
+    # The update service filters on incompatible_versions, the responses
+    # cached while this ran are stale.
+    for addon in Addon.objects.filter(id__in=addon_ids):
+        addon.invalidate_update_rdf()
 
 
 def make_checksum(header_path, footer_path):
@@ -311,6 +361,7 @@ def save_theme(header, footer, addon, **kw):
     except IOError:
         addon.delete()
         raise
+    update_theme_payloads([addon.id])
 
 
 @task
@@ -375,3 +426,27 @@ def calc_checksum(theme_id, **kw):
         theme.save()
     except IOError as e:
         log.error(str(e))
+    update_theme_payloads([theme.addon_id])
+
+
+@task
+@write
+def update_theme_payloads(ids, **kw):
+    """
+    Store the JSON the theme update service serves for the themes `ids`.
+
+    The service falls back to building it on every request for themes
+    without one, see `services.theme_update`.
+    """
+    from services.theme_update import build_payloads
+
+    log.info('[%s] Updating theme update payloads.' % len(ids))
+    cursor = connection.cursor()
+    for addon_id in ids:
+        payloads = build_payloads(cursor, addon_id)
+        with transaction.atomic():
+            ThemeUpdatePayload.objects.filter(addon=addon_id).delete()
+            ThemeUpdatePayload.objects.bulk_create(
+                ThemeUpdatePayload(addon_id=addon_id, locale=locale,
+                                   data=data)
+                for locale, data in payloads.items())
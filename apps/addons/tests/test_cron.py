@@ -8,7 +8,9 @@ import mock
 import amo
 import amo.tests
 from addons import cron
-from addons.models import Addon, AppSupport
+from addons.models import (Addon, AddonRecommendation,
+                           AddonRecommendationChange, AppSupport)
+from bandwagon.models import SyncedCollection, SyncedCollectionAddon
 from django.core.management.base import CommandError
 from files.models import File
 from lib.es.utils import flag_reindexing_amo, unflag_reindexing_amo
@@ -249,6 +251,27 @@ class AvgDailyUserCountTestCase(amo.tests.TestCase):
         eq_(addon.average_daily_users, 1234)
 
 
+class TestDownloadTotals(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    @mock.patch('addons.tasks.index_queue')
+    def test_only_changed_addons(self, index_queue):
+        addon = Addon.objects.get(pk=3615)
+        # One query to get the add-ons, nothing changed so no update.
+        with self.assertNumQueries(1):
+            cron._update_addon_download_totals(
+                [(3615, addon.average_daily_downloads, addon.total_downloads),
+                 (999999, 1, 1)])
+        assert not index_queue.add.called
+
+        with self.assertNumQueries(2):
+            cron._update_addon_download_totals([(3615, 12, 34)])
+        addon = Addon.objects.get(pk=3615)
+        eq_(addon.average_daily_downloads, 12)
+        eq_(addon.total_downloads, 34)
+        index_queue.add.assert_called_once_with([3615])
+
+
 class TestCleanupImageFiles(amo.tests.TestCase):
 
     @mock.patch('addons.cron.os')
@@ -285,3 +308,47 @@ class TestCleanupImageFiles(amo.tests.TestCase):
         assert os_listdir_mock.called
         assert os_stat_mock.called
         assert os_unlink_mock.called
+
+
+class TestRecsChanged(amo.tests.TestCase):
+
+    def setUp(self):
+        self.a, self.b, self.c = [amo.tests.addon_factory() for _ in range(3)]
+        # Add-ons need to be in more than 3 collections to get recs.
+        for others in [self.b] * 4 + [self.c] * 4:
+            collection = SyncedCollection.objects.create()
+            for addon in (self.a, others):
+                SyncedCollectionAddon.objects.create(addon=addon,
+                                                     collection=collection)
+        AddonRecommendationChange.add([self.a.id, self.b.id, self.c.id])
+
+    def recs(self, addon):
+        return list(AddonRecommendation.objects.filter(addon=addon)
+                    .values_list('other_addon', flat=True))
+
+    def test_recs_changed(self):
+        cron.recs_changed()
+        eq_(sorted(self.recs(self.a)), sorted([self.b.id, self.c.id]))
+        # b and c don't share a collection.
+        eq_(self.recs(self.b), [self.a.id])
+        eq_(self.recs(self.c), [self.a.id])
+        eq_(AddonRecommendationChange.objects.count(), 0)
+
+        SyncedCollection.objects.create().set_addons([self.b.id, self.c.id])
+        eq_(sorted(AddonRecommendationChange.objects
+                   .values_list('addon', flat=True)),
+            sorted([self.b.id, self.c.id]))
+        cron.recs_changed()
+        eq_(self.recs(self.b), [self.a.id, self.c.id])
+        eq_(AddonRecommendationChange.objects.count(), 0)
+
+    @mock.patch('addons.cron._dump_recs')
+    def test_nothing_changed(self, dump_recs):
+        AddonRecommendationChange.objects.all().delete()
+        cron.recs_changed()
+        assert not dump_recs.called
+
+    def test_recs_clears_changes(self):
+        cron.recs()
+        eq_(self.recs(self.b), [self.a.id])
+        eq_(AddonRecommendationChange.objects.count(), 0)
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import itertools
 import json
 import os
@@ -9,6 +10,7 @@ from urlparse import urlparse
 from django import forms
 from django.conf import settings
 from django.core import mail
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage as storage
 from django.db import IntegrityError
@@ -500,6 +502,24 @@ class TestAddonModels(amo.tests.TestCase):
         assert a.current_version != v
         eq_(a.compatible_version(amo.FIREFOX.id), a.current_version)
 
+    def test_compatible_version_ids(self):
+        a = Addon.objects.get(pk=3615)
+        v = self._create_new_version(addon=a, status=amo.STATUS_PUBLIC)
+        lite = Addon.objects.get(pk=3615)
+        lite.id, lite.status = 0, amo.STATUS_LITE
+        for app_version in (None, '3.0', '99.0'):
+            for mode in ('strict', 'normal', 'ignore'):
+                expected = a.compatible_version(amo.FIREFOX.id, app_version,
+                                                'all', mode)
+                cache.clear()
+                # Once from the database, once from the cache.
+                for i in range(2):
+                    eq_(Addon.compatible_version_ids(
+                        [a, lite], amo.FIREFOX.id, app_version, 'all', mode),
+                        {a.id: expected and expected.id, 0: None})
+        eq_(Addon.compatible_version_ids([a], None), {a.id: None})
+        eq_(Addon.compatible_version_ids([a], amo.FIREFOX.id), {a.id: v.id})
+
     def test_transformer(self):
         addon = Addon.objects.get(pk=3615)
         # If the transformer works then we won't have any more queries.
@@ -2305,6 +2325,53 @@ class TestAddonWatchDisabled(amo.tests.TestCase):
         assert not mock.hide_disabled_file.called
 
 
+class TestAddonWatchUpdateRDF(amo.tests.TestCase):
+
+    def setUp(self):
+        super(TestAddonWatchUpdateRDF, self).setUp()
+        self.addon = Addon.objects.create(type=amo.ADDON_EXTENSION,
+                                          guid='{Watch-Update-RDF}',
+                                          status=amo.STATUS_PUBLIC)
+
+    @patch('addons.models.cache_ns_key')
+    def test_status_change(self, cache_ns_key):
+        self.addon.update(status=amo.STATUS_DISABLED)
+        cache_ns_key.assert_called_with(
+            'update-rdf:%s' % hashlib.md5('{watch-update-rdf}').hexdigest(),
+            increment=True)
+
+    @patch('addons.models.cache_ns_key')
+    def test_no_change(self, cache_ns_key):
+        self.addon.update(average_daily_users=10)
+        assert not cache_ns_key.called
+
+    @patch('addons.models.cache_ns_key')
+    def test_no_guid(self, cache_ns_key):
+        self.addon.update(guid=None)
+        self.addon.update(status=amo.STATUS_DISABLED)
+        assert not cache_ns_key.called
+
+    @patch('addons.models.cache_ns_key')
+    def test_compat_override(self, cache_ns_key):
+        key = 'update-rdf:%s' % hashlib.md5('{watch-update-rdf}').hexdigest()
+        compat = CompatOverride.objects.create(guid=self.addon.guid,
+                                               addon=self.addon)
+        cache_ns_key.assert_called_with(key, increment=True)
+
+        cache_ns_key.reset_mock()
+        compat_range = CompatOverrideRange.objects.create(compat=compat,
+                                                          app=1)
+        cache_ns_key.assert_called_with(key, increment=True)
+
+        cache_ns_key.reset_mock()
+        compat_range.delete()
+        cache_ns_key.assert_called_with(key, increment=True)
+
+        cache_ns_key.reset_mock()
+        compat.delete()
+        cache_ns_key.assert_called_with(key, increment=True)
+
+
 class TestAddonWatchDeveloperNotes(amo.tests.TestCase):
 
     def make_addon(self, **kwargs):
@@ -1,13 +1,14 @@
 from nose.tools import eq_
 
+import amo
 import amo.tests
-from addons.models import (Addon, attach_categories, attach_tags,
-                           attach_translations)
+from addons.models import (Addon, attach_categories, attach_index_data,
+                           attach_tags, attach_translations)
 from addons.search import extract
 
 
 class TestExtract(amo.tests.TestCase):
-    fixtures = ['base/users', 'base/addon_3615']
+    fixtures = ['base/users', 'base/addon_3615', 'addons/persona']
 
     def setUp(self):
         super(TestExtract, self).setUp()
@@ -27,3 +28,41 @@ class TestExtract(amo.tests.TestCase):
         extracted = self._extract()
         for attr in self.attrs:
             eq_(extracted[attr], getattr(self.addon, attr))
+
+    def test_from_search_result(self):
+        extracted = self._extract()
+        with self.assertNumQueries(0):
+            addon = Addon.from_search_result(extracted)
+            for attr in self.attrs:
+                eq_(getattr(addon, attr), getattr(self.addon, attr))
+            eq_(unicode(addon.name), unicode(self.addon.name))
+            eq_(unicode(addon.summary), unicode(self.addon.summary))
+            eq_(addon.get_icon_url(32), self.addon.get_icon_url(32))
+            eq_(addon._current_version_id, self.addon._current_version_id)
+
+    def test_from_search_result_persona(self):
+        self.addon = Addon.objects.get(id=15663)
+        extracted = extract(self.addon)
+        with self.assertNumQueries(0):
+            addon = Addon.from_search_result(extracted)
+            eq_(addon.persona.addon, addon)
+            eq_(addon.get_icon_url(32), self.addon.get_icon_url(32))
+            eq_(addon.persona.thumb_url, self.addon.persona.thumb_url)
+
+
+class TestExtractBatch(amo.tests.TestCase):
+    fixtures = ['base/users', 'base/addon_3615']
+
+    def test_no_queries_per_addon(self):
+        ids = [3615] + [amo.tests.addon_factory(type=amo.ADDON_PERSONA).id
+                        for _ in range(3)]
+        qs = Addon.objects.filter(id__in=ids)
+        for t in (attach_categories, attach_tags, attach_translations,
+                  attach_index_data):
+            qs = qs.transform(t)
+        addons = list(qs)
+        with self.assertNumQueries(0):
+            docs = [extract(addon) for addon in addons]
+        eq_(sorted(d['id'] for d in docs), sorted(ids))
+        eq_([d['has_theme_rereview'] for d in docs
+             if d['type'] == amo.ADDON_PERSONA], [False] * 3)
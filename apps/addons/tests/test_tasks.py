@@ -0,0 +1,39 @@
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from addons import tasks
+
+
+class TestFlushIndexQueue(amo.tests.TestCase):
+
+    @mock.patch('addons.tasks.index_queued_addons')
+    @mock.patch('addons.tasks.index_queue')
+    def test_chunked(self, index_queue, index_queued_addons):
+        index_queue.pop.return_value = range(1, 302)
+        tasks.flush_index_queue()
+        eq_([c[0][0] for c in index_queued_addons.delay.call_args_list],
+            [range(1, 151), range(151, 301), [301]])
+
+    @mock.patch('addons.tasks.index_addons')
+    @mock.patch('addons.tasks.index_queue')
+    def test_requeue_failed_addons(self, index_queue, index_addons):
+        def index(ids):
+            if 2 in ids:
+                raise Exception
+
+        index_addons.side_effect = index
+        tasks.index_queued_addons([1, 2, 3])
+        # The chunk, then each add-on on its own.
+        eq_([c[0][0] for c in index_addons.call_args_list],
+            [[1, 2, 3], [1], [2], [3]])
+        index_queue.requeue.assert_called_once_with([2])
+        index_queue.indexed.assert_called_once_with([1, 3])
+
+    @mock.patch('addons.tasks.index_addons')
+    @mock.patch('addons.tasks.index_queue')
+    def test_indexed_chunk(self, index_queue, index_addons):
+        tasks.index_queued_addons([1, 2])
+        index_addons.assert_called_once_with([1, 2])
+        assert not index_queue.requeue.called
+        index_queue.indexed.assert_called_once_with([1, 2])
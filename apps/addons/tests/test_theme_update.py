@@ -8,8 +8,10 @@ from django.db import connection
 import mock
 from nose.tools import eq_
 
+import amo
 import amo.tests
-from addons.models import Addon
+from addons.models import Addon, ThemeUpdatePayload
+from addons.tasks import update_theme_payloads
 from amo.helpers import user_media_path, user_media_url
 from versions.models import Version
 from services import theme_update
@@ -149,3 +151,50 @@ class TestThemeUpdate(amo.tests.TestCase):
         up.get_update()
         image_url = up.image_url('foo.png')
         assert user_media_url('addons') in image_url
+
+
+class TestThemeUpdatePayloads(TestThemeUpdate):
+
+    def setUp(self):
+        super(TestThemeUpdatePayloads, self).setUp()
+        self.addon = Addon.objects.get()
+        self.addon.summary = 'yolo'
+        self.addon._current_version = Version.objects.get()
+        self.addon.save()
+        self.addon.increment_version()
+        patcher = mock.patch.object(theme_update.settings,
+                                    'SERVICES_THEME_UPDATE_PAYLOADS', True,
+                                    create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build_payloads(self):
+        payloads = theme_update.build_payloads(connection.cursor(), 15663)
+        eq_(payloads.keys(), ['en-US'])
+        self.check_good(json.loads(payloads['en-US']))
+
+    def test_stored(self):
+        update_theme_payloads([15663])
+        eq_(ThemeUpdatePayload.objects.filter(addon=self.addon).count(), 1)
+        ThemeUpdatePayload.objects.update(data=json.dumps({'id': 'stored'}))
+        eq_(json.loads(self.get_update('en-US', 15663).get_json()),
+            {'id': 'stored'})
+        # Falls back to en-US.
+        eq_(json.loads(self.get_update('fr', 15663).get_json()),
+            {'id': 'stored'})
+
+    def test_stored_gp(self):
+        update_theme_payloads([15663])
+        data = json.loads(self.get_update('en-US', 813, 'src=gp').get_json())
+        eq_(data['id'], '813')
+        eq_(data['updateURL'],
+            settings.VAMO_URL + '/en-US/themes/update-check/813?src=gp')
+
+    def test_not_public(self):
+        update_theme_payloads([15663])
+        self.addon.update(status=amo.STATUS_REJECTED)
+        eq_(self.get_update('en-US', 15663).get_json(), None)
+
+    def test_not_stored(self):
+        self.check_good(
+            json.loads(self.get_update('en-US', 15663).get_json()))
@@ -4,6 +4,7 @@ from email import utils
 
 from django.db import connection
 
+import mock
 from nose.tools import eq_
 
 import amo
@@ -12,15 +13,21 @@ from addons.models import (Addon, CompatOverride, CompatOverrideRange,
                            IncompatibleVersions)
 from applications.models import AppVersion
 from files.models import File
-from services import update
+from services import update, update_cache, update_index
+from services import utils as services_utils
 from versions.models import ApplicationsVersions, Version
 
 
 class VersionCheckMixin(object):
+    # Answer from an in-process update index instead of running the SQL.
+    use_index = False
 
     def get(self, data):
         up = update.Update(data)
         up.cursor = connection.cursor()
+        if self.use_index:
+            up.index = update_index.UpdateIndex()
+            up.index.build(up.cursor)
         return up
 
 
@@ -899,3 +906,209 @@ class TestFirefoxHotfix(VersionCheckMixin, amo.tests.TestCase):
         up = self.get(self.data)
         rdf = up.get_rdf()
         assert rdf.find('20202020.01') > -1
+
+
+class TestDataValidateIndex(TestDataValidate):
+    use_index = True
+
+
+class TestLookupIndex(TestLookup):
+    use_index = True
+
+
+class TestDefaultToCompatIndex(TestDefaultToCompat):
+    use_index = True
+
+
+class TestResponseIndex(TestResponse):
+    use_index = True
+
+
+class TestFirefoxHotfixIndex(TestFirefoxHotfix):
+    use_index = True
+
+
+class TestUpdateIndex(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def setUp(self):
+        super(TestUpdateIndex, self).setUp()
+        self.addon = Addon.objects.get(pk=3615)
+        self.index = update_index.UpdateIndex()
+        self.cursor = connection.cursor()
+        self.index.build(self.cursor)
+
+    def test_guid_case_insensitive(self):
+        eq_(self.index.get(self.addon.guid.upper()).id, self.addon.pk)
+
+    def test_refresh_removes_addon(self):
+        Addon.objects.filter(pk=self.addon.pk).update(
+            disabled_by_user=True, modified=datetime.now() + timedelta(1))
+        self.index.refresh(self.cursor)
+        eq_(self.index.get(self.addon.guid), None)
+
+    def test_refresh_changed_guid(self):
+        old_guid = self.addon.guid
+        Addon.objects.filter(pk=self.addon.pk).update(
+            guid='new@guid', modified=datetime.now() + timedelta(1))
+        self.index.refresh(self.cursor)
+        eq_(self.index.get(old_guid), None)
+        eq_(self.index.get('new@guid').id, self.addon.pk)
+
+    def test_update_keeps_entry(self):
+        class NoDrop(dict):
+            def pop(self, *args):
+                raise AssertionError('The entry went missing.')
+            __delitem__ = pop
+
+        self.index.addons = NoDrop(self.index.addons)
+        entry = self.index.get(self.addon.guid)._replace(
+            status=amo.STATUS_DISABLED)
+        self.index.update(self.addon.pk, entry)
+        eq_(self.index.get(self.addon.guid), entry)
+
+    def test_refresh_picks_up_files(self):
+        version = self.addon.current_version
+        File.objects.filter(version=version).update(
+            status=amo.STATUS_DISABLED, modified=datetime.now() + timedelta(1))
+        eq_(len(self.index.get(self.addon.guid).candidates), 1)
+        self.index.refresh(self.cursor)
+        eq_(len(self.index.get(self.addon.guid).candidates), 0)
+
+
+class TestBatchUpdate(amo.tests.TestCase):
+    fixtures = ['base/addon_3615', 'base/seamonkey']
+
+    def setUp(self):
+        super(TestBatchUpdate, self).setUp()
+        self.addon = Addon.objects.get(pk=3615)
+        self.query = [
+            ('reqVersion', '1'),
+            ('appID', '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}'),
+            ('appVersion', '3.7a1pre'),
+            ('id', self.addon.guid), ('version', '2.0.58'),
+            ('id', 'garbage'), ('version', '1.0'),
+        ]
+
+    def get(self, query):
+        up = update.BatchUpdate(query)
+        up.cursor = connection.cursor()
+        return up
+
+    def test_updates(self):
+        up = self.get(self.query)
+        rdf = up.get_rdf()
+        eq_(rdf.count('<em:updateLink>'), 1)
+        assert ('urn:mozilla:extension:%s:2.1.072' % self.addon.guid) in rdf
+        assert 'garbage' not in rdf
+        eq_(up.updates[0].data['row']['file_id'], 67442)
+
+    def test_no_updates(self):
+        self.query[2] = ('appVersion', '1.4')
+        up = self.get(self.query)
+        rdf = up.get_rdf()
+        assert '<em:updateLink>' not in rdf
+        assert ('urn:mozilla:extension:%s"' % self.addon.guid) in rdf
+
+    def test_bad_guids(self):
+        query = self.query[:3] + [('id', 'foo'), ('id', 'bar')]
+        up = self.get(query)
+        eq_(up.get_rdf(), up.get_bad_rdf())
+
+    def test_max_addons(self):
+        query = self.query[:3] + [('id', 'foo')] * 200
+        eq_(len(update.BatchUpdate(query).updates),
+            update.BatchUpdate.max_addons)
+
+
+class FakeMemcache(dict):
+
+    def get_multi(self, keys):
+        return dict((k, self[k]) for k in keys if k in self)
+
+    def set(self, key, value, timeout=0):
+        self[key] = value
+
+
+class TestUpdateCache(amo.tests.TestCase):
+
+    def setUp(self):
+        super(TestUpdateCache, self).setUp()
+        self.cache = update_cache.UpdateCache()
+        self.cache.client = FakeMemcache()
+        self.data = {
+            'id': '{2fa4ed95-0317-4c6a-a74c-5f3e3912c1f9}',
+            'version': '2.0.58',
+            'reqVersion': 1,
+            'appID': '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+            'appVersion': '3.7a1pre',
+        }
+
+    def test_miss(self):
+        eq_(self.cache.get(self.data, 'strict'), (None, None))
+
+    def test_set_get(self):
+        self.cache.set(self.data, 'strict', 'rdf', None)
+        eq_(self.cache.get(self.data, 'strict'), ('rdf', None))
+        eq_(self.cache.get(self.data, 'normal'), (None, None))
+
+    def test_memcache_hit(self):
+        self.cache.set(self.data, 'strict', 'rdf', None)
+        self.cache.local = update_cache.LRUCache(10, 60)
+        eq_(self.cache.get(self.data, 'strict'), ('rdf', None))
+
+    def test_invalidated(self):
+        self.cache.set(self.data, 'strict', 'rdf', 1)
+        self.cache.local = update_cache.LRUCache(10, 60)
+        self.cache.client[update_cache.ns_key(self.data['id'])] = 2
+        eq_(self.cache.get(self.data, 'strict'), (None, 2))
+
+    def test_key_normalized(self):
+        key = self.cache.key(self.data, 'strict')
+        eq_(self.cache.key(dict(self.data, reqVersion=2), 'strict'), key)
+        eq_(self.cache.key(dict(self.data, id=self.data['id'].upper()),
+                           'strict'), key)
+        eq_(self.cache.key(self.data, 'garbage'), key)
+        assert self.cache.key(dict(self.data, appVersion='4.0'),
+                              'strict') != key
+
+    def test_key_app_os(self):
+        linux = dict(self.data, appOS='x86_64 Linux')
+        eq_(self.cache.key(linux, 'strict'),
+            self.cache.key(dict(self.data, appOS='Linux'), 'strict'))
+        assert self.cache.key(linux, 'strict') != self.cache.key(
+            self.data, 'strict')
+
+    def test_lru(self):
+        lru = update_cache.LRUCache(2, 60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        eq_(lru.get('a'), 1)
+        eq_(lru.get('b'), None)
+        eq_(lru.get('c'), 3)
+
+    def test_lru_expires(self):
+        lru = update_cache.LRUCache(2, -1)
+        lru.set('a', 1)
+        eq_(lru.get('a'), None)
+
+
+class TestGetConn(amo.tests.TestCase):
+
+    @mock.patch('services.utils.mysql')
+    def test_mysqldb(self, mysql):
+        services_utils.getconn()
+        assert mysql.connect.called
+
+    @mock.patch('services.utils.mysql')
+    def test_pymysql(self, mysql):
+        pymysql = mock.Mock()
+        with mock.patch.object(services_utils.settings,
+                               'SERVICES_DATABASE_DRIVER', 'pymysql',
+                               create=True):
+            with mock.patch.dict('sys.modules', pymysql=pymysql):
+                services_utils.getconn()
+        assert pymysql.connect.called
+        assert not mysql.connect.called
@@ -325,6 +325,14 @@ class SearchMixin(object):
     def search(cls, index=None):
         return search.ES(cls, index or cls._get_index())
 
+    @classmethod
+    def from_search_result(cls, source):
+        """
+        Build an object from its document `source`, without querying the
+        database. Used by `ES.source_objects()`.
+        """
+        raise NotImplementedError
+
     @classmethod
     def get_mapping_type(cls):
         return cls._meta.db_table
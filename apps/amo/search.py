@@ -1,3 +1,4 @@
+import functools
 import logging
 
 from django.conf import settings as dj_settings
@@ -33,7 +34,8 @@ class ES(object):
         self.steps = []
         self.start = 0
         self.stop = None
-        self.as_list = self.as_dict = False
+        self.as_list = self.as_dict = self.as_source = False
+        self.source_transforms = ()
         self._results_cache = None
 
     def _clone(self, next_step=None):
@@ -63,12 +65,24 @@ class ES(object):
     def facet(self, **kw):
         return self._clone(next_step=('facet', kw.items()))
 
+    def aggregate(self, **kw):
+        return self._clone(next_step=('aggregate', kw.items()))
+
     def source(self, *fields):
         return self._clone(next_step=('source', fields))
 
+    def source_objects(self, *transforms):
+        """
+        Return objects built from the documents instead of fetched from the
+        database, see `SearchMixin.from_search_result`. Each of `transforms`
+        is then called with the list of objects, like queryset transforms.
+        """
+        return self._clone(next_step=('source_objects', transforms))
+
     def extra(self, **kw):
         new = self._clone()
-        actions = 'values values_dict order_by query filter facet'.split()
+        actions = ('values values_dict order_by query filter facet '
+                   'aggregate').split()
         for key, vals in kw.items():
             assert key in actions
             if hasattr(vals, 'items'):
@@ -103,7 +117,9 @@ class ES(object):
         fields = ['id']
         source = []
         facets = {}
-        as_list = as_dict = False
+        aggregations = {}
+        as_list = as_dict = as_source = False
+        source_transforms = ()
         for action, value in self.steps:
             if action == 'order_by':
                 for key in value:
@@ -126,8 +142,15 @@ class ES(object):
                 filters.extend(self._process_filters(value))
             elif action == 'source':
                 source.extend(value)
+            elif action == 'source_objects':
+                # Without `fields`, the whole documents are returned.
+                fields = []
+                as_list, as_dict, as_source = False, False, True
+                source_transforms = value
             elif action == 'facet':
                 facets.update(value)
+            elif action == 'aggregate':
+                aggregations.update(value)
             else:
                 raise NotImplementedError(action)
 
@@ -164,6 +187,8 @@ class ES(object):
             body['size'] = self.stop - self.start
         if facets:
             body['facets'] = facets
+        if aggregations:
+            body['aggs'] = aggregations
 
         if fields:
             body['fields'] = fields
@@ -173,6 +198,7 @@ class ES(object):
             body['_source'] = source
 
         self.fields, self.as_list, self.as_dict = fields, as_list, as_dict
+        self.as_source, self.source_transforms = as_source, source_transforms
         return body
 
     def _split(self, string):
@@ -227,6 +253,10 @@ class ES(object):
                 ResultClass = DictSearchResults
             elif self.as_list:
                 ResultClass = ListSearchResults
+            elif self.as_source:
+                ResultClass = functools.partial(
+                    SourceObjectSearchResults,
+                    transforms=self.source_transforms)
             else:
                 ResultClass = ObjectSearchResults
             self._results_cache = ResultClass(self.type, hits, self.fields)
@@ -255,6 +285,9 @@ class ES(object):
     def raw_facets(self):
         return self._do_search().results.get('facets', {})
 
+    def raw_aggregations(self):
+        return self._do_search().results.get('aggregations', {})
+
     @property
     def facets(self):
         facets = {}
@@ -338,3 +371,16 @@ class ObjectSearchResults(SearchResults):
     def __iter__(self):
         objs = dict((obj.id, obj) for obj in self.objects)
         return (objs[id] for id in self.ids if id in objs)
+
+
+class SourceObjectSearchResults(SearchResults):
+
+    def __init__(self, type, results, fields, transforms=()):
+        self.transforms = transforms
+        super(SourceObjectSearchResults, self).__init__(type, results, fields)
+
+    def set_objects(self, hits):
+        self.objects = [self.type.from_search_result(hit['_source'])
+                        for hit in hits]
+        for transform in self.transforms:
+            transform(self.objects)
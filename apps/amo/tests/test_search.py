@@ -309,6 +309,22 @@ class TestES(amo.tests.ESTestCaseWithAddons):
         qs = Addon.search().filter(id=addon.id)
         eq_(addon, qs[0])
 
+    def test_source_objects_result(self):
+        addon = self._addons[0]
+        qs = Addon.search().filter(id=addon.id).source_objects()
+        with self.assertNumQueries(0):
+            result = qs[0]
+            eq_(result.id, addon.id)
+            eq_(result.slug, addon.slug)
+            eq_(unicode(result.name), unicode(addon.name))
+
+    def test_source_objects_transforms(self):
+        addon = self._addons[0]
+        transform = mock.Mock()
+        result = list(Addon.search().filter(id=addon.id)
+                      .source_objects(transform))
+        transform.assert_called_once_with(result)
+
     def test_extra_bad_key(self):
         with self.assertRaises(AssertionError):
             Addon.search().extra(x=1)
@@ -390,10 +406,20 @@ class TestES(amo.tests.ESTestCaseWithAddons):
             [{'term': {'app': 1}}])
         eq_(qs._build_query()['facets'], {'by_status': facet})
 
+    def test_aggregate(self):
+        agg = {'date_histogram': {'field': 'date', 'interval': 'week'}}
+        qs = Addon.search().aggregate(weeks=dict(agg))
+        eq_(qs._build_query()['aggs'], {'weeks': agg})
+
     def test_source(self):
         qs = Addon.search().source('versions')
         eq_(qs._build_query()['_source'], ['versions'])
 
+    def test_source_objects(self):
+        qs = Addon.search().values_dict('name').source_objects()
+        assert 'fields' not in qs._build_query()
+        assert qs.as_source
+
 
 class TestPaginator(amo.tests.ESTestCaseWithAddons):
 
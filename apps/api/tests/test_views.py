@@ -900,6 +900,18 @@ class TestGuidSearch(TestCase):
         eq_(set(['3615']),
             set([a.attrib['id'] for a in pq(r.content)('addon')]))
 
+    def test_single_fetch(self):
+        with patch('api.views.Addon.objects.filter',
+                   wraps=Addon.objects.filter) as filter_:
+            r = make_call(self.good + ',unknown@guid')
+            eq_(filter_.call_count, 1)
+            eq_(set(['3615', '6113']),
+                set([a.attrib['id'] for a in pq(r.content)('addon')]))
+
+            # Everything is cached now, including the unknown guid.
+            make_call(self.good + ',unknown@guid')
+            eq_(filter_.call_count, 1)
+
     def test_empty(self):
         """
         Bug: https://bugzilla.mozilla.org/show_bug.cgi?id=607044
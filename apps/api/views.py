@@ -38,6 +38,7 @@ from perf.models import (Performance, PerformanceAppVersions,
 from search.views import (AddonSuggestionsAjax, PersonaSuggestionsAjax,
                           name_query)
 from versions.compare import version_int
+from versions.models import Version
 
 
 ERROR = 'error'
@@ -78,6 +79,27 @@ def render_xml_to_string(request, template, context={}):
     return template.render(context)
 
 
+def render_xml_to_strings(request, template, contexts):
+    """
+    Render `template` for every context of the `contexts` dict, returning a
+    dict of the rendered strings by the same keys. The template and the
+    context processors are only loaded once.
+    """
+    if not jingo._helpers_loaded:
+        jingo.load_helpers()
+
+    processed = {}
+    for processor in get_standard_processors():
+        processed.update(processor(request))
+
+    template = xml_env.get_template(template)
+    rendered = {}
+    for key, context in contexts.items():
+        context = dict(context, **processed)
+        rendered[key] = template.render(context)
+    return rendered
+
+
 def render_xml(request, template, context={}, **kwargs):
     """Safely renders xml, stripping out nasty control characters."""
     rendered = render_xml_to_string(request, template, context)
@@ -164,6 +186,11 @@ def addon_filter(addons, addon_type, limit, app, platform, version,
             return app.min.version_int <= vint
 
         xs = [(a, a.compatible_apps) for a in addons]
+        if compat_mode == 'normal':
+            # This handles the cases for strict opt-in, binary components,
+            # and compat overrides, for all the add-ons at once. It's cached.
+            compatible = Addon.compatible_version_ids(
+                addons, APP.id, version, platform, compat_mode)
 
         # Iterate over addons, checking compatibility depending on compat_mode.
         addons = []
@@ -176,11 +203,7 @@ def addon_filter(addons, addon_type, limit, app, platform, version,
                 if app and f_ignore(app):
                     addons.append(addon)
             elif compat_mode == 'normal':
-                # This does a db hit but it's cached. This handles the cases
-                # for strict opt-in, binary components, and compat overrides.
-                v = addon.compatible_version(APP.id, version, platform,
-                                             compat_mode)
-                if v:  # There's a compatible version.
+                if compatible.get(addon.id):  # There's a compatible version.
                     addons.append(addon)
 
     # Put personas back in.
@@ -290,29 +313,28 @@ def guid_search(request, api_version, guids):
     guids = [g.strip() for g in guids.split(',')] if guids else []
 
     addons_xml = cache.get_many([guid_search_cache_key(g) for g in guids])
-    dirty_keys = set()
-
-    for g in guids:
-        key = guid_search_cache_key(g)
-        if key not in addons_xml:
-            dirty_keys.add(key)
-            try:
-                addon = Addon.objects.get(guid=g, disabled_by_user=False,
-                                          status__in=SEARCHABLE_STATUSES)
-
-            except Addon.DoesNotExist:
-                addons_xml[key] = ''
-
+    missing = dict((guid_search_cache_key(g), g) for g in guids
+                   if guid_search_cache_key(g) not in addons_xml)
+
+    if missing:
+        # Fetch all the missing add-ons at once, so the transforms run once.
+        # Guids are compared case insensitively by MySQL.
+        addons = Addon.objects.filter(guid__in=set(missing.values()),
+                                      disabled_by_user=False,
+                                      status__in=SEARCHABLE_STATUSES)
+        addons = dict((addon.guid.lower(), addon) for addon in addons)
+        contexts = {}
+        for key, guid in missing.items():
+            addon = addons.get(guid.lower())
+            if addon:
+                contexts[key] = {'addon': addon, 'api_version': api_version,
+                                 'api': api}
             else:
-                addon_xml = render_xml_to_string(request,
-                                                 'api/includes/addon.xml',
-                                                 {'addon': addon,
-                                                  'api_version': api_version,
-                                                  'api': api})
-                addons_xml[key] = addon_xml
-
-    cache.set_many(dict((k, v) for k, v in addons_xml.iteritems()
-                        if k in dirty_keys))
+                # Unknown guids are cached too, so they don't hit the db.
+                addons_xml[key] = ''
+        addons_xml.update(render_xml_to_strings(
+            request, 'api/includes/addon.xml', contexts))
+        cache.set_many(dict((k, addons_xml[k]) for k in missing))
 
     compat = (CompatOverride.objects.filter(guid__in=guids)
               .transform(CompatOverride.transformer))
@@ -376,12 +398,15 @@ class SearchView(APIView):
         qs = qs[:limit]
         total = qs.count()
 
+        addons = list(qs)
+        version_ids = Addon.compatible_version_ids(
+            addons, app_id, params['version'], params['platform'],
+            compat_mode)
+        versions = Version.objects.in_bulk(filter(None, version_ids.values()))
+
         results = []
-        for addon in qs:
-            compat_version = addon.compatible_version(app_id,
-                                                      params['version'],
-                                                      params['platform'],
-                                                      compat_mode)
+        for addon in addons:
+            compat_version = versions.get(version_ids[addon.id])
             # Specific case for Personas (bug 990768): if we search providing
             # the Persona addon type (9), then don't look for a compatible
             # version.
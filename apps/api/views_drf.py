@@ -211,12 +211,15 @@ class SearchView(DRFView):
         qs = qs[:limit]
         total = qs.count()
 
+        addons = list(qs)
+        version_ids = Addon.compatible_version_ids(
+            addons, app_id, params['version'], params['platform'],
+            compat_mode)
+        versions = Version.objects.in_bulk(filter(None, version_ids.values()))
+
         results = []
-        for addon in qs:
-            compat_version = addon.compatible_version(app_id,
-                                                      params['version'],
-                                                      params['platform'],
-                                                      compat_mode)
+        for addon in addons:
+            compat_version = versions.get(version_ids[addon.id])
             # Specific case for Personas (bug 990768): if we search providing
             # the Persona addon type (9), then don't look for a compatible
             # version.
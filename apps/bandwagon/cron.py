@@ -10,8 +10,9 @@ from celery.task.sets import TaskSet
 import amo
 from amo.celery import task
 from amo.utils import chunked, slugify
+from addons.models import AddonRecommendationChange
 from bandwagon.models import (Collection, SyncedCollection, CollectionVote,
-                              CollectionWatcher)
+                              CollectionWatcher, SyncedCollectionAddon)
 import cronjobs
 
 task_log = commonware.log.getLogger('z.task')
@@ -120,6 +121,9 @@ def _cleanup_synced_collections(**kw):
            .values_list('id', flat=True))[:300]
 
     for chunk in chunked(ids, 100):
+        AddonRecommendationChange.add(set(
+            SyncedCollectionAddon.objects.filter(collection__in=chunk)
+            .values_list('addon', flat=True)))
         SyncedCollection.objects.filter(id__in=chunk).delete()
 
     if ids:
@@ -158,3 +162,9 @@ def reindex_collections(index=None):
                                                kwargs=dict(index=index))
                for chunk in chunked(sorted(list(ids)), 150)]
     TaskSet(taskset).apply_async()
+
+
+@cronjobs.register
+def flush_synced_collection_counts():
+    """Save the synced collection counts buffered by the discovery pane."""
+    SyncedCollection.flush_counts()
@@ -1,5 +1,6 @@
 import collections
 import hashlib
+import itertools
 import os
 import re
 import time
@@ -8,18 +9,23 @@ from datetime import datetime
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db import connection, models, transaction
+from django.db import connection, IntegrityError, models, transaction
+from django.db.models import F
 
 import caching.base as caching
+import commonware.log
+import redisutils
+import waffle
 
 import amo
 import amo.models
 import sharing.utils as sharing
 from access import acl
-from addons.models import Addon, AddonRecommendation
+from addons.models import (Addon, AddonRecommendation,
+                           AddonRecommendationChange)
 from amo.helpers import absolutify, user_media_path, user_media_url
 from amo.urlresolvers import reverse
-from amo.utils import sorted_groupby
+from amo.utils import chunked, sorted_groupby
 from stats.models import CollectionShareCountTotal
 from translations.fields import (LinkifiedField, save_signal,
                                  NoLinksNoMarkupField, TranslatedField)
@@ -28,6 +34,8 @@ from versions import compare
 
 SPECIAL_SLUGS = amo.COLLECTION_SPECIAL_SLUGS
 
+log = commonware.log.getLogger('z.collections')
+
 
 class TopTags(object):
     """Descriptor to manage a collection's top tags in cache."""
@@ -556,12 +564,97 @@ class SyncedCollection(CollectionBase, amo.models.ModelBase):
     count = models.IntegerField("Number of users with this collection.",
                                 default=0)
 
+    # Redis keys of the buffered counts, see `buffer_count`.
+    BUFFER_BUCKETS = 'synced-collections:buckets'
+    BUFFER_COUNTS = 'synced-collections:counts:%s'
+    BUFFER_ADDONS = 'synced-collections:addons:%s'
+
     class Meta:
         db_table = 'synced_collections'
 
     def save(self, **kw):
         return super(SyncedCollection, self).save(**kw)
 
+    @classmethod
+    def buffer_count(cls, addon_index, delta, addon_ids=None):
+        """
+        Add `delta` to the count of the collection `addon_index` later.
+
+        Counts are summed in redis, in a hash per minute, and written to the
+        database by `flush_counts`. `addon_ids` are needed to create the
+        collection if it doesn't exist yet.
+        """
+        redis = redisutils.connections['master']
+        bucket = int(time.time() / 60)
+        redis.sadd(cls.BUFFER_BUCKETS, bucket)
+        redis.hincrby(cls.BUFFER_COUNTS % bucket, addon_index, delta)
+        if addon_ids is not None:
+            redis.hsetnx(cls.BUFFER_ADDONS % bucket, addon_index,
+                         ','.join(map(str, addon_ids)))
+
+    @classmethod
+    def flush_counts(cls):
+        """
+        Save the counts buffered by `buffer_count` before last minute.
+
+        Each bucket is read and deleted in one transaction before it's saved,
+        so a flush running at the same time gets an empty bucket, and counts
+        buffered late go to a new bucket. A bucket that fails to save isn't
+        saved again, it's logged instead: its counts may be partly saved.
+        """
+        redis = redisutils.connections['master']
+        # Leave a minute for the servers still writing to the last bucket.
+        last = int(time.time() / 60) - 1
+        for bucket in sorted(map(int, redis.smembers(cls.BUFFER_BUCKETS))):
+            if bucket >= last:
+                continue
+            pipe = redis.pipeline()
+            pipe.srem(cls.BUFFER_BUCKETS, bucket)
+            pipe.hgetall(cls.BUFFER_COUNTS % bucket)
+            pipe.hgetall(cls.BUFFER_ADDONS % bucket)
+            pipe.delete(cls.BUFFER_COUNTS % bucket,
+                        cls.BUFFER_ADDONS % bucket)
+            _, counts, addons, _ = pipe.execute()
+            counts = dict((index, int(delta))
+                          for index, delta in counts.items())
+            try:
+                cls.save_counts(counts, addons)
+            except Exception:
+                log.error(u'Could not save the synced collection counts of '
+                          u'bucket %s: %s' % (bucket, counts), exc_info=True)
+
+    @classmethod
+    def save_counts(cls, counts, addons):
+        """
+        Add the {addon_index: delta} `counts` to the collections, creating
+        the missing ones from `addons`, {addon_index: 'id,id,...'}.
+        """
+        existing = set()
+        for chunk in chunked(counts.keys(), 1000):
+            existing.update(cls.objects.filter(addon_index__in=chunk)
+                            .values_list('addon_index', flat=True))
+
+        for index in set(counts) - existing:
+            if counts[index] <= 0 or index not in addons:
+                continue
+            try:
+                c = cls.objects.create(addon_index=index, count=counts[index])
+            except IntegrityError:
+                # Created since we looked.
+                existing.add(index)
+                continue
+            addon_ids = [int(id_) for id_ in addons[index].split(',') if id_]
+            c.set_addons(addon_ids)
+
+        # One query per distinct delta, most of them are small.
+        deltas = sorted((counts[index], index) for index in existing)
+        for delta, group in itertools.groupby(deltas, lambda x: x[0]):
+            if not delta:
+                continue
+            for chunk in chunked([index for _, index in group], 1000):
+                (cls.objects.filter(addon_index__in=chunk)
+                 .update(count=F('count') + delta))
+
     def set_addons(self, addon_ids):
         # SyncedCollections are only written once so we don't need to deal with
         # updates or deletes.
@@ -569,6 +662,8 @@ class SyncedCollection(CollectionBase, amo.models.ModelBase):
             SyncedCollectionAddon(addon_id=addon_id, collection_id=self.pk)
             for addon_id in addon_ids]
         SyncedCollectionAddon.objects.bulk_create(relations)
+        # Their recommendations are based on synced collections.
+        AddonRecommendationChange.add(addon_ids)
         if not self.addon_index:
             self.addon_index = self.make_index(addon_ids)
             self.save()
@@ -596,13 +691,23 @@ class RecommendedCollection(Collection):
     @classmethod
     def build_recs(cls, addon_ids):
         """Get the top ranking add-ons according to recommendation scores."""
-        scores = AddonRecommendation.scores(addon_ids)
-        d = collections.defaultdict(int)
-        for others in scores.values():
-            for addon, score in others.items():
-                d[addon] += score
+        key = 'recs:%s' % cls.make_index(addon_ids)
+        recs = cache.get(key)
+        if recs is not None:
+            return recs
+
+        if waffle.switch_is_active('recommendations-in-memory'):
+            d = AddonRecommendation.top().accumulate(addon_ids)
+        else:
+            scores = AddonRecommendation.scores(addon_ids)
+            d = collections.defaultdict(int)
+            for others in scores.values():
+                for addon, score in others.items():
+                    d[addon] += score
         addons = sorted(d.items(), key=lambda x: x[1], reverse=True)
-        return [addon for addon, score in addons if addon not in addon_ids]
+        recs = [addon for addon, score in addons if addon not in addon_ids]
+        cache.set(key, recs, settings.RECOMMENDATIONS_CACHE_TIMEOUT)
+        return recs
 
 
 class FeaturedCollection(amo.models.ModelBase):
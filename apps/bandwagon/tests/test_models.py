@@ -219,7 +219,7 @@ class TestRecommendations(amo.tests.TestCase):
     ids = [5299, 1843, 2464, 7661, 5369]
 
     @classmethod
-    def expected_recs(self):
+    def expected_scores(self):
         scores, ranked = [], {}
         # Get all the add-on => rank pairs.
         for x in AddonRecommendation.scores(self.ids).values():
@@ -228,12 +228,36 @@ class TestRecommendations(amo.tests.TestCase):
         groups = itertools.groupby(sorted(scores), key=lambda x: x[0])
         for addon, pairs in groups:
             ranked[addon] = sum(x[1] for x in pairs)
+        return ranked
+
+    @classmethod
+    def expected_recs(self):
+        ranked = self.expected_scores()
         addons = sorted(ranked.items(), key=lambda x: x[1], reverse=True)
         return [x[0] for x in addons if x[0] not in self.ids]
 
     def test_build_recs(self):
         eq_(RecommendedCollection.build_recs(self.ids), self.expected_recs())
 
+    @mock.patch('waffle.switch_is_active', lambda name: True)
+    @mock.patch.object(AddonRecommendation, '_top', (None, 0))
+    def test_build_recs_in_memory(self):
+        recs = RecommendedCollection.build_recs(self.ids)
+        expected = self.expected_recs()
+        eq_(sorted(recs), sorted(expected))
+        # Scores are 32 bit floats in memory, only near ties can be swapped.
+        scores = self.expected_scores()
+        for better, worse in itertools.combinations(expected, 2):
+            if scores[better] - scores[worse] > 1e-6 * scores[better]:
+                assert recs.index(better) < recs.index(worse), (better, worse)
+
+    @mock.patch('bandwagon.models.AddonRecommendation.scores')
+    def test_build_recs_cached(self, scores):
+        scores.return_value = {7: {1: 5, 2: 3}}
+        eq_(RecommendedCollection.build_recs([7]), [1, 2])
+        eq_(RecommendedCollection.build_recs([7]), [1, 2])
+        eq_(scores.call_count, 1)
+
     @mock.patch('bandwagon.models.AddonRecommendation.scores')
     def test_no_dups(self, scores):
         # The inner dict is the recommended addons for addon 7.
@@ -254,9 +278,72 @@ class TestSyncedCollection(amo.tests.TestCase):
         assert tuple(
             synced_collection.addons.values_list('id', flat=True)) == self.ids
 
+    def test_save_counts(self):
+        existing = SyncedCollection.objects.create(addon_index='a', count=3)
+        SyncedCollection.save_counts({'a': 2, 'b': 1, 'c': 4},
+                                     {'b': '5299,1843'})
+        eq_(existing.reload().count, 5)
+        new = SyncedCollection.objects.get(addon_index='b')
+        eq_(new.count, 1)
+        eq_(sorted(new.addons.values_list('id', flat=True)), [1843, 5299])
+        # We don't know the add-ons of 'c'.
+        assert not SyncedCollection.objects.filter(addon_index='c').exists()
+
     def test_set_addons_empty_list(self):
         """This is really to make sure it doesn't blow up: see bug 1197471."""
         synced_collection = SyncedCollection.objects.create()
         synced_collection.set_addons([])
         synced_collection.reload()
         assert synced_collection.addons.count() == 0
+
+
+@mock.patch('bandwagon.models.time')
+class TestSyncedCollectionBuffer(amo.tests.RedisTest, amo.tests.TestCase):
+    fixtures = ['base/addon-recs']
+
+    def test_flush_counts(self, time_):
+        time_.time.return_value = 600
+        SyncedCollection.buffer_count('a', 1, [5299, 1843])
+        SyncedCollection.buffer_count('a', 1, [5299, 1843])
+        existing = SyncedCollection.objects.create(addon_index='b', count=3)
+        SyncedCollection.buffer_count('b', -1)
+
+        # The bucket is left alone for a minute.
+        time_.time.return_value = 660
+        SyncedCollection.flush_counts()
+        assert not SyncedCollection.objects.filter(addon_index='a').exists()
+        eq_(existing.reload().count, 3)
+
+        time_.time.return_value = 720
+        SyncedCollection.flush_counts()
+        new = SyncedCollection.objects.get(addon_index='a')
+        eq_(new.count, 2)
+        eq_(sorted(new.addons.values_list('id', flat=True)), [1843, 5299])
+        eq_(existing.reload().count, 2)
+
+        # The bucket is gone, it isn't counted twice.
+        SyncedCollection.flush_counts()
+        eq_(new.reload().count, 2)
+
+    def test_flush_late_counts(self, time_):
+        time_.time.return_value = 600
+        SyncedCollection.buffer_count('a', 1, [5299])
+        time_.time.return_value = 720
+        SyncedCollection.flush_counts()
+        # A server buffering late writes to the flushed bucket again.
+        time_.time.return_value = 600
+        SyncedCollection.buffer_count('a', 1, [5299])
+        time_.time.return_value = 720
+        SyncedCollection.flush_counts()
+        eq_(SyncedCollection.objects.get(addon_index='a').count, 2)
+
+    @mock.patch.object(SyncedCollection, 'save_counts')
+    def test_flush_failure(self, save_counts, time_):
+        save_counts.side_effect = Exception
+        time_.time.return_value = 600
+        SyncedCollection.buffer_count('a', 1, [5299])
+        time_.time.return_value = 720
+        SyncedCollection.flush_counts()
+        # The counts may be partly saved, they aren't saved again.
+        SyncedCollection.flush_counts()
+        eq_(save_counts.call_count, 1)
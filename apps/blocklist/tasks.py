@@ -0,0 +1,22 @@
+import commonware.log
+
+import amo
+from amo.celery import task
+
+from .views import get_artifact
+
+
+log = commonware.log.getLogger('z.task')
+
+
+@task
+def generate_blocklists(**kw):
+    """
+    Build the blocklists of every application for API versions >= 3, that
+    don't depend on the application version, so they are ready before the
+    clients ask for them. Blocklists already built since the last change
+    are skipped.
+    """
+    log.info('Building the blocklists.')
+    for guid in amo.APP_GUIDS:
+        get_artifact(3, guid, None)
@@ -11,6 +11,7 @@ from nose.tools import eq_, ok_
 import amo
 import amo.tests
 from amo.urlresolvers import reverse
+from blocklist import views
 from blocklist.models import (BlocklistApp, BlocklistCA, BlocklistDetail,
                               BlocklistGfx, BlocklistItem, BlocklistIssuerCert,
                               BlocklistPlugin, BlocklistPref)
@@ -160,6 +161,33 @@ class BlocklistItemTest(XMLAssertsMixin, BlocklistViewTest):
         # We ignore trailing url parameters.
         eq_(self.client.get(self.fx4_url + 'other/junk/').status_code, 200)
 
+    def test_not_modified(self):
+        r = self.client.get(self.fx4_url)
+        etag, last_modified = r['ETag'], r['Last-Modified']
+        eq_(self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH=etag)
+            .status_code, 304)
+        eq_(self.client.get(self.fx4_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            .status_code, 304)
+
+        # Any change gives a new blocklist.
+        self.item.update(name='changed')
+        r = self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH=etag)
+        eq_(r.status_code, 200)
+        assert r['ETag'] != etag
+
+    def test_gzip(self):
+        r = self.client.get(self.fx4_url, HTTP_ACCEPT_ENCODING='gzip')
+        eq_(r['Content-Encoding'], 'gzip')
+        eq_(views.gunzip(r.content), self.client.get(self.fx4_url).content)
+
+    def test_variants(self):
+        # API versions >= 3 share a blocklist that doesn't depend on the app
+        # version.
+        eq_(views.variant(4, amo.FIREFOX.guid, '4.0'),
+            (3, amo.FIREFOX.guid, None))
+        eq_(views.variant(1, amo.FIREFOX.guid, '4.0'),
+            (2, amo.FIREFOX.guid, '4.0'))
+
     def test_app_guid(self):
         # There's one item for Firefox.
         r = self.client.get(self.fx4_url)
@@ -1,15 +1,22 @@
 import base64
 import collections
 import hashlib
+import StringIO
 from datetime import datetime
+from gzip import GzipFile
 from operator import attrgetter
 import time
 
+from django import http
+from django.conf import settings
 from django.core.cache import cache
 from django.db.models import Q, signals as db_signals
 from django.shortcuts import get_object_or_404, render
-from django.utils.cache import patch_cache_control
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.encoding import smart_str
+from django.utils.http import http_date, parse_http_date_safe
+
+import jingo
 
 from amo.utils import sorted_groupby
 from amo.tasks import flush_front_end_cache_urls
@@ -23,21 +30,78 @@ BlItem = collections.namedtuple('BlItem', 'rows os modified block_id prefs')
 
 
 def blocklist(request, apiver, app, appver):
-    key = 'blocklist:%s:%s:%s' % (apiver, app, appver)
+    apiver, app, appver = variant(int(apiver), app, appver)
+    last_modified, data = get_artifact(apiver, app, appver)
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    if if_none_match:
+        not_modified = etag in [e.strip() for e in if_none_match.split(',')]
+    else:
+        not_modified = (if_modified_since is not None and
+                        last_modified <= if_modified_since)
+
+    if not_modified:
+        response = http.HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = http.HttpResponse(data, content_type='text/xml')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = http.HttpResponse(gunzip(data), content_type='text/xml')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, max_age=60 * 60)
+    return response
+
+
+def variant(apiver, app, appver):
+    """
+    Return the (apiver, app, appver) of the blocklist served for the given
+    ones: the output only depends on the app version for API versions < 3,
+    and API versions only differ between < 3 and >= 3.
+    """
+    if apiver > 2:
+        return 3, app, None
+    return 2, app, appver
+
+
+def artifact_key(apiver, app, appver):
+    key = 'blocklist:artifact:%s:%s:%s' % (apiver, app, appver)
     # Use md5 to make sure the memcached key is clean.
-    key = hashlib.md5(smart_str(key)).hexdigest()
+    return hashlib.md5(smart_str(key)).hexdigest()
+
+
+def get_artifact(apiver, app, appver):
+    """
+    Return (when it was built, gzipped XML) of a blocklist variant, building
+    it if it wasn't built since the blocklist last changed.
+    """
     cache.add('blocklist:keyversion', 1)
     version = cache.get('blocklist:keyversion')
-    response = cache.get(key, version=version)
-    if response is None:
-        response = _blocklist(request, apiver, app, appver)
-        cache.set(key, response, 60 * 60, version=version)
-    patch_cache_control(response, max_age=60 * 60)
-    return response
+    key = artifact_key(apiver, app, appver)
+    artifact = cache.get(key, version=version)
+    if artifact is None:
+        artifact = int(time.time()), gzip(build_blocklist(apiver, app, appver))
+        cache.set(key, artifact, 60 * 60 * 24, version=version)
+    return artifact
+
+
+def gzip(data):
+    out = StringIO.StringIO()
+    with GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def gunzip(data):
+    return GzipFile(fileobj=StringIO.StringIO(data)).read()
 
 
-def _blocklist(request, apiver, app, appver):
-    apiver = int(apiver)
+def build_blocklist(apiver, app, appver):
+    """Render the blocklist XML."""
     items = get_items(apiver, app, appver)[0]
     plugins = get_plugins(apiver, app, appver)
     gfxs = BlocklistGfx.objects.filter(Q(guid__isnull=True) | Q(guid=app))
@@ -59,8 +123,10 @@ def _blocklist(request, apiver, app, appver):
     data = dict(items=items, plugins=plugins, gfxs=gfxs, apiver=apiver,
                 appguid=app, appver=appver, last_update=last_update, cas=cas,
                 issuerCertBlocks=issuerCertBlocks)
-    return render(request, 'blocklist/blocklist.xml', data,
-                  content_type='text/xml')
+    if not jingo._helpers_loaded:
+        jingo.load_helpers()
+    template = jingo.env.get_template('blocklist/blocklist.xml')
+    return smart_str(template.render(data))
 
 
 def clear_blocklist(*args, **kw):
@@ -68,6 +134,10 @@ def clear_blocklist(*args, **kw):
     cache.add('blocklist:keyversion', 1)
     cache.incr('blocklist:keyversion')
     flush_front_end_cache_urls.delay(['/blocklist/*'])
+    # Build the most requested blocklists now rather than on the first
+    # requests for them.
+    from .tasks import generate_blocklists
+    generate_blocklists.apply_async(countdown=settings.BLOCKLIST_BUILD_DELAY)
 
 
 for m in (BlocklistItem, BlocklistPlugin, BlocklistGfx, BlocklistApp,
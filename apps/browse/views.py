@@ -6,6 +6,7 @@ from django.http import (Http404, HttpResponsePermanentRedirect,
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.cache import cache_page
 
+import waffle
 from product_details import product_details
 from mobility.decorators import mobile_template
 from tower import ugettext_lazy as _lazy
@@ -216,6 +217,9 @@ def es_extensions(request, category=None, template=None):
 
     if category:
         qs = qs.filter(category=category.id)
+    if waffle.switch_is_active('search-source-objects'):
+        # The install buttons need the current versions.
+        qs = qs.source_objects(Addon.attach_related_versions)
     addons = amo.utils.paginate(request, qs)
 
     return render(request, template,
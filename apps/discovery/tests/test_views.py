@@ -1,4 +1,5 @@
 import json
+import time
 
 from django import test
 from django.core.cache import cache
@@ -29,7 +30,7 @@ from files.models import File
 from versions.models import Version, ApplicationsVersions
 
 
-class TestRecs(amo.tests.TestCase):
+class TestRecs(amo.tests.RedisTest, amo.tests.TestCase):
     fixtures = ['base/appversion', 'base/addon_3615',
                 'base/addon-recs', 'base/addon_5299_gcal', 'base/category',
                 'base/featured', 'addons/featured']
@@ -182,6 +183,32 @@ class TestRecs(amo.tests.TestCase):
             1)
         eq_(SyncedCollection.objects.filter(addon_index=two['token2']).count(),
             1)
+        # The old collection lost its user to the new one.
+        eq_(SyncedCollection.objects.get(addon_index=one['token2']).count, 0)
+        eq_(SyncedCollection.objects.get(addon_index=two['token2']).count, 1)
+
+    def test_buffer_collections(self):
+        self.create_switch('disco-pane-buffer-collections')
+        response = self.client.post(self.url, self.json,
+                                    content_type='application/json')
+        one = json.loads(response.content)
+        post_data = json.dumps(dict(guids=self.guids[:1],
+                                    token2=one['token2']))
+        response = self.client.post(self.url, post_data,
+                                    content_type='application/json')
+        eq_(response.status_code, 200)
+        two = json.loads(response.content)
+        # The counts are only saved by the cron.
+        assert not SyncedCollection.objects.exists()
+
+        # Once the buckets are more than a minute old.
+        with mock.patch('bandwagon.models.time') as time_:
+            time_.time.return_value = time.time() + 120
+            SyncedCollection.flush_counts()
+        # The user moved from the first collection to the second.
+        assert not SyncedCollection.objects.filter(
+            addon_index=one['token2']).exists()
+        eq_(SyncedCollection.objects.get(addon_index=two['token2']).count, 1)
 
 
 class TestModuleAdmin(amo.tests.TestCase):
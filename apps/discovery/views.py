@@ -8,6 +8,7 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.csrf import csrf_exempt
 
 import commonware.log
+import redis
 import waffle
 
 import amo
@@ -200,6 +201,18 @@ def recommendations(request, version, platform, limit=9, compat_mode=None):
     recs = _recommendations(request, version, platform, limit, index, ids,
                             recs, compat_mode)
 
+    # With the write-behind buffer every collection is counted, the counts
+    # are saved in batches by the flush_synced_collection_counts cron.
+    if waffle.switch_is_active('disco-pane-buffer-collections'):
+        try:
+            if POST.get('token2') != index:
+                if POST.get('token2'):
+                    SyncedCollection.buffer_count(POST['token2'], -1)
+                SyncedCollection.buffer_count(index, 1, addon_ids)
+        except redis.RedisError, e:
+            log.error(u'Could not buffer "%s" (%s).' % (index, e))
+        return recs
+
     # We're only storing a percentage of the collections we see because the db
     # can't keep up with 100%.
     if not waffle.sample_is_active('disco-pane-store-collections'):
@@ -215,7 +228,7 @@ def recommendations(request, version, platform, limit=9, compat_mode=None):
         elif token != index:
             # We've seen them before and their add-ons changed. Remove the
             # reference to their old synced collection.
-            (SyncedCollection.objects.filter(addon_index=index)
+            (SyncedCollection.objects.filter(addon_index=token)
              .update(count=F('count') - 1))
 
     # Try to create the SyncedCollection. There's a unique constraint on
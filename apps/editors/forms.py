@@ -14,6 +14,7 @@ from tower import ugettext as _, ugettext_lazy as _lazy
 import amo
 import constants.editors as rvw
 from addons.models import Addon, Persona
+from addons.tasks import update_theme_payloads
 from amo.urlresolvers import reverse
 from amo.utils import raise_required
 from applications.models import AppVersion
@@ -390,6 +391,7 @@ class ThemeReviewForm(happyforms.Form):
             theme.addon.update(status=amo.STATUS_PUBLIC)
             theme.approve = datetime.datetime.now()
             theme.save()
+            update_theme_payloads.delay([theme.addon.id])
 
         elif action in (rvw.ACTION_REJECT, rvw.ACTION_DUPLICATE):
             if is_rereview:
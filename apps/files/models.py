@@ -437,6 +437,7 @@ def update_status(sender, instance, **kw):
                 addon.update_status(ignore_version=instance.version)
             else:
                 addon.update_status()
+            addon.invalidate_update_rdf()
         except models.ObjectDoesNotExist:
             pass
 
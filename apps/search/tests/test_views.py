@@ -151,6 +151,17 @@ class TestESSearch(SearchBase):
         r = self.client.get(urlparams(self.url, q='+'))
         eq_(r.status_code, 200)
 
+    def test_source_objects(self):
+        doc = pq(self.client.get(self.url).content)
+        self.create_switch('search-source-objects')
+        source_doc = pq(self.client.get(self.url).content)
+        # The listing is the same, install buttons included.
+        names, versions = '.items .item h3 a', '.items .install'
+        eq_([pq(a).text() for a in source_doc(names)],
+            [pq(a).text() for a in doc(names)])
+        eq_([pq(b).attr('data-version') for b in source_doc(versions)],
+            [pq(b).attr('data-version') for b in doc(versions)])
+
     @amo.tests.mobile_test
     def test_get_mobile(self):
         r = self.client.get(self.url)
@@ -1215,6 +1226,10 @@ class TestSearchSuggestions(TestAjaxSearch):
         self.search_addons('q=PERSONA&cat=themes', personas, types)
         self.search_addons('q=persona&cat=all', [])
 
+    def test_personas_source_objects(self):
+        self.create_switch('search-source-objects')
+        self.test_personas()
+
     def test_applications(self):
         self.search_applications('', [])
         self.search_applications('q=FIREFOX', [amo.FIREFOX, amo.ANDROID])
@@ -7,6 +7,7 @@ from django.utils.encoding import smart_str
 from django.views.decorators.vary import vary_on_headers
 
 import commonware.log
+import waffle
 from mobility.decorators import mobile_template
 from tower import ugettext as _
 
@@ -167,6 +168,9 @@ class BaseAjaxSearch(object):
             elif len(q) > 2:
                 qs = (Addon.search_public()
                       .query(or_=name_only_query(q.lower())))
+                if waffle.switch_is_active('search-source-objects'):
+                    # Everything we need is in the documents.
+                    qs = qs.source_objects()
             if qs:
                 results = qs.filter(type__in=self.types)
         return results
@@ -453,6 +457,9 @@ def search(request, tag_name=None, template=None):
                'updated': '-last_updated',
                'hotness': '-hotness'}
     qs = _filter_search(request, qs, form_data, filters, mapping, types=types)
+    if waffle.switch_is_active('search-source-objects'):
+        # The install buttons need the current versions.
+        qs = qs.source_objects(Addon.attach_related_versions)
 
     pager = amo.utils.paginate(request, qs)
 
@@ -0,0 +1,246 @@
+"""
+A columnar store of the daily stats of an add-on.
+
+Instead of a row per day holding a dict of the breakdown (versions,
+locales...), the counts are stored as arrays indexed by day: one for the
+totals and one per breakdown key. An add-on's whole history fits in a few
+compact arrays that are built once from the database, cached, and sliced
+for every stats request instead of reparsing the rows.
+"""
+import array
+import cPickle as pickle
+import zlib
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from stats.models import DownloadCount, ThemeUserCount, UpdateCount
+from stats.search import (extract_download_count, extract_theme_user_count,
+                          extract_update_count)
+
+
+# The ES documents are used to build the columns so the series are the same
+# as the ones we get from ES.
+EXTRACTORS = {
+    DownloadCount: extract_download_count,
+    ThemeUserCount: extract_theme_user_count,
+    UpdateCount: extract_update_count,
+}
+
+# Unsigned 32 bit ints.
+TYPECODE = 'I'
+
+
+def flatten(data, prefix=()):
+    """
+    Turn {'a': 1, 'b': {'c': 2}} into [(('a',), 1), (('b', 'c'), 2)].
+    """
+    for key, value in data.items():
+        if hasattr(value, 'items'):
+            for item in flatten(value, prefix + (key,)):
+                yield item
+        else:
+            yield prefix + (key,), value
+
+
+def unflatten(items):
+    """The reverse of `flatten`."""
+    data = {}
+    for keys, value in items:
+        d = data
+        for key in keys[:-1]:
+            d = d.setdefault(key, {})
+        d[keys[-1]] = value
+    return data
+
+
+def bucket(day, group):
+    """
+    Return the first and last day of the `group` ('week' or 'month') holding
+    `day`. Weeks start on Sunday, like the weeks the stats charts group days
+    in (see static/js/impala/stats/manager.js).
+    """
+    if group == 'week':
+        first = day - timedelta(days=(day.weekday() + 1) % 7)
+        return first, first + timedelta(days=6)
+    first = day.replace(day=1)
+    next_month = (first + timedelta(days=31)).replace(day=1)
+    return first, next_month - timedelta(days=1)
+
+
+def total(value, days, mean):
+    """The rolled up `value` of a bucket holding `days` days of data."""
+    if mean:
+        return int(round(float(value) / days))
+    # ES sums are floats.
+    return int(value)
+
+
+class DailyColumns(object):
+    """
+    The daily counts of an add-on for a stats model and breakdown field.
+
+    Days are indexed backwards from `end`, the latest day: `days[i]` is 1 if
+    there's a row for `end - i days` and `counts[i]` is its total. Every
+    breakdown key has its own column, as (offset, array) where `array[j]`
+    is the count of day `offset + j`, so keys that only existed for a while
+    (like old versions) don't take room for the whole history. `columns` is
+    None without a breakdown field.
+    """
+
+    def __init__(self, end=None, days=None, counts=None, columns=None):
+        self.end = end
+        self.days = days or array.array('B')
+        self.counts = counts or array.array(TYPECODE)
+        self.columns = columns
+
+    @classmethod
+    def build(cls, model, addon_id, source=None):
+        """Build the columns from the database rows, latest day first."""
+        self = cls(columns={} if source else None)
+        extract = EXTRACTORS[model]
+        qs = model.objects.filter(addon=addon_id).order_by('-date')
+        # The views use this module.
+        from stats.views import extract as extract_data
+
+        for row in qs.iterator():
+            if self.end is None:
+                self.end = row.date
+            idx = (self.end - row.date).days
+            self.grow(idx + 1)
+            self.days[idx] = 1
+            self.counts[idx] = row.count
+            if not source:
+                continue
+            doc = extract(row)
+            for key, value in flatten(extract_data(doc[source] or {})):
+                offset, column = self.columns.setdefault(
+                    key, (idx, array.array(TYPECODE)))
+                missing = idx - offset + 1 - len(column)
+                if missing > 0:
+                    column.extend([0] * missing)
+                column[idx - offset] = value
+        return self
+
+    def grow(self, size):
+        missing = size - len(self.days)
+        if missing > 0:
+            self.days.extend([0] * missing)
+            self.counts.extend([0] * missing)
+
+    def series(self, start, end, limit=365):
+        """
+        Yield the rows between `start` and `end`, latest first, like
+        `stats.views.get_series`.
+        """
+        if self.end is None:
+            return
+        first = max((self.end - end).days, 0)
+        last = min((self.end - start).days + 1, len(self.days))
+        for idx in xrange(first, last):
+            if not self.days[idx]:
+                continue
+            date_ = self.end - timedelta(days=idx)
+            row = {'count': self.counts[idx], 'date': date_, 'end': date_}
+            if self.columns is not None:
+                row['data'] = unflatten(
+                    (key, column[idx - offset])
+                    for key, (offset, column) in self.columns.iteritems()
+                    if 0 <= idx - offset < len(column) and
+                    column[idx - offset])
+            yield row
+            limit -= 1
+            if not limit:
+                return
+
+    def rollup(self, start, end, group, mean=False, limit=365):
+        """
+        Yield the rows between `start` and `end` rolled up by `group`,
+        latest first.
+
+        Counts are summed, or averaged over the days that have data when
+        `mean` is True (user counts). Days without a row are missing data,
+        not zeros: the charts in static/js/impala/stats/manager.js average
+        the same way. `date` and `end` are the first and
+        last day of the bucket within `start` and `end`. Each bucket sums
+        slices of the columns, the days aren't looked at one by one.
+        """
+        if self.end is None:
+            return
+        idx = max((self.end - end).days, 0)
+        last = min((self.end - start).days + 1, len(self.days))
+        while idx < last and limit:
+            first_day, last_day = bucket(self.end - timedelta(days=idx), group)
+            # Days are indexed backwards, the bucket goes from `idx` up to
+            # its first day.
+            stop = min((self.end - first_day).days + 1, last)
+            days = sum(self.days[idx:stop])
+            if days:
+                row = {'count': total(sum(self.counts[idx:stop]), days, mean),
+                       'date': max(first_day, start),
+                       'end': min(last_day, end)}
+                if self.columns is not None:
+                    row['data'] = unflatten(self._column_totals(
+                        idx, stop, days, mean))
+                yield row
+                limit -= 1
+            idx = stop
+
+    def _column_totals(self, idx, stop, days, mean):
+        for key, (offset, column) in self.columns.iteritems():
+            value = sum(column[max(idx - offset, 0):max(stop - offset, 0)])
+            if value:
+                yield key, total(value, days, mean)
+
+    def dumps(self):
+        columns = None
+        if self.columns is not None:
+            columns = [(key, offset, column.tostring())
+                       for key, (offset, column) in self.columns.iteritems()]
+        return zlib.compress(pickle.dumps(
+            (self.end, self.days.tostring(), self.counts.tostring(), columns),
+            pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def loads(cls, data):
+        end, days, counts, columns = pickle.loads(zlib.decompress(data))
+        if columns is not None:
+            columns = dict((key, (offset, array.array(TYPECODE, column)))
+                           for key, offset, column in columns)
+        return cls(end, array.array('B', days), array.array(TYPECODE, counts),
+                   columns)
+
+
+def get_columns(model, addon_id, source=None):
+    """
+    Return the cached DailyColumns of `addon_id`, rebuilding them when rows
+    were added, removed or changed since they were cached.
+
+    The stats tables have no modification date. The ingestion commands
+    delete the rows of the day they import and create them again, which
+    raises the highest id, and the total of the counts catches the rows
+    updated in place.
+    """
+    state = model.objects.filter(addon=addon_id).aggregate(
+        latest=Max('date'), rows=Count('id'), last_id=Max('id'),
+        total=Sum('count'))
+    key = 'stats:columns:%s:%s:%s:%s:%s:%s:%s' % (
+        model._meta.db_table, addon_id, source, state['latest'],
+        state['rows'], state['last_id'], state['total'])
+    data = cache.get(key)
+    if data is not None:
+        return DailyColumns.loads(data)
+    columns = DailyColumns.build(model, addon_id, source)
+    cache.set(key, columns.dumps(), 60 * 60 * 24)
+    return columns
+
+
+def get_series(model, addon_id, date_range, source=None, group='day',
+               mean=False):
+    """The columnar version of `stats.views.get_series`."""
+    start, end = date_range
+    columns = get_columns(model, addon_id, source)
+    if group == 'day':
+        return columns.series(start, end)
+    return columns.rollup(start, end, group, mean)
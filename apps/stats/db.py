@@ -1,13 +1,159 @@
+import base64
+
+from django.conf import settings
 from django.db import models
 
 import phpserialize as php
 import json
 
 
+# The compact form of a dict is this prefix followed by the base64 of its
+# bytes, see `dumps_compact`. JSON and serialized php never start with it.
+COMPACT_PREFIX = '~'
+
+# Keys found in the stats of most add-ons, written as their index in this
+# tuple. Only ever append to it, or the dicts already saved would change.
+INTERNED_KEYS = (
+    # Application guids.
+    u'{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+    u'{3550f703-e582-4d05-9a08-453d09bdfdc6}',
+    u'{92650c4d-4b8e-4d2a-b7eb-24ecf4f6b63a}',
+    u'{718e30fb-e89b-41dd-9da7-e25a45638b28}',
+    u'{a23983c0-fd0e-11dc-95ff-0800200c9a66}',
+    u'{aa3c5121-dab2-40e2-81ca-7ea25febc110}',
+    u'{86c18b42-e466-45a9-ae7a-9b95ba6f5640}',
+    # Statuses.
+    u'userEnabled', u'userDisabled', u'userEnabled,incompatible',
+    u'userDisabled,incompatible', u'Unknown',
+    # Operating systems.
+    u'WINNT', u'Darwin', u'Linux', u'Android', u'BSD_OS', u'SunOS',
+)
+INTERNED_IDS = dict((key, idx) for idx, key in enumerate(INTERNED_KEYS))
+
+
+def write_varint(value, out):
+    """Append the unsigned int `value` to bytearray `out`, 7 bits a byte."""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    """Return the varint of the bytearray `data` at `pos`, and the next pos."""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def is_compactable(d):
+    """Only dicts of string keys and positive int counts can be compact."""
+    for key, value in d.items():
+        if not isinstance(key, basestring):
+            return False
+        if isinstance(value, dict):
+            if not is_compactable(value):
+                return False
+        elif (not isinstance(value, (int, long)) or isinstance(value, bool) or
+                value < 0):
+            return False
+    return True
+
+
+def _dump_dict(d, out):
+    # A dict is its number of items followed by the items. A key is either
+    # 2 * its index in INTERNED_KEYS, or 2 * its length + 1 followed by its
+    # utf-8 bytes. A value is either 2 * the count, or 1 followed by a dict.
+    write_varint(len(d), out)
+    for key, value in d.items():
+        key = key.decode('utf-8') if isinstance(key, str) else key
+        if key in INTERNED_IDS:
+            write_varint(INTERNED_IDS[key] * 2, out)
+        else:
+            key = key.encode('utf-8')
+            write_varint(len(key) * 2 + 1, out)
+            out.extend(key)
+        if isinstance(value, dict):
+            write_varint(1, out)
+            _dump_dict(value, out)
+        else:
+            write_varint(value * 2, out)
+
+
+def _load_dict(data, pos):
+    d = {}
+    size, pos = read_varint(data, pos)
+    for _ in xrange(size):
+        ref, pos = read_varint(data, pos)
+        if ref % 2:
+            end = pos + ref // 2
+            key = data[pos:end].decode('utf-8')
+            pos = end
+        else:
+            key = INTERNED_KEYS[ref // 2]
+        value, pos = read_varint(data, pos)
+        if value == 1:
+            d[key], pos = _load_dict(data, pos)
+        else:
+            d[key] = value // 2
+    return d, pos
+
+
+def dumps_compact(d):
+    """Encode a dict of counts in its compact form, see `_dump_dict`."""
+    out = bytearray()
+    _dump_dict(d, out)
+    return COMPACT_PREFIX + base64.b64encode(out)
+
+
+def loads_compact(value):
+    """Decode the compact form of a dict of counts."""
+    try:
+        data = bytearray(base64.b64decode(value[len(COMPACT_PREFIX):]))
+        d, pos = _load_dict(data, 0)
+    except (TypeError, IndexError, UnicodeDecodeError):
+        raise ValueError('Invalid compact stats dict: %r' % value)
+    if pos != len(data):
+        raise ValueError('Invalid compact stats dict: %r' % value)
+    return d
+
+
+class LazyStatsDict(object):
+    """
+    Stores the value of a StatsDictField as it comes from the database and
+    only decodes it when it's first read.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.field.name]
+        if isinstance(value, basestring):
+            value = self.field.to_python(value)
+            obj.__dict__[self.field.name] = value
+        return value
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.field.name] = value
+
+
 class StatsDictField(models.TextField):
 
-    description = 'A dictionary of counts stored as serialized php or json.'
-    __metaclass__ = models.SubfieldBase
+    description = ('A dictionary of counts stored as json, serialized php or '
+                   'in a compact form.')
+
+    def contribute_to_class(self, cls, name, virtual_only=False):
+        super(StatsDictField, self).contribute_to_class(cls, name,
+                                                        virtual_only)
+        setattr(cls, self.name, LazyStatsDict(self))
 
     def db_type(self, connection):
         return 'text'
@@ -20,7 +166,12 @@ class StatsDictField(models.TextField):
             return value
 
         # string case
-        if value and value[0] in '[{':
+        if value and value.startswith(COMPACT_PREFIX):
+            try:
+                d = loads_compact(value)
+            except ValueError:
+                d = None
+        elif value and value[0] in '[{':
             # JSON
             try:
                 d = json.loads(value)
@@ -42,7 +193,10 @@ class StatsDictField(models.TextField):
         if value is None or value == '':
             return value
         try:
-            value = json.dumps(dict(value))
+            value = dict(value)
+            if settings.STATS_DICT_COMPACT and is_compactable(value):
+                return dumps_compact(value)
+            value = json.dumps(value)
         except TypeError:
             value = None
         return value
@@ -5,13 +5,14 @@ from optparse import make_option
 from django.core.management.base import BaseCommand
 from django.db.models import Max, Min
 
-from celery.task.sets import TaskSet
+from celery import chord
 
 from amo.utils import chunked
 from stats.models import (CollectionCount, DownloadCount, ThemeUserCount,
                           UpdateCount)
 from stats.tasks import (index_collection_counts, index_download_counts,
-                         index_theme_user_counts, index_update_counts)
+                         index_theme_user_counts, index_update_counts,
+                         refresh_stats_index)
 
 log = logging.getLogger('z.stats')
 
@@ -58,10 +59,8 @@ class Command(BaseCommand):
     help = HELP
 
     def handle(self, *args, **kw):
-        if kw.get('fixup'):
-            fixup()
-
         addons, dates, index = kw['addons'], kw['date'], kw['index']
+        ts = fixup(index) if kw.get('fixup') else []
 
         queries = [
             (UpdateCount.objects, index_update_counts,
@@ -112,20 +111,31 @@ class Command(BaseCommand):
                     stop = start + STEP
                     date_range = (today - timedelta(days=stop),
                                   today - timedelta(days=start))
-                    create_tasks(task, list(qs.filter(**{
-                                            '%s__range' % date_field:
-                                            date_range})), index)
+                    ts.extend(create_tasks(task, list(qs.filter(**{
+                                           '%s__range' % date_field:
+                                           date_range})), index))
             else:
-                create_tasks(task, list(qs), index)
+                ts.extend(create_tasks(task, list(qs), index))
+
+        apply_tasks(ts, index)
+
+
+def create_tasks(task, qs, index=None):
+    """
+    Return the tasks indexing the ids in `qs`. They don't refresh the index,
+    `apply_tasks` does it once they are all done.
+    """
+    return [task.subtask(args=[chunk, index], kwargs={'refresh': False})
+            for chunk in chunked(qs, CHUNK_SIZE)]
 
 
-def create_tasks(task, qs, index):
-    ts = [task.subtask(args=[chunk, index])
-          for chunk in chunked(qs, CHUNK_SIZE)]
-    TaskSet(ts).apply_async()
+def apply_tasks(ts, index=None):
+    if ts:
+        chord(ts, refresh_stats_index.si(index)).apply_async()
 
 
-def fixup():
+def fixup(index=None):
+    ts = []
     queries = [(UpdateCount, index_update_counts),
                (DownloadCount, index_download_counts),
                (ThemeUserCount, index_theme_user_counts)]
@@ -140,4 +150,5 @@ def fixup():
                 search_ids = list(search.values()[:5000])
                 ids = set(all_ids) - set(search_ids)
                 log.info('Missing %s rows for %s.' % (len(ids), addon))
-                create_tasks(task, list(ids))
+                ts.extend(create_tasks(task, list(ids), index))
+    return ts
@@ -1,6 +1,8 @@
 import codecs
 import json
+import multiprocessing
 import re
+import zlib
 from datetime import datetime, timedelta
 from optparse import make_option
 from os import path, unlink
@@ -34,6 +36,16 @@ APPVERSION_REGEX = re.compile(
     """, re.VERBOSE)
 
 
+def shard_for(guid, shards):
+    """Return the shard of `shards` the add-on `guid` is counted in."""
+    return zlib.crc32(guid.encode('utf8')) % shards
+
+
+def count_shard(args):
+    """Run `Command.count_updates` in a worker process."""
+    return Command().count_updates(*args)
+
+
 class Command(BaseCommand):
     """Process hive results stored in different files and store them in the db.
 
@@ -44,6 +56,9 @@ class Command(BaseCommand):
     If not folder is specified, the default is `hive_results/<YYYY-MM-DD>/`.
     This folder will be located in `<settings.NETAPP_STORAGE>/tmp`.
 
+    With --processes=N, the add-ons are split in N shards counted in
+    parallel, each worker only keeping the counts of its own add-ons.
+
     Five files are processed:
     - update_counts_by_version.hive
     - update_counts_by_status.hive
@@ -69,6 +84,9 @@ class Command(BaseCommand):
                     dest='date', help='Date in the YYYY-MM-DD format.'),
         make_option('--separator', action='store', type='string', default='\t',
                     dest='separator', help='Field separator in file.'),
+        make_option('--processes', action='store', type='int', default=1,
+                    dest='processes',
+                    help='Number of processes to read the files with.'),
     )
 
     def handle(self, *args, **options):
@@ -92,8 +110,6 @@ class Command(BaseCommand):
         # or it would just increment again the same data.
         UpdateCount.objects.filter(date=day).delete()
 
-        # Memoize the addons and the UpdateCounts.
-        update_counts = {}
         # Perf: preload all the addons once and for all.
         # This builds a dict where each key (the addon guid we get from the
         # hive query) has the addon_id as value.
@@ -101,6 +117,43 @@ class Command(BaseCommand):
                                             .exclude(type=amo.ADDON_PERSONA)
                                             .values_list('guid', 'id')))
 
+        processes = options['processes']
+        if processes > 1:
+            # Each worker only counts the add-ons of its shard, so the
+            # counts of an add-on never have to be merged across workers.
+            # The workers don't touch the database, the counts are saved
+            # here as the shards come back.
+            shards = [(group_filepaths, sep, guids_to_addon, shard, processes)
+                      for shard in range(processes)]
+            pool = multiprocessing.Pool(processes)
+            try:
+                for update_counts, lines in pool.imap_unordered(count_shard,
+                                                                shards):
+                    self.save_counts(update_counts)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            update_counts, lines = self.count_updates(group_filepaths, sep,
+                                                      guids_to_addon)
+            self.save_counts(update_counts)
+        log.info('Processed a total of %s lines' % lines)
+        log.debug('Total processing time: %s' % (datetime.now() - start))
+
+        # Clean up files.
+        for _, filepath in group_filepaths:
+            log.debug('Deleting {path}'.format(path=filepath))
+            unlink(filepath)
+
+    def count_updates(self, group_filepaths, sep, guids_to_addon, shard=0,
+                      shards=1):
+        """
+        Return the {addon guid: UpdateCount} of the add-ons in `shard` of
+        `shards`, and the number of lines read.
+        """
+        # Memoize the UpdateCounts.
+        update_counts = {}
+
         index = -1
         for group, filepath in group_filepaths:
             with codecs.open(filepath, encoding='utf8') as results_file:
@@ -123,6 +176,8 @@ class Command(BaseCommand):
                         day, addon_guid, data, count, update_type = splitted
 
                     addon_guid = addon_guid.strip()
+                    if shards > 1 and shard_for(addon_guid, shards) != shard:
+                        continue
                     if update_type:
                         update_type.strip()
 
@@ -180,6 +235,10 @@ class Command(BaseCommand):
                     elif group == 'locale':
                         self.update_locale(uc, data, count)
 
+        return update_counts, index + 1
+
+    def save_counts(self, update_counts):
+        """Create the UpdateCounts of `update_counts`, a dict by guid."""
         # Make sure the locales and versions fields aren't too big to fit in
         # the database. Those two fields are the only ones that are not fully
         # validated, so we could end up with just anything in there (spam,
@@ -196,13 +255,6 @@ class Command(BaseCommand):
 
         # Create in bulk: this is much faster.
         UpdateCount.objects.bulk_create(update_counts.values(), 100)
-        log.info('Processed a total of %s lines' % (index + 1))
-        log.debug('Total processing time: %s' % (datetime.now() - start))
-
-        # Clean up files.
-        for _, filepath in group_filepaths:
-            log.debug('Deleting {path}'.format(path=filepath))
-            unlink(filepath)
 
     def update_version(self, update_count, version, count):
         """Update the versions on the update_count with the given version."""
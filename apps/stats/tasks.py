@@ -1,6 +1,8 @@
+import collections
 import datetime
 import httplib2
 import itertools
+import time
 
 from django.conf import settings
 from django.db import connection, transaction
@@ -278,8 +280,19 @@ def _get_metrics_jobs(date=None):
     return stats
 
 
-@task
-def index_update_counts(ids, index=None, **kw):
+def _bulk_index(es, model, data, index, refresh):
+    """Send the stats documents in `data` to ES and log the indexing rate."""
+    start = time.time()
+    bulk_index(es, data, index=index, doc_type=model.get_mapping_type(),
+               refresh=refresh)
+    elapsed = time.time() - start
+    log.info('Indexed %s %s in %.2fs (%d docs/sec).' % (
+        len(data), model._meta.db_table, elapsed,
+        len(data) / elapsed if elapsed else len(data)))
+
+
+@task(ignore_result=False)  # Required for the chord.
+def index_update_counts(ids, index=None, refresh=True, **kw):
     index = index or search.get_alias()
 
     es = amo.search.get_es()
@@ -290,15 +303,14 @@ def index_update_counts(ids, index=None, **kw):
     try:
         for update in qs:
             data.append(search.extract_update_count(update))
-        bulk_index(es, data, index=index,
-                   doc_type=UpdateCount.get_mapping_type(), refresh=True)
+        _bulk_index(es, UpdateCount, data, index, refresh)
     except Exception, exc:
-        index_update_counts.retry(args=[ids, index], exc=exc, **kw)
+        index_update_counts.retry(args=[ids, index, refresh], exc=exc, **kw)
         raise
 
 
-@task
-def index_download_counts(ids, index=None, **kw):
+@task(ignore_result=False)  # Required for the chord.
+def index_download_counts(ids, index=None, refresh=True, **kw):
     index = index or search.get_alias()
 
     es = amo.search.get_es()
@@ -309,15 +321,14 @@ def index_download_counts(ids, index=None, **kw):
         data = []
         for dl in qs:
             data.append(search.extract_download_count(dl))
-        bulk_index(es, data, index=index,
-                   doc_type=DownloadCount.get_mapping_type(), refresh=True)
+        _bulk_index(es, DownloadCount, data, index, refresh)
     except Exception, exc:
-        index_download_counts.retry(args=[ids, index], exc=exc)
+        index_download_counts.retry(args=[ids, index, refresh], exc=exc)
         raise
 
 
-@task
-def index_collection_counts(ids, index=None, **kw):
+@task(ignore_result=False)  # Required for the chord.
+def index_collection_counts(ids, index=None, refresh=True, **kw):
     index = index or search.get_alias()
 
     es = amo.search.get_es()
@@ -327,24 +338,30 @@ def index_collection_counts(ids, index=None, **kw):
                  % (qs.count(), qs[0].date))
     data = []
     try:
+        # Get the related counts of the whole batch at once, by collection
+        # and date.
+        filters = dict(collection__in=set(c.collection_id for c in qs),
+                       date__in=set(c.date for c in qs))
+        addon_collections = collections.defaultdict(list)
+        for count in AddonCollectionCount.objects.filter(**filters):
+            addon_collections[count.collection_id, count.date].append(count)
+        collection_stats = collections.defaultdict(list)
+        for stat in CollectionStats.objects.filter(**filters):
+            collection_stats[stat.collection_id, stat.date].append(stat)
+
         for collection_count in qs:
-            collection = collection_count.collection_id
-            filters = dict(collection=collection,
-                           date=collection_count.date)
+            key = collection_count.collection_id, collection_count.date
             data.append(search.extract_addon_collection(
-                collection_count,
-                AddonCollectionCount.objects.filter(**filters),
-                CollectionStats.objects.filter(**filters)))
-        bulk_index(es, data, index=index,
-                   doc_type=CollectionCount.get_mapping_type(),
-                   refresh=True)
+                collection_count, addon_collections[key],
+                collection_stats[key]))
+        _bulk_index(es, CollectionCount, data, index, refresh)
     except Exception, exc:
-        index_collection_counts.retry(args=[ids], exc=exc)
+        index_collection_counts.retry(args=[ids, index, refresh], exc=exc)
         raise
 
 
-@task
-def index_theme_user_counts(ids, index=None, **kw):
+@task(ignore_result=False)  # Required for the chord.
+def index_theme_user_counts(ids, index=None, refresh=True, **kw):
     index = index or search.get_alias()
 
     es = amo.search.get_es()
@@ -357,8 +374,16 @@ def index_theme_user_counts(ids, index=None, **kw):
     try:
         for user_count in qs:
             data.append(search.extract_theme_user_count(user_count))
-        bulk_index(es, data, index=index,
-                   doc_type=ThemeUserCount.get_mapping_type(), refresh=True)
+        _bulk_index(es, ThemeUserCount, data, index, refresh)
     except Exception, exc:
-        index_theme_user_counts.retry(args=[ids], exc=exc, **kw)
+        index_theme_user_counts.retry(args=[ids, index, refresh], exc=exc,
+                                      **kw)
         raise
+
+
+@task
+def refresh_stats_index(index=None, **kw):
+    """Refresh the stats index once the documents of a bulk load are sent."""
+    index = index or search.get_alias()
+    log.info('Refreshing stats index %s.' % index)
+    amo.search.get_es().indices.refresh(index=index)
@@ -0,0 +1,107 @@
+from datetime import date
+
+from nose.tools import eq_
+
+import amo
+import amo.tests
+from stats import columnar
+from stats.models import DownloadCount, UpdateCount
+
+
+class TestDailyColumns(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def setUp(self):
+        firefox = amo.FIREFOX.guid
+        UpdateCount.objects.create(
+            addon_id=3615, date=date(2014, 7, 10), count=5,
+            versions={'1.0': 2, '1.1': 3}, locales={'en-US': 4, 'fr': 1},
+            applications={firefox: {'30.0': 5}})
+        UpdateCount.objects.create(
+            addon_id=3615, date=date(2014, 7, 7), count=3,
+            versions={'1.0': 3}, locales={'en-US': 3},
+            applications={firefox: {'29.0': 3}})
+        self.range = (date(2014, 7, 1), date(2014, 7, 31))
+
+    def series(self, source=None):
+        columns = columnar.DailyColumns.build(UpdateCount, 3615, source)
+        # Check the columns survive the cache.
+        columns = columnar.DailyColumns.loads(columns.dumps())
+        return list(columns.series(*self.range))
+
+    def test_counts(self):
+        eq_(self.series(), [
+            {'count': 5, 'date': date(2014, 7, 10), 'end': date(2014, 7, 10)},
+            {'count': 3, 'date': date(2014, 7, 7), 'end': date(2014, 7, 7)}])
+
+    def test_breakdown(self):
+        series = self.series('versions')
+        eq_([row['data'] for row in series],
+            [{'1.0': 2, '1.1': 3}, {'1.0': 3}])
+        # Locales are lowercased like in ES.
+        eq_(self.series('locales')[0]['data'], {'en-us': 4, 'fr': 1})
+
+    def test_nested_breakdown(self):
+        eq_([row['data'] for row in self.series('apps')],
+            [{amo.FIREFOX.guid: {'30.0': 5}}, {amo.FIREFOX.guid: {'29.0': 3}}])
+
+    def test_range(self):
+        self.range = (date(2014, 7, 1), date(2014, 7, 8))
+        eq_([row['date'] for row in self.series()], [date(2014, 7, 7)])
+        self.range = (date(2014, 7, 11), date(2014, 7, 31))
+        eq_(self.series(), [])
+
+    def rollup(self, source=None, group='week', mean=False):
+        columns = columnar.DailyColumns.build(UpdateCount, 3615, source)
+        return list(columns.rollup(self.range[0], self.range[1], group,
+                                   mean))
+
+    def test_rollup(self):
+        UpdateCount.objects.create(addon_id=3615, date=date(2014, 7, 1),
+                                   count=2, versions={'1.0': 2})
+        eq_(self.rollup('versions'), [
+            {'count': 8, 'date': date(2014, 7, 6), 'end': date(2014, 7, 12),
+             'data': {'1.0': 5, '1.1': 3}},
+            # The week started in June.
+            {'count': 2, 'date': date(2014, 7, 1), 'end': date(2014, 7, 5),
+             'data': {'1.0': 2}}])
+        eq_(self.rollup('versions', group='month'), [
+            {'count': 10, 'date': date(2014, 7, 1), 'end': date(2014, 7, 31),
+             'data': {'1.0': 7, '1.1': 3}}])
+
+    def test_rollup_mean(self):
+        # Averaged over the days with data.
+        eq_(self.rollup('apps', mean=True), [
+            {'count': 4, 'date': date(2014, 7, 6), 'end': date(2014, 7, 12),
+             'data': {amo.FIREFOX.guid: {'30.0': 3, '29.0': 2}}}])
+
+    def test_rollup_range(self):
+        self.range = (date(2014, 7, 8), date(2014, 7, 31))
+        eq_(self.rollup(), [
+            {'count': 5, 'date': date(2014, 7, 8), 'end': date(2014, 7, 12)}])
+
+    def test_week_starts_on_sunday(self):
+        eq_(columnar.bucket(date(2014, 7, 6), 'week'),
+            (date(2014, 7, 6), date(2014, 7, 12)))
+        eq_(columnar.bucket(date(2014, 7, 12), 'week'),
+            (date(2014, 7, 6), date(2014, 7, 12)))
+
+    def test_no_rows(self):
+        eq_(list(columnar.get_series(DownloadCount, 3615, self.range)), [])
+
+    def test_get_series_cached(self):
+        eq_(len(list(columnar.get_series(UpdateCount, 3615, self.range))), 2)
+        UpdateCount.objects.create(addon_id=3615, date=date(2014, 7, 11),
+                                   count=1)
+        eq_(len(list(columnar.get_series(UpdateCount, 3615, self.range))), 3)
+
+    def test_get_series_reimported_day(self):
+        series = columnar.get_series(UpdateCount, 3615, self.range, 'versions')
+        eq_(list(series)[0]['data'], {'1.0': 2, '1.1': 3})
+        # Re-importing a day deletes its rows and creates them again.
+        UpdateCount.objects.filter(date=date(2014, 7, 10)).delete()
+        UpdateCount.objects.create(
+            addon_id=3615, date=date(2014, 7, 10), count=5,
+            versions={'1.0': 1, '1.1': 4})
+        series = columnar.get_series(UpdateCount, 3615, self.range, 'versions')
+        eq_(list(series)[0]['data'], {'1.0': 1, '1.1': 4})
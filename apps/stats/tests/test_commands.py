@@ -67,6 +67,15 @@ class TestADICommand(FixturesFolderMixin, amo.tests.TestCase):
         eq_(update_count.oses, {u'WINNT': 5})
         eq_(update_count.locales, {u'en-us': 1, u'en-US': 4})
 
+    def test_update_counts_from_file_processes(self):
+        management.call_command('update_counts_from_file', hive_folder,
+                                date=self.date, processes=2)
+        eq_(UpdateCount.objects.all().count(), 1)
+        update_count = UpdateCount.objects.last()
+        eq_(update_count.count, 5)
+        eq_(update_count.versions, {u'3.8': 2, u'3.7': 3})
+        eq_(update_count.locales, {u'en-us': 1, u'en-US': 4})
+
     def test_update_version(self):
         # Initialize the known addons and their versions.
         self.command.addons_versions = {3615: ['3.5', '3.6']}
@@ -10,7 +10,8 @@ import amo.tests
 from addons.models import Addon
 from bandwagon.models import Collection, CollectionAddon
 from stats import cron, tasks
-from stats.models import (AddonCollectionCount, Contribution, DownloadCount,
+from stats.models import (AddonCollectionCount, CollectionCount,
+                          CollectionStats, Contribution, DownloadCount,
                           GlobalStat, ThemeUserCount, UpdateCount)
 
 
@@ -81,7 +82,8 @@ class TestTotalContributions(amo.tests.TestCase):
         eq_(float(a.total_contributions), 19.99)
 
 
-@mock.patch('stats.management.commands.index_stats.create_tasks')
+@mock.patch('stats.management.commands.index_stats.create_tasks',
+            return_value=[])
 class TestIndexStats(amo.tests.TestCase):
     fixtures = ['stats/test_models']
 
@@ -156,6 +158,60 @@ class TestIndexStats(amo.tests.TestCase):
             1 + (downloads[0] - downloads[-1]).days / 5)
 
 
+class TestIndexStatsRefresh(amo.tests.TestCase):
+    fixtures = ['stats/test_models']
+
+    @mock.patch('stats.management.commands.index_stats.chord')
+    def test_refresh_once(self, chord):
+        call_command('index_stats', addons='4, 5, 6', date=None)
+        eq_(chord.call_count, 1)
+        ts, refresh = chord.call_args[0]
+        eq_(len(ts), 3)
+        for subtask in ts:
+            eq_(subtask.kwargs, {'refresh': False})
+        eq_(refresh.task, tasks.refresh_stats_index.name)
+
+    def test_chord_results(self):
+        # The chord can only run its callback if the tasks store results.
+        for task in (tasks.index_update_counts, tasks.index_download_counts,
+                     tasks.index_collection_counts,
+                     tasks.index_theme_user_counts):
+            eq_(task.ignore_result, False)
+
+    @mock.patch('amo.search.get_es')
+    def test_refresh(self, get_es):
+        tasks.refresh_stats_index('stats-index')
+        get_es().indices.refresh.assert_called_with(index='stats-index')
+
+
+class TestIndexCollectionCounts(amo.tests.TestCase):
+    fixtures = ['base/users', 'base/collections', 'base/addon_3615']
+
+    @mock.patch('stats.tasks.bulk_index')
+    def test_related_counts_fetched_once(self, bulk_index):
+        ids = [80, Collection.objects.create(name='collection2').pk]
+        date = datetime.date(2013, 1, 1)
+        for collection in ids:
+            CollectionCount.objects.create(collection_id=collection,
+                                           count=1, date=date)
+            AddonCollectionCount.objects.create(
+                addon_id=3615, collection_id=collection, count=2, date=date)
+            CollectionStats.objects.create(
+                collection_id=collection, name='new_votes_up', count=3,
+                date=date)
+
+        # The counts, add-on collection counts and collection stats.
+        with self.assertNumQueries(3):
+            tasks.index_collection_counts(ids, refresh=False)
+        data = bulk_index.call_args[0][1]
+        eq_(sorted(doc['id'] for doc in data), sorted(ids))
+        for doc in data:
+            eq_(dict((d['k'], d['v']) for d in doc['data']),
+                {'downloads': 2, 'votes_up': 3, 'votes_down': 0,
+                 'subscribers': 0})
+        eq_(bulk_index.call_args[1]['refresh'], False)
+
+
 class TestIndexLatest(amo.tests.ESTestCase):
 
     def test_index_latest(self):
@@ -10,13 +10,15 @@ from nose.tools import eq_
 import amo
 import amo.tests
 from addons.models import Addon
-from stats.models import ClientData, Contribution
+from stats import db
+from stats.models import ClientData, Contribution, UpdateCount
 from stats.db import StatsDictField
 from users.models import UserProfile
 from zadmin.models import DownloadSource
 
 
 class TestStatsDictField(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
 
     def test_to_python_none(self):
         eq_(StatsDictField().to_python(None), None)
@@ -32,6 +34,36 @@ class TestStatsDictField(amo.tests.TestCase):
         val = {'a': 1}
         eq_(StatsDictField().to_python(json.dumps(val)), val)
 
+    def test_to_python_compact(self):
+        val = {amo.FIREFOX.guid: {'30.0': 300, '29.0': 2}, u'\xe9t\xe9': 0}
+        eq_(StatsDictField().to_python(db.dumps_compact(val)), val)
+        eq_(StatsDictField().to_python('~AAAA'), None)
+
+    def test_get_db_prep_value_compact(self):
+        field = StatsDictField()
+        with self.settings(STATS_DICT_COMPACT=True):
+            value = field.get_db_prep_value({'WINNT': 5}, connection=None)
+            assert value.startswith(db.COMPACT_PREFIX)
+            eq_(field.to_python(value), {'WINNT': 5})
+            # Anything but counts is still saved as JSON.
+            eq_(field.get_db_prep_value({'a': 'b'}, connection=None),
+                '{"a": "b"}')
+
+    def test_lazy(self):
+        uc = UpdateCount(addon_id=3615, count=1, date='2014-07-01')
+        uc.versions = json.dumps({'1.0': 1})
+        # The value is only decoded when read.
+        eq_(uc.__dict__['versions'], '{"1.0": 1}')
+        eq_(uc.versions, {'1.0': 1})
+        eq_(uc.__dict__['versions'], {'1.0': 1})
+
+    def test_save_compact(self):
+        with self.settings(STATS_DICT_COMPACT=True):
+            uc = UpdateCount.objects.create(addon_id=3615, count=1,
+                                            date='2014-07-01',
+                                            versions={'1.0': 1})
+        eq_(UpdateCount.objects.get(pk=uc.pk).versions, {'1.0': 1})
+
 
 class TestEmail(amo.tests.TestCase):
     fixtures = ['base/users', 'base/addon_3615']
@@ -118,9 +118,13 @@ class ESStatsTest(StatsTest, amo.tests.ESTestCase):
         self.refresh('stats')
 
     def csv_eq(self, response, expected):
+        if response.streaming:
+            lines = ''.join(response.streaming_content).splitlines()
+        else:
+            lines = response.content.splitlines()
         content = csv.DictReader(
             # Drop lines that are comments.
-            filter(lambda row: row[0] != '#', response.content.splitlines()))
+            filter(lambda row: row[0] != '#', lines))
         expected = csv.DictReader(
             # Strip any extra spaces from the expected content.
             line.strip() for line in expected.splitlines())
@@ -205,7 +209,7 @@ class TestCSVs(ESStatsTest):
 
     def test_downloads_series(self):
         response = self.get_view_response('stats.downloads_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(response, """date,count
@@ -223,7 +227,7 @@ class TestCSVs(ESStatsTest):
             self.url_args = url_args
 
             response = self.get_view_response('stats.usage_series',
-                                              group='month', format='csv')
+                                              group='day', format='csv')
 
             eq_(response.status_code, 200, 'unexpected http status')
             self.csv_eq(response, """date,count
@@ -241,7 +245,7 @@ class TestCSVs(ESStatsTest):
 
     def test_sources_series(self):
         response = self.get_view_response('stats.sources_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(response, """date,count,search,api
@@ -256,7 +260,7 @@ class TestCSVs(ESStatsTest):
 
     def test_os_series(self):
         response = self.get_view_response('stats.os_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(response, """date,count,Windows,Linux
@@ -265,7 +269,7 @@ class TestCSVs(ESStatsTest):
 
     def test_locales_series(self):
         response = self.get_view_response('stats.locales_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(
@@ -278,7 +282,7 @@ class TestCSVs(ESStatsTest):
 
     def test_statuses_series(self):
         response = self.get_view_response('stats.statuses_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(response, """date,count,userEnabled,userDisabled
@@ -287,7 +291,7 @@ class TestCSVs(ESStatsTest):
 
     def test_versions_series(self):
         response = self.get_view_response('stats.versions_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(response, """date,count,2.0,1.0
@@ -296,7 +300,7 @@ class TestCSVs(ESStatsTest):
 
     def test_apps_series(self):
         response = self.get_view_response('stats.apps_series',
-                                          group='month', format='csv')
+                                          group='day', format='csv')
 
         eq_(response.status_code, 200, 'unexpected http status')
         self.csv_eq(response, """date,count,Firefox 4.0
@@ -621,6 +625,50 @@ class TestResponses(ESStatsTest):
                           2009-06-07,10
                           2009-06-01,10""")
 
+    def test_downloads_json_streaming(self):
+        self.create_switch('stats-streaming')
+        r = self.get_view_response('stats.downloads_series', group='day',
+                                   format='json')
+        eq_(r.status_code, 200)
+        assert r.streaming
+        rows = json.loads(''.join(r.streaming_content))
+        eq_(len(rows), 8)
+        eq_(rows[0], {"count": 10, "date": "2009-09-03", "end": "2009-09-03"})
+
+    def test_downloads_sources_csv_streaming(self):
+        self.create_switch('stats-streaming')
+        r = self.get_view_response('stats.sources_series', group='day',
+                                   format='csv')
+        eq_(r.status_code, 200)
+        self.csv_eq(r, """date,count,search,api
+                          2009-09-03,10,3,2
+                          2009-08-03,10,3,2
+                          2009-07-03,10,3,2
+                          2009-06-28,10,3,2
+                          2009-06-20,10,3,2
+                          2009-06-12,10,3,2
+                          2009-06-07,10,3,2
+                          2009-06-01,10,3,2""")
+
+    def test_downloads_month_json(self):
+        r = self.get_view_response('stats.downloads_series', group='month',
+                                   format='json')
+        eq_(r.status_code, 200)
+        self.assertListEqual(json.loads(r.content), [
+            {"count": 10, "date": "2009-09-01", "end": "2009-09-30"},
+            {"count": 10, "date": "2009-08-01", "end": "2009-08-31"},
+            {"count": 10, "date": "2009-07-01", "end": "2009-07-31"},
+            {"count": 50, "date": "2009-06-01", "end": "2009-06-30"},
+        ])
+
+    def test_downloads_sources_month_json(self):
+        r = self.get_view_response('stats.sources_series', group='month',
+                                   format='json')
+        eq_(r.status_code, 200)
+        eq_(json.loads(r.content)[-1],
+            {"count": 50, "date": "2009-06-01", "end": "2009-06-30",
+             "data": {"api": 10, "search": 15}})
+
     def test_downloads_sources_json(self):
         r = self.get_view_response('stats.sources_series', group='day',
                                    format='json')
@@ -4,7 +4,7 @@ import itertools
 import json
 import logging
 import time
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from types import GeneratorType
 
 from django import http
@@ -17,6 +17,8 @@ from django.shortcuts import get_object_or_404, render
 from django.utils.cache import add_never_cache_headers, patch_cache_control
 from django.utils.datastructures import SortedDict
 
+import jingo
+import waffle
 from cache_nuggets.lib import memoize
 from dateutil.parser import parse
 from product_details import product_details
@@ -31,6 +33,7 @@ from bandwagon.models import Collection
 from bandwagon.views import get_collection
 from zadmin.models import SiteEvent
 
+from . import columnar
 from .models import (CollectionCount, Contribution, DownloadCount,
                      ThemeUserCount, UpdateCount)
 
@@ -44,6 +47,10 @@ SERIES_FORMATS = ('json', 'csv')
 SERIES = ('downloads', 'usage', 'contributions', 'overview', 'sources', 'os',
           'locales', 'statuses', 'versions', 'apps')
 COLLECTION_SERIES = ('downloads', 'subscribers', 'ratings')
+# Size of the chunks of streamed CSV exports.
+CSV_CHUNK_SIZE = 64 * 1024
+# Models counting users, their rollups are daily averages instead of sums.
+MEAN_SERIES_MODELS = (ThemeUserCount, UpdateCount)
 GLOBAL_SERIES = ('addons_in_use', 'addons_updated', 'addons_downloaded',
                  'collections_created', 'reviews_created', 'addons_created',
                  'users_created', 'my_apps')
@@ -60,14 +67,38 @@ def dashboard(request):
                    'stats_base_url': stats_base_url})
 
 
-def get_series(model, extra_field=None, source=None, **filters):
+def get_series(model, extra_field=None, source=None, group='day',
+               **filters):
     """
     Get a generator of dicts for the stats model given by the filters.
 
     Returns {'date': , 'count': } by default. Add an extra field (such as
     application faceting) by passing `extra_field=apps`. `apps` should be in
     the query result.
+
+    With a `group` of 'week' or 'month', there's a row per week or month
+    instead of per day, see `columnar.DailyColumns.rollup`. The totals are
+    rolled up in ES, the breakdowns in the columnar store.
+
+    With the `stats-columnar` switch, the series of an add-on are read from
+    the columnar store instead of ES.
     """
+    mean = model in MEAN_SERIES_MODELS
+    # The breakdowns are lists of key/value objects in ES, they can't be
+    # summed per key there.
+    if (model in columnar.EXTRACTORS and
+            set(filters) == set(['addon', 'date__range']) and
+            (waffle.switch_is_active('stats-columnar') or
+             (group != 'day' and (source or extra_field)))):
+        return columnar.get_series(model, filters['addon'],
+                                   filters['date__range'],
+                                   source or extra_field, group, mean)
+    if group != 'day':
+        return get_es_rollup(model, group, mean, **filters)
+    return get_es_series(model, extra_field, source, **filters)
+
+
+def get_es_series(model, extra_field=None, source=None, **filters):
     extra = () if extra_field is None else (extra_field,)
     # Put a slice on it so we get more than 10 (the default), but limit to 365.
     qs = (model.search().order_by('-date').filter(**filters)
@@ -85,6 +116,32 @@ def get_series(model, extra_field=None, source=None, **filters):
         yield rv
 
 
+def get_es_rollup(model, group, mean=False, limit=365, **filters):
+    """
+    Roll up the daily counts by `group` with an ES date histogram, so only
+    a row per bucket comes back, like `columnar.DailyColumns.rollup`.
+    """
+    start, end = filters['date__range']
+    histogram = {
+        'date_histogram': {'field': 'date', 'interval': group,
+                           'min_doc_count': 1, 'order': {'_key': 'desc'}},
+        'aggs': {'count': {'avg' if mean else 'sum': {'field': 'count'}}},
+    }
+    if group == 'week':
+        # ES weeks start on Monday, shift the days so they start on Sunday
+        # like `columnar.bucket`.
+        histogram['date_histogram'].update(pre_offset='+1d',
+                                           post_offset='-1d')
+    qs = model.search().filter(**filters).aggregate(buckets=histogram)[:0]
+    buckets = qs.raw_aggregations().get('buckets', {}).get('buckets', [])
+    for val in buckets[:limit]:
+        # Keys are timestamps in milliseconds.
+        first = datetime.utcfromtimestamp(val['key'] / 1000).date()
+        first, last = columnar.bucket(first, group)
+        yield {'count': columnar.total(val['count']['value'], 1, mean),
+               'date': max(first, start), 'end': min(last, end)}
+
+
 def csv_fields(series):
     """
     Figure out all the keys in the `data` dict for csv columns.
@@ -194,7 +251,8 @@ def downloads_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    series = get_series(DownloadCount, addon=addon.id, date__range=date_range)
+    series = get_series(DownloadCount, group=group, addon=addon.id,
+                        date__range=date_range)
 
     if format == 'csv':
         return render_csv(request, addon, series, ['date', 'count'])
@@ -208,7 +266,7 @@ def sources_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    series = get_series(DownloadCount, source='sources',
+    series = get_series(DownloadCount, source='sources', group=group,
                         addon=addon.id, date__range=date_range)
 
     if format == 'csv':
@@ -227,7 +285,7 @@ def usage_series(request, addon, group, start, end, format):
 
     series = get_series(
         ThemeUserCount if addon.type == amo.ADDON_PERSONA else UpdateCount,
-        addon=addon.id, date__range=date_range)
+        group=group, addon=addon.id, date__range=date_range)
 
     if format == 'csv':
         return render_csv(request, addon, series, ['date', 'count'])
@@ -249,7 +307,7 @@ def usage_breakdown_series(request, addon, group,
         'versions': 'versions',
         'statuses': 'status',
     }
-    series = get_series(UpdateCount, source=fields[field],
+    series = get_series(UpdateCount, source=fields[field], group=group,
                         addon=addon.id, date__range=date_range)
     if field == 'locales':
         series = process_locales(series)
@@ -656,14 +714,7 @@ def fudge_headers(response, stats):
 
 
 class UnicodeCSVDictWriter(csv.DictWriter):
-    """A DictWriter that writes a unicode stream."""
-
-    def __init__(self, stream, fields, **kw):
-        # We have the csv module write into our buffer as bytes and then we
-        # dump the buffer to the real stream as unicode.
-        self.buffer = cStringIO.StringIO()
-        csv.DictWriter.__init__(self, self.buffer, fields, **kw)
-        self.stream = stream
+    """A DictWriter that writes unicode values to the stream as utf-8."""
 
     def writeheader(self):
         self.writerow(dict(zip(self.fieldnames, self.fieldnames)))
@@ -672,27 +723,74 @@ class UnicodeCSVDictWriter(csv.DictWriter):
         return obj.encode('utf-8') if isinstance(obj, unicode) else obj
 
     def writerow(self, rowdict):
+        # The csv module only writes bytes, so encode the values on the way
+        # in instead of decoding what it wrote.
         row = self._dict_to_list(rowdict)
-        # Write to the buffer as ascii.
         self.writer.writerow(map(self.try_encode, row))
-        # Dump the buffer to the real stream as utf-8.
-        self.stream.write(self.buffer.getvalue().decode('utf-8'))
-        # Clear the buffer.
-        self.buffer.truncate(0)
 
     def writerows(self, rowdicts):
         for rowdict in rowdicts:
             self.writerow(rowdict)
 
 
+def peek(stats):
+    """
+    Return whether the `stats` series has rows, and an iterator over all of
+    them, without consuming the series.
+    """
+    stats = iter(stats)
+    for row in stats:
+        return True, itertools.chain([row], stats)
+    return False, stats
+
+
+def stream_csv(header, stats, fields):
+    """Yield the CSV of `stats` in chunks of about `CSV_CHUNK_SIZE` bytes."""
+    buffer = cStringIO.StringIO()
+    buffer.write(header.encode('utf-8'))
+    writer = UnicodeCSVDictWriter(buffer, fields, restval=0,
+                                  extrasaction='ignore')
+    writer.writeheader()
+    for row in stats:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def stream_json(stats):
+    """Yield the JSON list of `stats` a row at a time."""
+    encoder = DjangoJSONEncoder()
+    yield '['
+    for idx, row in enumerate(stats):
+        yield (', ' if idx else '') + encoder.encode(row)
+    yield ']'
+
+
 @allow_cross_site_request
 def render_csv(request, addon, stats, fields,
                title=None, show_disclaimer=None):
-    """Render a stats series in CSV."""
+    """
+    Render a stats series in CSV.
+
+    With the `stats-streaming` switch, the series is consumed as the
+    response is sent instead of being written to it up front.
+    """
     # Start with a header from the template.
     ts = time.strftime('%c %z')
     context = {'addon': addon, 'timestamp': ts, 'title': title,
                'show_disclaimer': show_disclaimer}
+    if waffle.switch_is_active('stats-streaming'):
+        header = jingo.render_to_string(request, 'stats/csv_header.txt',
+                                        context)
+        has_rows, stats = peek(stats)
+        response = http.StreamingHttpResponse(
+            stream_csv(header, stats, fields),
+            content_type='text/csv; charset=utf-8')
+        fudge_headers(response, has_rows)
+        return response
+
     response = render(request, 'stats/csv_header.txt', context)
 
     writer = UnicodeCSVDictWriter(response, fields, restval=0,
@@ -707,7 +805,20 @@ def render_csv(request, addon, stats, fields,
 
 @allow_cross_site_request
 def render_json(request, addon, stats):
-    """Render a stats series in JSON."""
+    """
+    Render a stats series in JSON.
+
+    With the `stats-streaming` switch, the rows are encoded one by one as the
+    response is sent.
+    """
+    if waffle.switch_is_active('stats-streaming'):
+        has_rows, stats = peek(stats)
+        # Django's encoder supports date and datetime.
+        response = http.StreamingHttpResponse(stream_json(stats),
+                                              content_type='text/json')
+        fudge_headers(response, has_rows)
+        return response
+
     response = http.HttpResponse(content_type='text/json')
 
     # XXX: Subclass DjangoJSONEncoder to handle generators.
@@ -19,7 +19,7 @@ from pyquery import PyQuery as pq
 
 from amo.tests import BaseTestCase
 from testapp.models import TranslatedModel, UntranslatedModel, FancyModel
-from translations import widgets
+from translations import transformer, widgets
 from translations.query import order_by_translation
 from translations.models import (LinkifiedTranslation, NoLinksTranslation,
                                  NoLinksNoMarkupTranslation,
@@ -110,6 +110,24 @@ class TranslationTestCase(BaseTestCase):
         self.trans_eq(o.name, 'some name', 'en-US')
         self.trans_eq(o.description, 'some description', 'en-US')
 
+    def test_fetch_translations_request_cache(self):
+        transformer.start_request()
+        try:
+            with self.assertNumQueries(2):
+                TranslatedModel.objects.get(id=1)
+            # The translations are already loaded for this request.
+            with self.assertNumQueries(1):
+                o = TranslatedModel.objects.no_cache().get(id=1)
+            self.trans_eq(o.name, 'some name', 'en-US')
+
+            # Saved translations are loaded again.
+            o.name = 'new name'
+            o.save()
+            o = TranslatedModel.objects.no_cache().get(id=1)
+            self.trans_eq(o.name, 'new name', 'en-US')
+        finally:
+            transformer.finish_request()
+
     def test_fetch_no_translations(self):
         """Make sure models with no translations aren't harmed."""
         o = UntranslatedModel.objects.get(id=1)
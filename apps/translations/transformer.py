@@ -1,87 +1,165 @@
+import copy
+import threading
+
 from django.conf import settings
+from django.core import signals
 from django.db import connections, models, router
+from django.db.models import signals as db_signals
 from django.utils import translation
 
 from translations.models import Translation
 from translations.fields import TranslatedField
 
-isnull = """IF(!ISNULL({t1}.localized_string), {t1}.{col}, {t2}.{col})
-            AS {name}_{col}"""
-join = """LEFT OUTER JOIN translations {t}
-          ON ({t}.id={model}.{name} AND {t}.locale={locale})"""
-no_locale_join = """LEFT OUTER JOIN translations {t}
-                    ON {t}.id={model}.{name}"""
-
 trans_fields = [f.name for f in Translation._meta.fields]
 
 
-def build_query(model, connection):
-    qn = connection.ops.quote_name
-    selects, joins, params = [], [], []
-
-    # The model can define a fallback locale (which may be a Field).
-    if hasattr(model, 'get_fallback'):
-        fallback = model.get_fallback()
-    else:
-        fallback = settings.LANGUAGE_CODE
-
+def translated_fields(model):
     if not hasattr(model._meta, 'translated_fields'):
         model._meta.translated_fields = [f for f in model._meta.fields
                                          if isinstance(f, TranslatedField)]
+    return model._meta.translated_fields
+
+
+ALL_LOCALES = '*'
+
+# Translations loaded during the current request, by id and locale, see
+# `get_trans`. It's only set while a request is handled, so long running
+# processes like celery workers don't keep translations around.
+_local = threading.local()
+
+
+def start_request(**kw):
+    _local.translations = {}
 
-    # Add the selects and joins for each translated field on the model.
-    for field in model._meta.translated_fields:
-        if isinstance(fallback, models.Field):
-            fallback_str = '%s.%s' % (qn(model._meta.db_table),
-                                      qn(fallback.column))
-        else:
-            fallback_str = '%s'
 
-        name = field.column
-        d = {'t1': 't1_' + name, 't2': 't2_' + name,
-             'model': qn(model._meta.db_table), 'name': name}
+def finish_request(**kw):
+    _local.translations = None
 
-        selects.extend(isnull.format(col=f, **d) for f in trans_fields)
 
-        joins.append(join.format(t=d['t1'], locale='%s', **d))
-        params.append(translation.get_language())
+def forget_translation(sender, instance, **kw):
+    """Don't keep translations saved during the request."""
+    cached = getattr(_local, 'translations', None)
+    if cached and isinstance(instance, Translation):
+        cached.pop(instance.id, None)
 
-        if field.require_locale:
-            joins.append(join.format(t=d['t2'], locale=fallback_str, **d))
-            if not isinstance(fallback, models.Field):
-                params.append(fallback)
+
+signals.request_started.connect(start_request,
+                                dispatch_uid='translations_start_request')
+signals.request_finished.connect(finish_request,
+                                 dispatch_uid='translations_finish_request')
+# Not only for Translation, its Purified/Linkified subclasses are saved too.
+db_signals.post_save.connect(forget_translation,
+                             dispatch_uid='translations_forget_translation')
+
+
+def load_translations(connection, wanted):
+    """
+    Get the translations of `wanted`, a dict of {translation id: locales},
+    as {(id, locale): Translation} in a single query, locales lowercased.
+    An id wanted with ALL_LOCALES in its locales is loaded in all of them.
+
+    Translations already loaded during the request are not queried again.
+    """
+    cached = getattr(_local, 'translations', None)
+    if cached is None:
+        cached = {}
+    found, by_locales = {}, {}
+    for id_, locales in wanted.items():
+        # The {locale: translation} known for this id, ALL_LOCALES is set
+        # when they all are.
+        known = cached.get(id_, {})
+        if known.get(ALL_LOCALES) or (ALL_LOCALES not in locales and
+                                      all(l in known for l in locales)):
+            found.update(((id_, locale), t) for locale, t in known.items()
+                         if locale != ALL_LOCALES and t is not None)
         else:
-            joins.append(no_locale_join.format(t=d['t2'], **d))
+            by_locales.setdefault(frozenset(locales), []).append(id_)
+
+    wheres, params = [], []
+    for locales, ids in by_locales.items():
+        where = 'id IN (%s)' % ','.join(map(str, ids))
+        if ALL_LOCALES not in locales:
+            where += ' AND locale IN (%s)' % ','.join(['%s'] * len(locales))
+            params.extend(locales)
+        wheres.append('(%s)' % where)
+    if not wheres:
+        return found
 
-    # ids will be added later on.
-    sql = """SELECT {model}.{pk}, {selects} FROM {model} {joins}
-             WHERE {model}.{pk} IN {{ids}}"""
-    s = sql.format(selects=','.join(selects), joins='\n'.join(joins),
-                   model=qn(model._meta.db_table), pk=model._meta.pk.column)
-    return s, params
+    cursor = connection.cursor()
+    cursor.execute('SELECT %s FROM translations WHERE %s' % (
+        ','.join(connection.ops.quote_name(f) for f in trans_fields),
+        ' OR '.join(wheres)), tuple(params))
+    # Remember what's missing too, so it's not queried again.
+    for locales, ids in by_locales.items():
+        for id_ in ids:
+            known = cached.setdefault(id_, {})
+            for locale in locales:
+                known.setdefault(locale, None)
+            known[ALL_LOCALES] = ALL_LOCALES in locales
+    for row in cursor.fetchall():
+        t = Translation(*row)
+        found[t.id, t.locale.lower()] = t
+        cached[t.id][t.locale.lower()] = t
+    return found
 
 
 def get_trans(items):
+    """
+    Attach the translations of `items` in the current language, falling
+    back to their default locale, with one `IN` query on the translations.
+    """
     if not items:
         return
 
     model = items[0].__class__
+    fields = translated_fields(model)
     # FIXME: if we knew which db the queryset we are transforming used, we
     # could make sure we are re-using the same one.
     dbname = router.db_for_read(model)
     connection = connections[dbname]
-    sql, params = build_query(model, connection)
-    item_dict = dict((item.pk, item) for item in items)
-    ids = ','.join(map(str, item_dict.keys()))
 
-    cursor = connection.cursor()
-    cursor.execute(sql.format(ids='(%s)' % ids), tuple(params))
-    step = len(trans_fields)
-    for row in cursor.fetchall():
-        # We put the item's pk as the first selected field.
-        item = item_dict[row[0]]
-        for index, field in enumerate(model._meta.translated_fields):
-            start = 1 + step * index
-            t = Translation(*row[start:start + step])
-            if t.id is not None and t.localized_string is not None:
-                setattr(item, field.name, t)
+    # The model can define a fallback locale (which may be a Field).
+    if hasattr(model, 'get_fallback'):
+        fallback = model.get_fallback()
+    else:
+        fallback = settings.LANGUAGE_CODE
+    lang = (translation.get_language() or '').lower()
+
+    def get_fallback(item):
+        if isinstance(fallback, models.Field):
+            locale = getattr(item, fallback.attname)
+        else:
+            locale = fallback
+        return locale.lower() if locale else locale
+
+    # Collect the translation ids and locales we need.
+    wanted = {}
+    for item in items:
+        for field in fields:
+            id_ = getattr(item, field.attname)
+            if id_ is None:
+                continue
+            locales = wanted.setdefault(id_, set([lang]))
+            if not field.require_locale:
+                # Any locale will do as a fallback.
+                locales.add(ALL_LOCALES)
+            elif get_fallback(item):
+                locales.add(get_fallback(item))
+    translations = load_translations(connection, wanted)
+
+    # Any locale of each id, for the fields without require_locale.
+    any_locale = dict((id_, t) for (id_, locale), t in translations.items())
+
+    for item in items:
+        for field in fields:
+            id_ = getattr(item, field.attname)
+            t = translations.get((id_, lang))
+            if t is None or t.localized_string is None:
+                if field.require_locale:
+                    t = translations.get((id_, get_fallback(item)))
+                else:
+                    t = any_locale.get(id_)
+            if t is not None and t.localized_string is not None:
+                # Translations can be shared with other items and the
+                # request cache, don't let them be changed under them.
+                setattr(item, field.name, copy.copy(t))
@@ -59,7 +59,11 @@ def version_dict(version):
     return d
 
 
-def version_int(version):
+def version_int_from_dict(version):
+    """
+    The reference implementation of `version_int`, going through
+    `version_dict`.
+    """
     d = version_dict(smart_str(version))
     for key in ['alpha_ver', 'major', 'minor1', 'minor2', 'minor3',
                 'pre_ver']:
@@ -73,3 +77,96 @@ def version_int(version):
         d['major'], d['minor1'], d['minor2'], d['minor3'], d['alpha'],
         d['alpha_ver'], d['pre'], d['pre_ver'])
     return min(int(v), MAXVERSION)
+
+
+DIGITS = frozenset('0123456789')
+
+
+def _parse_number(version, i, size):
+    """
+    Read a number or a `*` at `i`, like `(\d+|\*)?` in `version_re`.
+    Return (value, next index), 99 for `*` and 0 for nothing.
+    """
+    if i < size:
+        if version[i] in DIGITS:
+            j = i + 1
+            while j < size and version[j] in DIGITS:
+                j += 1
+            return int(version[i:j]), j
+        if version[i] == '*':
+            return 99, i + 1
+    return 0, i
+
+
+def _version_int(version):
+    """`version_int` for a str, without memoization."""
+    size = len(version)
+    major, i = _parse_number(version, 0, size)
+    if i == 0:
+        # `version_re` doesn't match, everything is empty.
+        return 200100
+    minors = []
+    for _ in range(3):
+        if i < size and version[i] == '.':
+            i += 1
+        minor, i = _parse_number(version, i, size)
+        minors.append(minor)
+
+    alpha = 2
+    # [a|b] also matches a `|`, which doesn't count as an alpha or beta.
+    if i < size and version[i] in 'a|b':
+        alpha = {'a': 0, 'b': 1}.get(version[i], 2)
+        i += 1
+    j = i
+    while j < size and version[j] in DIGITS:
+        j += 1
+    alpha_ver = int(version[i:j]) if j > i else 0
+    i = j
+
+    pre, pre_ver = 1, 0
+    if version.startswith('pre', i):
+        pre = 0
+        i += 3
+    if i < size and version[i] in DIGITS:
+        pre_ver = int(version[i])
+
+    if max(minors[0], minors[1], minors[2], alpha_ver) > 99:
+        # The components are concatenated, they overflow their two digits.
+        v = int("%d%02d%02d%02d%d%02d%d%02d" % (
+            major, minors[0], minors[1], minors[2], alpha, alpha_ver, pre,
+            pre_ver))
+    else:
+        v = (major * 10 ** 12 + minors[0] * 10 ** 10 + minors[1] * 10 ** 8 +
+             minors[2] * 10 ** 6 + alpha * 10 ** 5 + alpha_ver * 10 ** 3 +
+             pre * 10 ** 2 + pre_ver)
+    return min(v, MAXVERSION)
+
+
+# The same few app versions come up all the time: memoize them. The cache is
+# simply emptied when it's full, keeping it in LRU order would cost more than
+# parsing the versions again.
+VERSION_INT_CACHE_SIZE = 10000
+_version_int_cache = {}
+
+
+def version_int(version):
+    version = smart_str(version)
+    try:
+        return _version_int_cache[version]
+    except KeyError:
+        pass
+    if len(_version_int_cache) >= VERSION_INT_CACHE_SIZE:
+        _version_int_cache.clear()
+    rv = _version_int_cache[version] = _version_int(version)
+    return rv
+
+
+def version_ints(versions):
+    """Return the `version_int` of every version of `versions`."""
+    ints = {}
+    rv = []
+    for version in versions:
+        if version not in ints:
+            ints[version] = version_int(version)
+        rv.append(ints[version])
+    return rv
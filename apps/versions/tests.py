@@ -37,7 +37,8 @@ from users.models import UserProfile
 from versions import feeds, views
 from versions.models import Version, ApplicationsVersions, source_upload_path
 from versions.compare import (MAXVERSION, version_int, dict_from_int,
-                              version_dict)
+                              version_dict, version_int_from_dict,
+                              version_ints)
 
 
 pytestmark = pytest.mark.django_db
@@ -82,6 +83,19 @@ def test_version_int_unicode():
     eq_(version_int(u'\u2322 ugh stephend'), 200100)
 
 
+@pytest.mark.parametrize('version', [
+    '', '0', '*', '1..2', '1*', '1.0|5', '1.0.0.0.0a1', '3.0a1pre',
+    '3.5.0a1pre2', '1.0pre12', '1.0b100', '100.200.300.400', '10.0.1esr',
+    'pre', 'a1', '.5', None, 2 ** 64, u'\u2322 ugh stephend'])
+def test_version_int_matches_version_dict(version):
+    eq_(version_int(version), version_int_from_dict(version))
+
+
+def test_version_ints():
+    eq_(version_ints(['3.6.*', '3.6.99', '']),
+        [version_int('3.6.*'), version_int('3.6.99'), 200100])
+
+
 def test_dict_from_int():
     d = dict_from_int(3050000001002)
     eq_(d['major'], 3)
@@ -2,24 +2,20 @@ import json
 import logging
 import os
 import sys
-import time
 
 from optparse import make_option
 
-from celery.task import control
-from celery_tasktree import task_with_callbacks, TaskTree
-
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from amo.search import get_es
 from apps.addons import search as addons_search
 from apps.stats import search as stats_search
+from lib.es.models import Reindexing, ReindexingCursor
 from lib.es.utils import (is_reindexing_amo, unflag_reindexing_amo,
                           flag_reindexing_amo, timestamp_index)
 
 logger = logging.getLogger('z.elasticsearch')
-time_limits = settings.CELERY_TIME_LIMITS['lib.es.management.commands.reindex']
 
 
 ES = get_es()
@@ -35,20 +31,17 @@ def log(msg, stdout=sys.stdout):
     stdout.write(msg + '\n')
 
 
-@task_with_callbacks
 def delete_indexes(indexes, stdout=sys.stdout):
     indices = ','.join(indexes)
     log('Removing indices %r' % indices, stdout=stdout)
     ES.indices.delete(indices, ignore=[404, 500])
 
 
-@task_with_callbacks
 def update_aliases(actions, stdout=sys.stdout):
     log('Rebuilding aliases with actions: %s' % actions, stdout=stdout)
     ES.indices.update_aliases({'actions': actions}, ignore=404)
 
 
-@task_with_callbacks
 def create_new_index(module_str, new_index, stdout=sys.stdout):
     alias = MODULES[module_str].get_alias()
     log('Create the index {0}, for alias: {1}'.format(new_index, alias),
@@ -72,24 +65,23 @@ def create_new_index(module_str, new_index, stdout=sys.stdout):
     MODULES[module_str].create_new_index(new_index, config)
 
 
-@task_with_callbacks
 def index_data(module_str, index, stdout=sys.stdout):
     log('Reindexing {0}'.format(index), stdout=stdout)
     MODULES[module_str].reindex(index)
 
 
-@task_with_callbacks
 def flag_database(new_index, old_index, alias, stdout=sys.stdout):
     """Flags the database to indicate that the reindexing has started."""
     log('Flagging the database to start the reindexation', stdout=stdout)
     flag_reindexing_amo(new_index=new_index, old_index=old_index, alias=alias)
 
 
-@task_with_callbacks
 def unflag_database(stdout=sys.stdout):
     """Unflag the database to indicate that the reindexing is over."""
     log('Unflagging the database', stdout=stdout)
     unflag_reindexing_amo()
+    # Nothing left to resume.
+    ReindexingCursor.objects.all().delete()
 
 
 _SUMMARY = """
@@ -121,21 +113,28 @@ class Command(BaseCommand):
                     help=('Do not ask for confirmation before wiping. '
                           'Default: False'),
                     default=False),
+        make_option('--resume', action='store_true',
+                    help=('Resume an interrupted reindexation in the indexes '
+                          'it was creating. Default: False'),
+                    default=False),
     )
 
     def handle(self, *args, **kwargs):
         """Reindexing work.
 
-        Creates a Tasktree that creates new indexes
+        Runs the steps that create new indexes
         over the old ones so the search feature
         works while the indexation occurs.
 
         """
         force = kwargs.get('force', False)
+        resume = kwargs.get('resume', False)
 
-        if is_reindexing_amo() and not force:
+        if resume and not is_reindexing_amo():
+            raise CommandError('No indexation to resume.')
+        if is_reindexing_amo() and not (force or resume):
             raise CommandError('Indexation already occuring - use --force to '
-                               'bypass')
+                               'bypass or --resume to resume it')
 
         log('Starting the reindexation', stdout=self.stdout)
 
@@ -170,10 +169,9 @@ class Command(BaseCommand):
                 return
             alias_actions.append(action)
 
-        # Creating a task tree.
-        log('Building the task tree', stdout=self.stdout)
-        tree = TaskTree()
-        last_action = None
+        # Build the list of steps.
+        log('Building the reindexation steps', stdout=self.stdout)
+        steps = []
 
         to_remove = []
 
@@ -189,6 +187,18 @@ class Command(BaseCommand):
                 # Mark the alias to be removed from that index.
                 add_alias_action('remove', old_index, alias)
 
+            if resume:
+                # Keep indexing in the index being created, the database is
+                # already flagged.
+                try:
+                    new_index = Reindexing.objects.get(alias=alias).new_index
+                except Reindexing.DoesNotExist:
+                    raise CommandError('No indexation to resume for %s.' %
+                                       alias)
+                steps.append((index_data, [module, new_index]))
+                add_alias_action('add', new_index, alias)
+                continue
+
             # Create a new index, using the alias name with a timestamp.
             new_index = timestamp_index(alias)
 
@@ -197,56 +207,38 @@ class Command(BaseCommand):
             if ES.indices.exists(alias):
                 old_index = alias
 
-            # Flag the database.
-            step1 = tree.add_task(flag_database,
-                                  args=[new_index, old_index, alias])
-            step2 = step1.add_task(create_new_index,
-                                   args=[module, new_index])
-            step3 = step2.add_task(index_data,
-                                   args=[module, new_index])
-            last_action = step3
+            # Flag the database, create the index and fill it.
+            steps.append((flag_database, [new_index, old_index, alias]))
+            steps.append((create_new_index, [module, new_index]))
+            steps.append((index_data, [module, new_index]))
 
             # Adding new index to the alias.
             add_alias_action('add', new_index, alias)
 
         # Alias the new index and remove the old aliases, if any.
-        renaming_step = last_action.add_task(update_aliases,
-                                             args=[alias_actions])
+        steps.append((update_aliases, [alias_actions]))
 
         # Unflag the database - there's no need to duplicate the
         # indexing anymore.
-        delete = renaming_step.add_task(unflag_database)
+        steps.append((unflag_database, []))
 
         # Delete the old indexes, if any.
         if to_remove:
-            delete.add_task(delete_indexes, args=[to_remove])
+            steps.append((delete_indexes, [to_remove]))
 
-        # Let's do it.
-        log('Running all indexation tasks', stdout=self.stdout)
+        # Let's do it. The steps run in this process rather than in a celery
+        # task: indexing sends waves of subtasks and waits for them, which
+        # would tie up a worker and count against its time limits. If it
+        # stops, `--resume` picks up where it was.
+        log('Running all indexation steps', stdout=self.stdout)
 
         os.environ['FORCE_INDEXING'] = '1'
-
-        # This is a bit convoluted, and more complicated than simply providing
-        # the soft and hard time limits on the @task decorator. But we're not
-        # using the @task decorator here, but a decorator from celery_tasktree.
-        if not getattr(settings, 'CELERY_ALWAYS_EAGER', False):
-            control.time_limit('lib.es.management.commands.reindex.index_data',
-                               soft=time_limits['soft'],
-                               hard=time_limits['hard'])
-
         try:
-            tree.apply_async()
-            if not getattr(settings, 'CELERY_ALWAYS_EAGER', False):
-                time.sleep(10)   # give celeryd some time to flag the DB
-            while is_reindexing_amo():
-                sys.stdout.write('.')
-                sys.stdout.flush()
-                time.sleep(5)
+            for step, args in steps:
+                step(*args, stdout=self.stdout)
         finally:
             del os.environ['FORCE_INDEXING']
 
-        sys.stdout.write('\n')
-
         # Let's return the /_aliases values.
         aliases = ES.indices.get_aliases()
         aliases = json.dumps(aliases, sort_keys=True, indent=4)
@@ -64,3 +64,20 @@ class Reindexing(models.Model):
 
     class Meta:
         db_table = 'zadmin_reindexing'
+
+
+class ReindexingCursor(models.Model):
+    """
+    How far the objects `name` were indexed in `index`, so an interrupted
+    reindex can resume. See `lib.es.pipeline.ReindexPipeline`.
+    """
+    index = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    # Everything up to this id is indexed.
+    last_id = models.PositiveIntegerField(default=0)
+    indexed = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'zadmin_reindexing_cursor'
+        unique_together = ('index', 'name')
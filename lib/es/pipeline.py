@@ -0,0 +1,117 @@
+import logging
+import time
+
+from django.conf import settings
+
+from celery import group
+from celery.exceptions import SoftTimeLimitExceeded
+
+from amo.utils import chunked
+
+from .models import ReindexingCursor
+
+
+log = logging.getLogger('z.es')
+
+
+class ReindexPipeline(object):
+    """
+    Index objects in chunks of ids, several chunks at once, keeping track of
+    the last id indexed so an interrupted reindex picks up where it stopped.
+
+    `index_task` is a celery task indexing a chunk with
+    `index_task(ids, index=index)`, which has to keep its results for the
+    pipeline to wait on them. Chunks are sent in waves of `concurrency`
+    subtasks, and the cursor is saved once a wave is done. The concurrency
+    is halved when a wave took longer than `max_bulk_time`, and grows back
+    by one while waves are fast, so the reindex backs off when ES is busy
+    serving queries. A wave that fails is retried `retries` times before the
+    pipeline gives up, leaving the cursor at the last complete wave. A chunk
+    hitting its time limit isn't retried, the reindex can be resumed from
+    the cursor instead.
+
+    The pipeline waits on its subtasks, so it runs in the process of the
+    `reindex` command, never in a celery task.
+    """
+
+    def __init__(self, index, name, ids, index_task, chunk_size=None,
+                 concurrency=None, max_bulk_time=None, retries=None):
+        self.index = index
+        self.name = name
+        self.ids = ids
+        self.index_task = index_task
+        self.chunk_size = chunk_size or settings.ES_REINDEX_CHUNK_SIZE
+        self.max_concurrency = concurrency or settings.ES_REINDEX_CONCURRENCY
+        self.concurrency = self.max_concurrency
+        self.max_bulk_time = (max_bulk_time if max_bulk_time is not None
+                              else settings.ES_REINDEX_MAX_BULK_TIME)
+        self.retries = (retries if retries is not None
+                        else settings.ES_REINDEX_RETRIES)
+
+    def run(self):
+        cursor, _ = ReindexingCursor.objects.get_or_create(
+            index=self.index, name=self.name)
+        ids = sorted(id_ for id_ in self.ids if id_ > cursor.last_id)
+        if cursor.last_id:
+            log.info('Resuming %s in %s after id %s (%s already indexed).' %
+                     (self.name, self.index, cursor.last_id, cursor.indexed))
+        chunks = list(chunked(ids, self.chunk_size))
+        total, done, start = len(ids), 0, time.time()
+
+        while chunks:
+            wave, chunks = chunks[:self.concurrency], chunks[self.concurrency:]
+            elapsed = self.run_wave(wave)
+            count = sum(len(chunk) for chunk in wave)
+            done += count
+            cursor.last_id = wave[-1][-1]
+            cursor.indexed += count
+            cursor.save()
+            self.report(done, total, start)
+            self.throttle(elapsed)
+        return cursor
+
+    def run_wave(self, wave):
+        """
+        Index the chunks of `wave` in subtasks, retrying if one fails. Return
+        how long the wave took.
+        """
+        first, last = wave[0][0], wave[-1][-1]
+        for attempt in range(self.retries + 1):
+            start = time.time()
+            try:
+                subtasks = [self.index_task.si(chunk, index=self.index)
+                            for chunk in wave]
+                group(subtasks).apply_async().get()
+                return time.time() - start
+            except SoftTimeLimitExceeded:
+                log.error('Indexing %s %s-%s hit the time limit.' %
+                          (self.name, first, last))
+                raise
+            except Exception:
+                if attempt == self.retries:
+                    log.error('Indexing %s %s-%s failed, giving up.' %
+                              (self.name, first, last))
+                    raise
+                log.warning('Indexing %s %s-%s failed, retrying.' %
+                            (self.name, first, last), exc_info=True)
+                time.sleep(2 ** attempt)
+
+    def throttle(self, elapsed):
+        if elapsed > self.max_bulk_time:
+            self.concurrency = max(1, self.concurrency / 2)
+            log.info('Indexing %s slowed down to %s chunks at once.' %
+                     (self.name, self.concurrency))
+            # Give ES some room before the next wave.
+            time.sleep(elapsed)
+        elif (elapsed < self.max_bulk_time / 2. and
+              self.concurrency < self.max_concurrency):
+            self.concurrency += 1
+
+    def report(self, done, total, start):
+        elapsed = time.time() - start
+        rate = done / elapsed if elapsed else 0
+        eta = (total - done) / rate if rate else 0
+        log.info('Indexed %s/%s %s in %s (%.1f%%, %.1f/s, %s at once, '
+                 '%ds left).' % (done, total, self.name, self.index,
+                                 100. * done / total, rate, self.concurrency,
+                                 eta))
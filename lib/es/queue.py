@@ -0,0 +1,107 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+import redis as redislib
+import redisutils
+from django_statsd.clients import statsd
+
+
+log = logging.getLogger('z.es')
+
+
+class IndexQueue(object):
+    """
+    Coalesce the ids of objects to index over a short window.
+
+    Ids are added to a redis set, so an object saved many times during the
+    window is only indexed once. The first id added in a window schedules
+    `flush_task` to run `ES_INDEX_QUEUE_WINDOW` seconds later; it `pop`s
+    every queued id and indexes them in chunks. The ids that failed to index
+    are `requeue`d, until they failed `max_requeues` times. With a window of
+    0, or if redis is unavailable, ids are given to `index_task` right away
+    like before.
+
+    The queue depth is sent to statsd as `es.queue.<name>.depth` and the
+    time between the window opening and its flush as
+    `es.queue.<name>.latency`.
+    """
+
+    max_requeues = 5
+
+    def __init__(self, name, index_task, flush_task):
+        self.name = name
+        self.index_task = index_task
+        self.flush_task = flush_task
+        self.key = 'es:queue:%s' % name
+        self.window_key = 'es:queue:%s:window' % name
+        self.requeues_key = 'es:queue:%s:requeues' % name
+
+    @property
+    def redis(self):
+        return redisutils.connections['master']
+
+    def add(self, ids):
+        window = settings.ES_INDEX_QUEUE_WINDOW
+        if not window:
+            return self.index_task.delay(ids)
+        try:
+            self.redis.sadd(self.key, *ids)
+            statsd.gauge('es.queue.%s.depth' % self.name,
+                         self.redis.scard(self.key))
+        except redislib.RedisError:
+            log.warning('Could not queue %s %s, indexing them now.' %
+                        (self.name, ids), exc_info=True)
+            return self.index_task.delay(ids)
+        # The window key outlives the window a bit so that only one flush is
+        # scheduled per window even if the flush runs late. If a flush task
+        # is lost, the queue is flushed again once the key expires.
+        if cache.add(self.window_key, time.time(), window + 60):
+            self.flush_task.apply_async(countdown=window)
+
+    def pop(self):
+        """Return the queued ids and remove them from the queue."""
+        opened = cache.get(self.window_key)
+        # Ids added from now on open a new window.
+        cache.delete(self.window_key)
+        ids = self.redis.smembers(self.key)
+        if ids:
+            # Only remove what we got, ids added meanwhile stay in the queue.
+            self.redis.srem(self.key, *ids)
+        if opened:
+            statsd.timing('es.queue.%s.latency' % self.name,
+                          int((time.time() - opened) * 1000))
+        return sorted(int(id_) for id_ in ids)
+
+    def requeue(self, ids):
+        """
+        Put back ids that failed to index, to try them again with the next
+        window. An id that keeps failing is logged and dropped.
+        """
+        retry = []
+        try:
+            for id_ in ids:
+                count = self.redis.hincrby(self.requeues_key, id_, 1)
+                if count > self.max_requeues:
+                    self.redis.hdel(self.requeues_key, id_)
+                    log.error('Giving up on indexing %s %s, it failed %s '
+                              'times.' % (self.name, id_,
+                                          self.max_requeues + 1))
+                else:
+                    retry.append(id_)
+        except redislib.RedisError:
+            log.error('Could not requeue %s %s.' % (self.name, ids),
+                      exc_info=True)
+            return
+        if retry:
+            self.add(retry)
+
+    def indexed(self, ids):
+        """Forget the failures of ids that were indexed since."""
+        try:
+            self.redis.hdel(self.requeues_key, *ids)
+        except redislib.RedisError:
+            log.warning('Could not reset the requeues of %s %s.' %
+                        (self.name, ids), exc_info=True)
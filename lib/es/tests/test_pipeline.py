@@ -0,0 +1,77 @@
+import mock
+from celery.exceptions import SoftTimeLimitExceeded
+from nose.tools import eq_
+
+import amo.tests
+from amo.celery import task
+from lib.es.models import ReindexingCursor
+from lib.es.pipeline import ReindexPipeline
+
+
+def index_chunk(ids, **kw):
+    """Mocked by the tests to check what the subtasks index."""
+
+
+@task(ignore_result=False)
+def index_chunk_task(ids, **kw):
+    index_chunk(ids, **kw)
+
+
+@mock.patch('lib.es.pipeline.time.sleep', lambda seconds: None)
+@mock.patch('lib.es.tests.test_pipeline.index_chunk')
+class TestReindexPipeline(amo.tests.TestCase):
+
+    def pipeline(self, **kw):
+        kw.setdefault('chunk_size', 2)
+        kw.setdefault('concurrency', 1)
+        kw.setdefault('retries', 0)
+        return ReindexPipeline('addons-new', 'addons', [5, 1, 3, 2, 4],
+                               index_chunk_task, **kw)
+
+    def test_run(self, index_chunk):
+        cursor = self.pipeline().run()
+        eq_(index_chunk.call_args_list,
+            [mock.call([1, 2], index='addons-new'),
+             mock.call([3, 4], index='addons-new'),
+             mock.call([5], index='addons-new')])
+        eq_(cursor.last_id, 5)
+        eq_(cursor.indexed, 5)
+
+    def test_resume(self, index_chunk):
+        index_chunk.side_effect = [None, Exception('ES is down')]
+        with self.assertRaises(Exception):
+            self.pipeline().run()
+        eq_(ReindexingCursor.objects.get(index='addons-new').last_id, 2)
+
+        index_chunk.reset_mock()
+        index_chunk.side_effect = None
+        cursor = self.pipeline().run()
+        eq_(index_chunk.call_args_list,
+            [mock.call([3, 4], index='addons-new'),
+             mock.call([5], index='addons-new')])
+        eq_(cursor.indexed, 5)
+
+    def test_retry(self, index_chunk):
+        index_chunk.side_effect = [Exception('Timeout'), None, None, None]
+        self.pipeline(retries=1).run()
+        eq_(index_chunk.call_count, 4)
+
+    def test_time_limit_not_retried(self, index_chunk):
+        index_chunk.side_effect = SoftTimeLimitExceeded
+        with self.assertRaises(SoftTimeLimitExceeded):
+            self.pipeline(retries=3).run()
+        eq_(index_chunk.call_count, 1)
+
+    def test_concurrency(self, index_chunk):
+        pipeline = self.pipeline(concurrency=4, chunk_size=1)
+        pipeline.run()
+        eq_(sorted(call[0][0] for call in index_chunk.call_args_list),
+            [[1], [2], [3], [4], [5]])
+
+    @mock.patch('lib.es.pipeline.ReindexPipeline.run_wave')
+    def test_throttle(self, run_wave, index_chunk):
+        run_wave.return_value = 10
+        pipeline = self.pipeline(concurrency=4, chunk_size=1,
+                                 max_bulk_time=2)
+        pipeline.run()
+        eq_(pipeline.concurrency, 1)
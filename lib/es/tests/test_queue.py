@@ -0,0 +1,61 @@
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from lib.es.queue import IndexQueue
+
+
+class TestIndexQueue(amo.tests.RedisTest, amo.tests.TestCase):
+
+    def setUp(self):
+        super(TestIndexQueue, self).setUp()
+        self.index_task = mock.Mock()
+        self.flush_task = mock.Mock()
+        self.queue = IndexQueue('test', self.index_task, self.flush_task)
+
+    def test_coalesce(self):
+        with self.settings(ES_INDEX_QUEUE_WINDOW=5):
+            self.queue.add([3])
+            self.queue.add([1, 3])
+            self.queue.add([3])
+        # A single flush is scheduled for the window.
+        self.flush_task.apply_async.assert_called_once_with(countdown=5)
+        assert not self.index_task.delay.called
+        eq_(self.queue.pop(), [1, 3])
+        eq_(self.queue.pop(), [])
+
+    def test_new_window(self):
+        with self.settings(ES_INDEX_QUEUE_WINDOW=5):
+            self.queue.add([1])
+            self.queue.pop()
+            self.queue.add([2])
+        eq_(self.flush_task.apply_async.call_count, 2)
+        eq_(self.queue.pop(), [2])
+
+    def test_no_window(self):
+        with self.settings(ES_INDEX_QUEUE_WINDOW=0):
+            self.queue.add([1])
+        self.index_task.delay.assert_called_once_with([1])
+        assert not self.flush_task.apply_async.called
+
+    def test_requeue(self):
+        with self.settings(ES_INDEX_QUEUE_WINDOW=5):
+            self.queue.requeue([1, 2])
+        eq_(self.queue.pop(), [1, 2])
+        self.flush_task.apply_async.assert_called_once_with(countdown=5)
+
+    def test_requeue_gives_up(self):
+        self.queue.max_requeues = 2
+        with self.settings(ES_INDEX_QUEUE_WINDOW=5):
+            for attempt in range(3):
+                self.queue.requeue([1])
+                eq_(self.queue.pop(), [1] if attempt < 2 else [])
+
+    def test_indexed_resets_requeues(self):
+        self.queue.max_requeues = 1
+        with self.settings(ES_INDEX_QUEUE_WINDOW=5):
+            self.queue.requeue([1])
+            self.queue.pop()
+            self.queue.indexed([1])
+            self.queue.requeue([1])
+        eq_(self.queue.pop(), [1])
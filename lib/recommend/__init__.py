@@ -4,6 +4,10 @@ items.
 
 Check the function docs, they expect specific preconditions.
 """
+import bisect
+import heapq
+import multiprocessing
+from array import array
 
 # Placeholders for the fast functions implemented in C.
 
@@ -20,3 +24,131 @@ try:
     from _recommend import symmetric_diff_count, similarity  # noqa
 except ImportError:
     pass
+
+
+def inverted_index(items):
+    """
+    Turn a dict of {item: [collection]} into a dict of {collection: [item]}.
+    """
+    index = {}
+    for item, collections in items.iteritems():
+        for collection in collections:
+            index.setdefault(collection, []).append(item)
+    return index
+
+
+def top_similar(items, index, item, n):
+    """
+    Return the `n` items most similar to `item`, as [(other, score)] with the
+    best scores first.
+
+    Only the items sharing at least one collection with `item` are scored,
+    using `index` from `inverted_index(items)`. Scores are the same as
+    `similarity()`: with k shared collections the symmetric difference of
+    xs and ys is len(xs) + len(ys) - 2k.
+    """
+    shared = {}
+    for collection in items[item]:
+        for other in index[collection]:
+            shared[other] = shared.get(other, 0) + 1
+    del shared[item]
+
+    size = len(items[item])
+    scores = ((1. / (1. + size + len(items[other]) - 2 * count), other)
+              for other, count in shared.iteritems())
+    # Ties go to the lowest id so the results don't depend on dict order.
+    best = heapq.nlargest(n, scores,
+                          key=lambda (score, other): (score, -other))
+    return [(other, score) for score, other in best]
+
+
+# The items and index shared with the worker processes of
+# `all_top_similar`. They are inherited when the workers are forked instead
+# of being pickled for every chunk.
+_shared = None
+
+
+def _top_similar_chunk(chunk):
+    items, index, n = _shared
+    return [(item, top_similar(items, index, item, n)) for item in chunk]
+
+
+def all_top_similar(items, n, processes=1, chunk_size=1000):
+    """
+    Yield (item, top_similar(items, index, item, n)) for every item of
+    `items`, a dict of {item: [collection]}.
+
+    With more than one process, chunks of items are scored in parallel and
+    come back in no particular order.
+    """
+    global _shared
+    index = inverted_index(items)
+    if processes <= 1:
+        for item in items:
+            yield item, top_similar(items, index, item, n)
+        return
+
+    _shared = items, index, n
+    pool = multiprocessing.Pool(processes)
+    try:
+        keys = list(items)
+        chunks = [keys[i:i + chunk_size]
+                  for i in range(0, len(keys), chunk_size)]
+        for results in pool.imap_unordered(_top_similar_chunk, chunks):
+            for result in results:
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+        _shared = None
+
+
+class TopRecommendations(object):
+    """
+    The top recommendations of many items, packed in arrays.
+
+    `rows` are (item, other, score) tuples sorted by item. The recommendations
+    of `items[i]` are `others[offsets[i]:offsets[i + 1]]`, with their scores
+    in the same slice of `scores`. Ids are stored as 32 bit ints and scores as
+    32 bit floats: that's 8 bytes a recommendation instead of a dict entry per
+    recommendation.
+    """
+
+    def __init__(self, rows=()):
+        self.items = array('i')
+        self.offsets = array('l', [0])
+        self.others = array('i')
+        self.scores = array('f')
+        for item, other, score in rows:
+            if not self.items or self.items[-1] != item:
+                if self.items:
+                    self.offsets.append(len(self.others))
+                self.items.append(item)
+            self.others.append(other)
+            self.scores.append(score)
+        if self.items:
+            self.offsets.append(len(self.others))
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, item):
+        """Return the (others, scores) arrays recommended for `item`."""
+        i = bisect.bisect_left(self.items, item)
+        if i == len(self.items) or self.items[i] != item:
+            return array('i'), array('f')
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.others[start:end], self.scores[start:end]
+
+    def accumulate(self, items):
+        """
+        Return {other: total score} summed over the recommendations of all
+        the `items`.
+        """
+        totals = {}
+        get = totals.get
+        for item in items:
+            others, scores = self.get(item)
+            for other, score in zip(others, scores):
+                totals[other] = get(other, 0) + score
+        return totals
@@ -35,3 +35,27 @@ def test_symmetric_diff_count():
 # The algorithm is in flux so this is minimal coverage.
 def test_similarity():
     eq_(1 / 2., recommend.similarity([1], [1, 2]))
+
+
+def test_top_similar():
+    items = {1: [1, 2, 3], 2: [1, 2], 3: [3, 4], 4: [5], 5: [1, 2, 3]}
+    index = recommend.inverted_index(items)
+    eq_(sorted(index[1]), [1, 2, 5])
+
+    # Scores match similarity(), items without a shared collection are
+    # skipped and ties go to the lowest id.
+    eq_(recommend.top_similar(items, index, 1, 10),
+        [(5, 1.), (2, 1 / 2.), (3, 1 / 4.)])
+    eq_(recommend.top_similar(items, index, 1, 2), [(5, 1.), (2, 1 / 2.)])
+    eq_(recommend.top_similar(items, index, 4, 10), [])
+    for item, others in recommend.all_top_similar(items, 10):
+        for other, score in others:
+            eq_(score, recommend.similarity(items[item], items[other]))
+
+
+def test_top_recommendations():
+    top = recommend.TopRecommendations([(1, 2, .5), (1, 3, .25), (4, 2, 1.)])
+    eq_(len(top), 2)
+    eq_(map(list, top.get(1)), [[2, 3], [.5, .25]])
+    eq_(map(list, top.get(2)), [[], []])
+    eq_(top.accumulate([1, 4, 5]), {2: 1.5, 3: .25})
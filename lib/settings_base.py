@@ -102,6 +102,40 @@ SERVICES_DATABASE = {
     'PORT': DATABASES['default']['PORT'],
 }
 
+# The connection pool of the services scripts, see `SERVICES_DATABASE`.
+SERVICES_DATABASE_POOL = {
+    'max_overflow': 10,
+    'pool_size': 5,
+    'recycle': 300
+}
+
+# The MySQL driver of the services scripts, 'MySQLdb' or 'pymysql'. Use
+# 'pymysql', which is pure Python, when serving them from gevent workers so
+# that a query doesn't block every other request of the process.
+SERVICES_DATABASE_DRIVER = 'MySQLdb'
+
+# Answer /services/update from an in-process index of add-on versions and
+# files, built by each worker, instead of querying the database every time.
+SERVICES_UPDATE_INDEX = False
+# How often, in seconds, workers pick up changes for the update index.
+SERVICES_UPDATE_INDEX_REFRESH = 60
+# How often, in seconds, workers rebuild the update index from scratch.
+SERVICES_UPDATE_INDEX_REBUILD = 60 * 60
+
+# Serve theme updates from the payloads stored by
+# `addons.tasks.update_theme_payloads` when there's one.
+SERVICES_THEME_UPDATE_PAYLOADS = False
+
+# Cache rendered /services/update responses in the default memcached, with a
+# small in-process LRU in front of it in each worker.
+SERVICES_UPDATE_CACHE = False
+# How long, in seconds, responses are kept in memcached.
+SERVICES_UPDATE_CACHE_TIMEOUT = 60 * 60
+# How many responses each worker keeps, and for how long. These can't be
+# invalidated, so keep the timeout short.
+SERVICES_UPDATE_CACHE_LOCAL_SIZE = 10000
+SERVICES_UPDATE_CACHE_LOCAL_TIMEOUT = 60
+
 DATABASE_ROUTERS = ('multidb.PinningMasterSlaveRouter',)
 
 # For use django-mysql-pool backend.
@@ -992,8 +1026,7 @@ CELERY_RESULT_BACKEND = 'amqp'
 CELERY_IGNORE_RESULT = True
 CELERY_SEND_TASK_ERROR_EMAILS = True
 CELERYD_HIJACK_ROOT_LOGGER = False
-CELERY_IMPORTS = ('lib.crypto.tasks', 'lib.es.management.commands.reindex',
-                  'lib.video.tasks')
+CELERY_IMPORTS = ('lib.crypto.tasks', 'lib.video.tasks')
 
 # We have separate celeryds for processing devhub & images as fast as possible
 # Some notes:
@@ -1004,6 +1037,8 @@ CELERY_ROUTES = {
     # If your tasks need to be run as soon as possible, add them here so they
     # are routed to the priority queue.
     'addons.tasks.index_addons': {'queue': 'priority'},
+    'addons.tasks.flush_index_queue': {'queue': 'priority'},
+    'addons.tasks.index_queued_addons': {'queue': 'priority'},
     'addons.tasks.unindex_addons': {'queue': 'priority'},
     'addons.tasks.save_theme': {'queue': 'priority'},
     'addons.tasks.save_theme_reupload': {'queue': 'priority'},
@@ -1043,8 +1078,6 @@ CELERY_ROUTES = {
 # Otherwise your task will use the default settings.
 CELERY_TIME_LIMITS = {
     'lib.video.tasks.resize_video': {'soft': 360, 'hard': 600},
-    # The reindex management command can take up to 3 hours to run.
-    'lib.es.management.commands.reindex': {'soft': 10800, 'hard': 14400},
 }
 
 # When testing, we always want tasks to raise exceptions. Good for sanity.
@@ -1208,6 +1241,13 @@ PERF_THRESHOLD = 25
 # available pages when the filter is up-and-coming.
 PERSONA_DEFAULT_PAGES = 10
 
+# Discovery pane recommendations are cached by set of add-ons for
+# RECOMMENDATIONS_CACHE_TIMEOUT seconds. With the recommendations-in-memory
+# switch, they are computed from a copy of the addon_recommendations table
+# kept in memory and reloaded every RECOMMENDATIONS_TTL seconds.
+RECOMMENDATIONS_TTL = 60 * 60
+RECOMMENDATIONS_CACHE_TIMEOUT = 60 * 5
+
 REDIS_LOCATION = os.environ.get('REDIS_LOCATION', 'localhost:6379')
 REDIS_BACKENDS = {
     'master': 'redis://{location}?socket_timeout=0.5'.format(
@@ -1227,6 +1267,11 @@ VALIDATOR_MESSAGE_LIMIT = 500
 # Feature flags
 UNLINK_SITE_STATS = True
 
+# Save the stats dicts (versions, locales...) in their compact form instead
+# of JSON, see stats.db. Every form can be read, only turn this on once all
+# the servers run code that reads the compact form.
+STATS_DICT_COMPACT = False
+
 # Set to True if we're allowed to use X-SENDFILE.
 XSENDFILE = True
 XSENDFILE_HEADER = 'X-SENDFILE'
@@ -1243,6 +1288,9 @@ DEFAULT_SUGGESTED_CONTRIBUTION = 5
 PS_BIN = '/bin/ps'
 
 BLOCKLIST_COOKIE = 'BLOCKLIST_v1'
+# Blocklists are rebuilt this many seconds after they change, so a batch of
+# changes made in the admin only triggers one build.
+BLOCKLIST_BUILD_DELAY = 30
 
 # The maximum file size that is shown inside the file viewer.
 FILE_VIEWER_SIZE_LIMIT = 1048576
@@ -1272,6 +1320,17 @@ ES_TIMEOUT = 30
 ES_DEFAULT_NUM_REPLICAS = 2
 ES_DEFAULT_NUM_SHARDS = 5
 ES_USE_PLUGINS = False
+# Full reindexes index this many objects per ES bulk request, with up to
+# ES_REINDEX_CONCURRENCY subtasks at once. Concurrency goes down when a wave
+# of subtasks takes longer than ES_REINDEX_MAX_BULK_TIME seconds, and failed
+# waves are retried ES_REINDEX_RETRIES times. See lib.es.pipeline.
+ES_REINDEX_CHUNK_SIZE = 150
+ES_REINDEX_CONCURRENCY = 4
+ES_REINDEX_MAX_BULK_TIME = 10
+ES_REINDEX_RETRIES = 3
+# Add-ons saved during this many seconds are indexed together, see
+# lib.es.queue. 0 indexes every save right away.
+ES_INDEX_QUEUE_WINDOW = 5
 
 # Default AMO user id to use for tasks.
 TASK_USER_ID = 4757633
@@ -0,0 +1,12 @@
+CREATE TABLE `theme_update_payloads` (
+    `id` int(11) UNSIGNED AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `created` datetime NOT NULL,
+    `modified` datetime NOT NULL,
+    `addon_id` int(11) UNSIGNED NOT NULL,
+    `locale` varchar(10) NOT NULL,
+    `data` longtext NOT NULL,
+    UNIQUE (`addon_id`, `locale`)
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+ALTER TABLE `theme_update_payloads` ADD CONSTRAINT `theme_update_payloads_addon_id`
+    FOREIGN KEY (`addon_id`) REFERENCES `addons` (`id`);
@@ -0,0 +1,6 @@
+CREATE TABLE `addon_recommendation_changes` (
+    `addon_id` int(11) UNSIGNED NOT NULL PRIMARY KEY
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+ALTER TABLE `addon_recommendation_changes` ADD CONSTRAINT `addon_recommendation_changes_addon_id`
+    FOREIGN KEY (`addon_id`) REFERENCES `addons` (`id`) ON DELETE CASCADE;
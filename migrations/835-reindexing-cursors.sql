@@ -0,0 +1,10 @@
+CREATE TABLE `zadmin_reindexing_cursor` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `index` varchar(255) NOT NULL,
+  `name` varchar(255) NOT NULL,
+  `last_id` int(11) UNSIGNED NOT NULL DEFAULT 0,
+  `indexed` int(11) UNSIGNED NOT NULL DEFAULT 0,
+  `modified` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE (`index`, `name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -0,0 +1,40 @@
+"""
+Compare the speed of `version_int` with its reference implementation.
+
+    python scripts/bench_version_int.py
+"""
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'apps', 'versions'))
+
+import compare  # noqa
+
+# What the update service and the stats ingestion typically see.
+VERSIONS = ['3.6.28', '10.0.12esr', '17.0.11', '24.8.1', '31.0', '33.0a1',
+            '34.0b2', '35.0a2', '3.5.0a1pre2', '*', '2.0.0.20', '1.0']
+
+
+def bench(name, stmt, number=20000):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=3))
+    print '%-30s %.2fus per version' % (
+        name, seconds * 10 ** 6 / (number * len(VERSIONS)))
+
+
+def main():
+    for version in VERSIONS:
+        assert (compare.version_int(version) ==
+                compare.version_int_from_dict(version)), version
+    bench('version_int_from_dict',
+          lambda: [compare.version_int_from_dict(v) for v in VERSIONS])
+    bench('_version_int (no cache)',
+          lambda: [compare._version_int(v) for v in VERSIONS])
+    bench('version_int',
+          lambda: [compare.version_int(v) for v in VERSIONS])
+    bench('version_ints', lambda: compare.version_ints(VERSIONS))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,9 @@ HOME=/tmp
 # Every minute!
 * * * * * %(z_cron)s fast_current_version
 
+# Every 5 minutes.
+*/5 * * * * %(z_cron)s flush_synced_collection_counts
+
 # Every 30 minutes.
 */30 * * * * %(z_cron)s update_addons_current_version
 
@@ -23,6 +26,7 @@ HOME=/tmp
 45 * * * * %(z_cron)s update_addon_appsupport
 50 * * * * %(z_cron)s cleanup_extracted_file
 55 * * * * %(z_cron)s unhide_disabled_files
+0 * * * * %(z_cron)s recs_changed
 
 
 #every 3 hours
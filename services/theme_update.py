@@ -32,9 +32,6 @@ class ThemeUpdate(object):
             'atype': base.ADDON_PERSONA,
             'row': {}
         }
-        if not self.cursor:
-            self.conn = mypool.connect()
-            self.cursor = self.conn.cursor()
 
     def base64_icon(self, addon_id):
         path = self.image_path('icon.jpg')
@@ -92,6 +89,12 @@ class ThemeUpdate(object):
             a.addontype_id=%(atype)s AND a.status=4 AND a.inactive=0
         """.format(primary_key=self.data['primary_key'])
 
+        # If you accessing this from unit tests, then before calling
+        # get_update, you can assign your own cursor.
+        if not self.cursor:
+            self.conn = mypool.connect()
+            self.cursor = self.conn.cursor()
+
         self.cursor.execute(sql, self.data)
         row = self.cursor.fetchone()
 
@@ -117,8 +120,49 @@ class ThemeUpdate(object):
 
         return False
 
-    # TODO: Cache on row['modified']
     def get_json(self):
+        if getattr(settings, 'SERVICES_THEME_UPDATE_PAYLOADS', False):
+            output = self.get_stored_json()
+            if output:
+                return output
+        return self.build_json()
+
+    def get_stored_json(self):
+        """
+        Return the payload stored by `addons.tasks.update_theme_payloads`
+        for our locale, falling back to `en-US`, if there's one.
+        """
+        sql = """
+        SELECT p.persona_id, t.locale, t.data
+        FROM theme_update_payloads AS t
+        INNER JOIN addons AS a ON a.id=t.addon_id
+        INNER JOIN personas AS p ON p.addon_id=a.id
+        WHERE p.{primary_key}=%(id)s AND t.locale IN (%(locale)s, 'en-US') AND
+            a.addontype_id=%(atype)s AND a.status=4 AND a.inactive=0
+        """.format(primary_key=self.data['primary_key'])
+
+        if not self.cursor:
+            self.conn = mypool.connect()
+            self.cursor = self.conn.cursor()
+
+        self.cursor.execute(sql, self.data)
+        rows = dict((locale, (persona_id, data))
+                    for persona_id, locale, data in self.cursor.fetchall())
+        if self.data['locale'] not in rows:
+            self.data['locale'] = 'en-US'
+        persona_id, output = rows.get(self.data['locale'], (None, None))
+        if output and self.from_gp:
+            # Payloads are stored for lookups by `addon_id`.
+            data = json.loads(output)
+            data['id'] = str(persona_id)
+            data['updateURL'] = self.locale_url(
+                settings.VAMO_URL,
+                '/themes/update-check/%s?src=gp' % persona_id)
+            output = json.dumps(data)
+        return output
+
+    # TODO: Cache on row['modified']
+    def build_json(self):
         if not self.get_update():
             # Persona not found.
             return
@@ -159,6 +203,13 @@ class ThemeUpdate(object):
 
         return json.dumps(data)
 
+    def close(self):
+        """Give the connection back to the pool, if we took one."""
+        if self.conn:
+            self.cursor.close()
+            self.conn.close()
+            self.conn, self.cursor = None, None
+
     def image_path(self, filename):
         row = self.data['row']
 
@@ -191,6 +242,31 @@ class ThemeUpdate(object):
         return '%s/%s%s' % (domain, self.data.get('locale', 'en-US'), url)
 
 
+def build_payloads(cursor, addon_id):
+    """
+    Return the JSON served for the theme `addon_id`, by locale, for every
+    locale its name is translated to and `en-US`.
+    """
+    cursor.execute("""
+        SELECT DISTINCT t.locale
+        FROM addons AS a
+        INNER JOIN translations AS t ON t.id=a.name
+        WHERE a.id=%(id)s AND t.localized_string IS NOT NULL AND
+            t.localized_string != ''
+        """, {'id': addon_id})
+    locales = set(row[0] for row in cursor.fetchall())
+    locales.add('en-US')
+
+    payloads = {}
+    for locale in locales:
+        update = ThemeUpdate(locale, addon_id)
+        update.cursor = cursor
+        output = update.build_json()
+        if output:
+            payloads[locale] = output
+    return payloads
+
+
 url_re = re.compile('(?P<locale>.+)?/themes/update-check/(?P<id>\d+)$')
 
 
@@ -214,6 +290,7 @@ def application(environ, start_response):
             start_response('404 Not Found', [])
             return ['']
 
+        update = None
         try:
             update = ThemeUpdate(locale, id_, environ.get('QUERY_STRING'))
             output = update.get_json()
@@ -224,5 +301,8 @@ def application(environ, start_response):
         except:
             log_exception(data)
             raise
+        finally:
+            if update:
+                update.close()
 
     return [output]
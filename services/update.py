@@ -13,8 +13,6 @@ from services.utils import settings
 from django_statsd.clients import statsd
 
 import commonware.log
-import MySQLdb as mysql
-import sqlalchemy.pool as pool
 
 try:
     from compare import version_int
@@ -22,16 +20,24 @@ except ImportError:
     from apps.versions.compare import version_int
 
 from constants import applications, base
-from utils import (APP_GUIDS, get_mirror, log_configure, PLATFORMS,
+from update_cache import get_cache
+from update_index import get_index, UpdateIndex
+from utils import (APP_GUIDS, get_mirror, log_configure, mypool, PLATFORMS,
                    STATUSES_PUBLIC)
 
 # Go configure the log.
 log_configure()
 
-good_rdf = """<?xml version="1.0"?>
+rdf_header = """<?xml version="1.0"?>
 <RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
          xmlns:em="http://www.mozilla.org/2004/em-rdf#">
-    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
+"""
+
+
+rdf_footer = """</RDF:RDF>"""
+
+
+good_rdf_body = """    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
         <em:updates>
             <RDF:Seq>
                 <RDF:li resource="urn:mozilla:%(type)s:%(guid)s:%(version)s"/>
@@ -52,44 +58,37 @@ good_rdf = """<?xml version="1.0"?>
             </RDF:Description>
         </em:targetApplication>
     </RDF:Description>
-</RDF:RDF>"""
-
-
-bad_rdf = """<?xml version="1.0"?>
-<RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
-         xmlns:em="http://www.mozilla.org/2004/em-rdf#">
-</RDF:RDF>"""
+"""
 
 
-no_updates_rdf = """<?xml version="1.0"?>
-<RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
-         xmlns:em="http://www.mozilla.org/2004/em-rdf#">
-    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
+no_updates_rdf_body = """    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
         <em:updates>
             <RDF:Seq>
             </RDF:Seq>
         </em:updates>
     </RDF:Description>
-</RDF:RDF>"""
+"""
 
 
-timing_log = commonware.log.getLogger('z.timer')
-error_log = commonware.log.getLogger('z.services')
+good_rdf = rdf_header + good_rdf_body + rdf_footer
+
+
+bad_rdf = rdf_header + rdf_footer
 
 
-def getconn():
-    db = settings.SERVICES_DATABASE
-    return mysql.connect(host=db['HOST'], user=db['USER'],
-                         passwd=db['PASSWORD'], db=db['NAME'])
+no_updates_rdf = rdf_header + no_updates_rdf_body + rdf_footer
 
 
-mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
+timing_log = commonware.log.getLogger('z.timer')
+error_log = commonware.log.getLogger('z.services')
 
 
 class Update(object):
 
     def __init__(self, data, compat_mode='strict'):
         self.conn, self.cursor = None, None
+        # The in-process update index, when enabled. See `update_index`.
+        self.index = None
         self.data = data.copy()
         self.data['row'] = {}
         self.version_int = 0
@@ -97,8 +96,10 @@ class Update(object):
 
     def is_valid(self):
         # If you accessing this from unit tests, then before calling
-        # is valid, you can assign your own cursor.
-        if not self.cursor:
+        # is valid, you can assign your own cursor or index.
+        if self.index is None:
+            self.index = get_index()
+        if self.index is None and not self.cursor:
             self.conn = mypool.connect()
             self.cursor = self.conn.cursor()
 
@@ -113,15 +114,20 @@ class Update(object):
         if not data['app_id']:
             return False
 
-        sql = """SELECT id, status, addontype_id, guid FROM addons
-                 WHERE guid = %(guid)s AND
-                       inactive = 0 AND
-                       status != %(STATUS_DELETED)s AND
-                       is_listed != 0
-                 LIMIT 1;"""
-        self.cursor.execute(sql, {'guid': self.data['id'],
-                                  'STATUS_DELETED': base.STATUS_DELETED})
-        result = self.cursor.fetchone()
+        if self.index is not None:
+            addon = self.index.get(self.data['id'])
+            result = addon and (addon.id, addon.status, addon.type,
+                                addon.guid)
+        else:
+            sql = """SELECT id, status, addontype_id, guid FROM addons
+                     WHERE guid = %(guid)s AND
+                           inactive = 0 AND
+                           status != %(STATUS_DELETED)s AND
+                           is_listed != 0
+                     LIMIT 1;"""
+            self.cursor.execute(sql, {'guid': self.data['id'],
+                                      'STATUS_DELETED': base.STATUS_DELETED})
+            result = self.cursor.fetchone()
         if result is None:
             return False
 
@@ -141,6 +147,11 @@ class Update(object):
     def get_update(self):
         data = self.data
 
+        if self.index is not None:
+            return self.set_row(self.index.resolve(
+                data, self.compat_mode, self.get_hotfix_version()))
+
+        row = None
         data.update(STATUSES_PUBLIC)
         data['STATUS_BETA'] = base.STATUS_BETA
         data['STATUS_DISABLED'] = base.STATUS_DISABLED
@@ -265,18 +276,9 @@ class Update(object):
         else:  # Not defined or 'strict'.
             sql.append('AND appmax.version_int >= %(version_int)s ')
 
-        # Special case for bug 1031516.
-        if data['guid'] == 'firefox-hotfix@mozilla.org':
-            app_version = data['version_int']
-            hotfix_version = data['version']
-            if version_int('10') <= app_version <= version_int('16.0.1'):
-                if hotfix_version < '20121019.01':
-                    sql.append("AND versions.version = '20121019.01' ")
-                elif hotfix_version < '20130826.01':
-                    sql.append("AND versions.version = '20130826.01' ")
-            elif version_int('16.0.2') <= app_version <= version_int('24.*'):
-                if hotfix_version < '20130826.01':
-                    sql.append("AND versions.version = '20130826.01' ")
+        hotfix_version = self.get_hotfix_version()
+        if hotfix_version:
+            sql.append("AND versions.version = '%s' " % hotfix_version)
 
         sql.append('ORDER BY versions.id DESC LIMIT 1;')
 
@@ -290,6 +292,27 @@ class Update(object):
                 'datestatuschanged', 'strict_compat', 'releasenotes',
                 'version', 'premium_type'],
                 list(result)))
+        return self.set_row(row)
+
+    def get_hotfix_version(self):
+        """Special case for bug 1031516."""
+        data = self.data
+        if data['guid'] == 'firefox-hotfix@mozilla.org':
+            app_version = data['version_int']
+            hotfix_version = data['version']
+            if version_int('10') <= app_version <= version_int('16.0.1'):
+                if hotfix_version < '20121019.01':
+                    return '20121019.01'
+                elif hotfix_version < '20130826.01':
+                    return '20130826.01'
+            elif version_int('16.0.2') <= app_version <= version_int('24.*'):
+                if hotfix_version < '20130826.01':
+                    return '20130826.01'
+        return None
+
+    def set_row(self, row):
+        data = self.data
+        if row:
             row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
             row['url'] = get_mirror(data['addon_status'],
                                     data['id'], row)
@@ -303,23 +326,32 @@ class Update(object):
         return bad_rdf
 
     def get_rdf(self):
-        if self.is_valid():
-            if self.get_update():
-                rdf = self.get_good_rdf()
-            else:
-                rdf = self.get_no_updates_rdf()
-        else:
-            rdf = self.get_bad_rdf()
-        self.cursor.close()
+        rdf = rdf_header + self.get_rdf_body() + rdf_footer
+        if self.cursor:
+            self.cursor.close()
         if self.conn:
             self.conn.close()
         return rdf
 
+    def get_rdf_body(self):
+        if self.is_valid():
+            if self.get_update():
+                return self.get_good_rdf_body()
+            return self.get_no_updates_rdf_body()
+        return ''
+
     def get_no_updates_rdf(self):
+        return rdf_header + self.get_no_updates_rdf_body() + rdf_footer
+
+    def get_no_updates_rdf_body(self):
         name = base.ADDON_SLUGS_UPDATE[self.data['type']]
-        return no_updates_rdf % ({'guid': self.data['guid'], 'type': name})
+        return no_updates_rdf_body % ({'guid': self.data['guid'],
+                                       'type': name})
 
     def get_good_rdf(self):
+        return rdf_header + self.get_good_rdf_body() + rdf_footer
+
+    def get_good_rdf_body(self):
         data = self.data['row']
         data['if_hash'] = ''
         if data['hash']:
@@ -333,7 +365,7 @@ class Update(object):
                                  (settings.SITE_URL, '/versions/updateInfo/',
                                   data['version_id']))
 
-        return good_rdf % data
+        return good_rdf_body % data
 
     def format_date(self, secs):
         return '%s GMT' % formatdate(time() + secs)[:25]
@@ -346,6 +378,53 @@ class Update(object):
                 ('Content-Length', str(length))]
 
 
+class BatchUpdate(Update):
+    """
+    Check several add-ons at once.
+
+    The query string has one `id` and one `version` per add-on, in the same
+    order, and the usual app parameters shared by all of them. All add-ons
+    are loaded with a single set of queries into a throwaway update index
+    (unless the worker has one already) and served in one RDF document.
+    """
+    # Only the first `max_addons` add-ons of a request are checked.
+    max_addons = 100
+
+    def __init__(self, query, compat_mode='strict'):
+        super(BatchUpdate, self).__init__({}, compat_mode)
+        data = dict(query)
+        data.pop('compatMode', None)
+        versions = [v for k, v in query if k == 'version']
+        guids = [v for k, v in query if k == 'id'][:self.max_addons]
+        self.updates = []
+        for i, guid in enumerate(guids):
+            update = Update(dict(data, id=guid,
+                                 version=versions[i] if i < len(versions)
+                                 else ''), compat_mode)
+            self.updates.append(update)
+
+    def is_valid(self):
+        if self.index is None:
+            self.index = get_index()
+        if self.index is None:
+            if not self.cursor:
+                self.conn = mypool.connect()
+                self.cursor = self.conn.cursor()
+            self.index = UpdateIndex()
+            self.index.load_guids(self.cursor,
+                                  [update.data['id']
+                                   for update in self.updates])
+        return True
+
+    def get_rdf_body(self):
+        self.is_valid()
+        body = []
+        for update in self.updates:
+            update.index = self.index
+            body.append(update.get_rdf_body())
+        return '\n'.join(filter(None, body))
+
+
 def mail_exception(data):
     if settings.EMAIL_BACKEND != 'django.core.mail.backends.smtp.EmailBackend':
         return
@@ -370,11 +449,23 @@ def log_exception(data):
 def application(environ, start_response):
     status = '200 OK'
     with statsd.timer('services.update'):
-        data = dict(parse_qsl(environ['QUERY_STRING']))
+        query = parse_qsl(environ['QUERY_STRING'])
+        data = dict(query)
         compat_mode = data.pop('compatMode', 'strict')
         try:
-            update = Update(data, compat_mode)
-            output = update.get_rdf()
+            cache = None
+            if len([k for k, v in query if k == 'id']) > 1:
+                update = BatchUpdate(query, compat_mode)
+            else:
+                update = Update(data, compat_mode)
+                cache = get_cache()
+            output = None
+            if cache:
+                output, ns = cache.get(data, compat_mode)
+            if output is None:
+                output = update.get_rdf()
+                if cache:
+                    cache.set(data, compat_mode, output, ns)
             start_response(status, update.get_headers(len(output)))
         except:
             #mail_exception(data)
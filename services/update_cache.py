@@ -0,0 +1,144 @@
+"""
+A cache of rendered /services/update responses.
+
+The response only depends on the add-on, the user's current version of it,
+the app, the app version, the platform and the compat mode, so it's cached
+under that tuple: in memcached, shared by all workers, and in a small LRU in
+front of it in each worker.
+
+Every entry is stored along with the current value of the add-on's
+namespace key, which the site bumps whenever something that could change
+the response happens (see `Addon.invalidate_update_rdf`). Entries stored
+under an older namespace value are ignored. The in-process LRU isn't
+invalidated, which is why its entries are only kept for a short time.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from time import time
+
+import memcache
+
+from services.utils import settings
+
+try:
+    from compare import version_int
+except ImportError:
+    from apps.versions.compare import version_int
+
+from utils import PLATFORMS
+
+
+def guid_hash(guid):
+    # Guids are compared case-insensitively by the database.
+    return hashlib.md5((guid or '').lower()).hexdigest()
+
+
+def ns_key(guid):
+    """
+    The memcached key of the namespace bumped by `cache_ns_key` for `guid`,
+    built the way Django builds its cache keys.
+    """
+    return '%s:1:ns:update-rdf:%s' % (
+        settings.CACHES['default'].get('KEY_PREFIX', ''), guid_hash(guid))
+
+
+class LRUCache(object):
+    """A bounded, thread safe LRU cache whose entries expire."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.pop(key, None)
+            if value is None or value[0] < time():
+                return None
+            # Move it back to the end, most recently used.
+            self.data[key] = value
+            return value[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time() + self.timeout, value)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+
+class UpdateCache(object):
+
+    def __init__(self):
+        self.local = LRUCache(
+            getattr(settings, 'SERVICES_UPDATE_CACHE_LOCAL_SIZE', 10000),
+            getattr(settings, 'SERVICES_UPDATE_CACHE_LOCAL_TIMEOUT', 60))
+        self.timeout = getattr(settings, 'SERVICES_UPDATE_CACHE_TIMEOUT',
+                               60 * 60)
+        self.client = None
+
+    def get_client(self):
+        if self.client is None:
+            location = settings.CACHES['default']['LOCATION']
+            if isinstance(location, basestring):
+                location = location.split(';')
+            self.client = memcache.Client(location)
+        return self.client
+
+    def key(self, data, compat_mode):
+        """The key of the response for `data`, a parsed query string."""
+        app_os = None
+        for k, v in PLATFORMS.items():
+            if k in data.get('appOS', ''):
+                app_os = v
+                break
+        if compat_mode not in ('normal', 'ignore'):
+            compat_mode = 'strict'
+        key = repr((guid_hash(data.get('id')), data.get('version', ''),
+                    data.get('appID'), version_int(data.get('appVersion')),
+                    app_os, compat_mode))
+        return '%supdate-rdf:%s' % (settings.KEY_PREFIX,
+                                    hashlib.md5(key).hexdigest())
+
+    def get(self, data, compat_mode):
+        """
+        Return the cached response for `data`, or None and the namespace
+        value to pass to `set` along with the response.
+        """
+        key = self.key(data, compat_mode)
+        rdf = self.local.get(key)
+        if rdf is not None:
+            return rdf, None
+
+        ns = ns_key(data.get('id'))
+        values = self.get_client().get_multi([ns, key])
+        if key in values and values[key][0] == values.get(ns):
+            rdf = values[key][1]
+            self.local.set(key, rdf)
+            return rdf, None
+        return None, values.get(ns)
+
+    def set(self, data, compat_mode, rdf, ns):
+        # `ns` is the namespace value from before the response was built,
+        # any change since then makes the response stale.
+        key = self.key(data, compat_mode)
+        self.get_client().set(key, (ns, rdf), self.timeout)
+        self.local.set(key, rdf)
+
+
+cache = None
+
+
+def get_cache():
+    """
+    Return the worker's update response cache, or None if it's disabled in
+    settings.
+    """
+    global cache
+    if not getattr(settings, 'SERVICES_UPDATE_CACHE', False):
+        return None
+    if cache is None:
+        cache = UpdateCache()
+    return cache
@@ -0,0 +1,384 @@
+"""
+An in-process index of everything /services/update needs to answer a query.
+
+Building the index loads, for every listed and active add-on, the versions
+and files that could ever be served as an update, together with the app
+ranges and compat overrides of those versions. `UpdateIndex.resolve` then
+mirrors the SQL in `services.update.Update.get_update` with plain Python
+lookups, so a worker only hits the database when it picks up changes.
+
+Changes are picked up from the `modified` columns of `addons`, `versions`,
+`files` and `incompatible_versions`, which act as our change feed. Things
+that don't touch any of those (e.g. editing the app range of a version or
+removing a compat override) are only picked up by the periodic rebuild.
+"""
+import threading
+from collections import namedtuple
+from time import time
+
+import commonware.log
+
+from services.utils import settings
+
+# This has to be imported after the settings so statsd knows where to log to.
+from django_statsd.clients import statsd
+
+try:
+    from compare import version_int
+except ImportError:
+    from apps.versions.compare import version_int
+
+from constants import applications, base
+from utils import mypool
+
+log = commonware.log.getLogger('z.services')
+
+
+# Only files with one of these statuses can ever be served as an update.
+SERVED_STATUSES = (base.STATUS_PUBLIC, base.STATUS_LITE, base.STATUS_BETA)
+
+Addon = namedtuple('Addon', ('id guid status type premium_type candidates '
+                             'current incompatible'))
+
+Candidate = namedtuple('Candidate', (
+    'version_id version releasenotes file_id file_status platform_id hash '
+    'filename datestatuschanged strict_compat binary_components app_id '
+    'min min_int max max_int'))
+
+Incompatible = namedtuple('Incompatible', ('app_id min_app_version '
+                                           'max_app_version min_int max_int'))
+
+addons_sql = """
+    SELECT addons.id, addons.guid, addons.status, addons.addontype_id,
+           addons.premium_type
+    FROM addons
+    WHERE {where}"""
+
+candidates_sql = """
+    SELECT versions.addon_id, versions.id, versions.version,
+           versions.releasenotes, files.id, files.status, files.platform_id,
+           files.hash, files.filename, files.datestatuschanged,
+           files.strict_compatibility, files.binary_components,
+           appmin.application_id, appmin.version, appmin.version_int,
+           appmax.version, appmax.version_int
+    FROM versions
+    INNER JOIN addons ON addons.id = versions.addon_id
+    INNER JOIN applications_versions
+        ON applications_versions.version_id = versions.id
+    INNER JOIN appversions appmin
+        ON appmin.id = applications_versions.min
+    INNER JOIN appversions appmax
+        ON appmax.id = applications_versions.max
+        AND appmax.application_id = appmin.application_id
+    INNER JOIN files
+        ON files.version_id = versions.id
+        AND files.status IN %(SERVED_STATUSES)s
+    WHERE {where}
+    ORDER BY versions.id DESC, files.id"""
+
+# The user's current version is looked up by its version number. We need the
+# status of all of its files, or nothing if it doesn't have any.
+current_sql = """
+    SELECT versions.addon_id, versions.version, files.status
+    FROM versions
+    INNER JOIN addons ON addons.id = versions.addon_id
+    LEFT JOIN files ON files.version_id = versions.id
+    WHERE {where}"""
+
+incompatible_sql = """
+    SELECT versions.addon_id, incompatible_versions.version_id,
+           incompatible_versions.app_id,
+           incompatible_versions.min_app_version,
+           incompatible_versions.max_app_version,
+           incompatible_versions.min_app_version_int,
+           incompatible_versions.max_app_version_int
+    FROM incompatible_versions
+    INNER JOIN versions ON versions.id = incompatible_versions.version_id
+    INNER JOIN addons ON addons.id = versions.addon_id
+    WHERE {where}"""
+
+# Same conditions as the guid lookup in `services.update.Update.is_valid`.
+valid_addons = """
+    addons.inactive = 0 AND
+    addons.status != %(STATUS_DELETED)s AND
+    addons.is_listed != 0 AND
+    addons.guid IS NOT NULL"""
+
+changed_sql = """
+    SELECT id FROM addons WHERE modified >= %(since)s
+    UNION
+    SELECT addon_id FROM versions WHERE modified >= %(since)s
+    UNION
+    SELECT versions.addon_id FROM files
+    INNER JOIN versions ON versions.id = files.version_id
+    WHERE files.modified >= %(since)s
+    UNION
+    SELECT versions.addon_id FROM incompatible_versions
+    INNER JOIN versions ON versions.id = incompatible_versions.version_id
+    WHERE incompatible_versions.modified >= %(since)s"""
+
+
+class UpdateIndex(object):
+    """Per worker index of add-ons by guid, see the module docstring."""
+
+    # How many add-ons to reload with a single set of queries.
+    chunk_size = 500
+
+    def __init__(self):
+        self.addons = {}
+        self.guids = {}
+        self.built = None
+        self.refreshed = None
+        self.since = None
+
+    def execute(self, cursor, sql, where, **params):
+        params.update(STATUS_DELETED=base.STATUS_DELETED,
+                      SERVED_STATUSES=SERVED_STATUSES)
+        cursor.execute(sql.format(where=where), params)
+        return cursor.fetchall()
+
+    def load(self, cursor, where, **params):
+        """Return the compiled add-ons matching `where`, keyed by id."""
+        where = '%s AND %s' % (valid_addons, where)
+        rows = {}
+        for id_, guid, status, type_, premium_type in self.execute(
+                cursor, addons_sql, where, **params):
+            rows[id_] = (guid, status, type_, premium_type, [], {}, {})
+
+        for row in self.execute(cursor, candidates_sql, where, **params):
+            if row[0] in rows:
+                rows[row[0]][4].append(Candidate(*row[1:]))
+
+        for addon_id, version, status in self.execute(cursor, current_sql,
+                                                      where, **params):
+            if addon_id in rows:
+                # MySQL compares version numbers case-insensitively.
+                current = rows[addon_id][5].setdefault(version.lower(), [])
+                current.append(status)
+
+        for row in self.execute(cursor, incompatible_sql, where, **params):
+            if row[0] in rows:
+                rows[row[0]][6].setdefault(row[1], []).append(
+                    Incompatible(*row[2:]))
+
+        return dict(
+            (id_, Addon(id_, guid, status, type_, premium_type,
+                        tuple(candidates), current, incompatible))
+            for id_, (guid, status, type_, premium_type, candidates, current,
+                      incompatible) in rows.items())
+
+    def now(self, cursor):
+        # Use the clock of the database, the `modified` columns do.
+        cursor.execute('SELECT NOW()')
+        return cursor.fetchone()[0]
+
+    def build(self, cursor):
+        """Build the index from scratch."""
+        with statsd.timer('services.update.index.build'):
+            since = self.now(cursor)
+            self.set(self.load(cursor, '1 = 1'))
+            self.since = since
+            self.built = self.refreshed = time()
+        log.info(u'Built update index with %s add-ons.' % len(self.addons))
+
+    def load_guids(self, cursor, guids):
+        """
+        Only load the add-ons with the given guids, for a one-off index that
+        is never refreshed.
+        """
+        self.set(self.load(cursor, 'addons.guid IN %(guids)s',
+                           guids=tuple(guids)) if guids else {})
+
+    def set(self, addons):
+        self.guids = dict((id_, addon.guid.lower())
+                          for id_, addon in addons.items())
+        # MySQL compares guids case-insensitively.
+        self.addons = dict((self.guids[id_], addon)
+                           for id_, addon in addons.items())
+
+    def refresh(self, cursor):
+        """Reload the add-ons that changed since the last build or refresh."""
+        with statsd.timer('services.update.index.refresh'):
+            since = self.now(cursor)
+            cursor.execute(changed_sql, {'since': self.since})
+            ids = [row[0] for row in cursor.fetchall()]
+            for i in range(0, len(ids), self.chunk_size):
+                chunk = ids[i:i + self.chunk_size]
+                where = 'addons.id IN (%s)' % ','.join(
+                    str(int(id_)) for id_ in chunk)
+                addons = self.load(cursor, where)
+                for id_ in chunk:
+                    self.update(id_, addons.get(id_))
+            self.since = since
+            self.refreshed = time()
+        statsd.incr('services.update.index.changed', len(ids))
+
+    def update(self, id_, addon):
+        """
+        Replace the entry of the add-on `id_` by `addon`, or drop it if
+        `addon` is None.
+
+        Requests read the index while it's refreshed: the new entry is set
+        before the old one is dropped, and an entry is only dropped when its
+        guid changed or the add-on is gone.
+        """
+        old_guid = self.guids.get(id_)
+        guid = None
+        if addon is not None:
+            guid = addon.guid.lower()
+            self.addons[guid] = addon
+            self.guids[id_] = guid
+        else:
+            self.guids.pop(id_, None)
+        if old_guid is not None and old_guid != guid:
+            # Unless another add-on took the guid.
+            if getattr(self.addons.get(old_guid), 'id', id_) == id_:
+                self.addons.pop(old_guid, None)
+
+    def sync(self):
+        """Build or refresh the index if it's due, using a pooled connection.
+        """
+        now = time()
+        if self.built and now - self.built < getattr(
+                settings, 'SERVICES_UPDATE_INDEX_REBUILD', 3600):
+            if now - self.refreshed < getattr(
+                    settings, 'SERVICES_UPDATE_INDEX_REFRESH', 60):
+                return
+            method = self.refresh
+        else:
+            method = self.build
+
+        conn = mypool.connect()
+        try:
+            cursor = conn.cursor()
+            method(cursor)
+            cursor.close()
+        finally:
+            conn.close()
+
+    def get(self, guid):
+        return self.addons.get(guid.lower())
+
+    def resolve(self, data, compat_mode, pinned_version=None):
+        """
+        Return the row `services.update.Update.get_update` would find for
+        `data`, or None.
+        """
+        addon = self.addons.get(data['guid'].lower())
+        if addon is None:
+            return None
+
+        app_id = data['app_id']
+        version_int_ = data['version_int']
+        platforms = (1, data['appOS']) if data.get('appOS') else (1,)
+        d2c_max = None
+        if compat_mode == 'normal':
+            d2c_max = applications.D2C_MAX_VERSIONS.get(app_id)
+            if d2c_max:
+                d2c_max = version_int(d2c_max)
+
+        # No file (or no current version at all) behaves like a NULL
+        # `curfile.status` in the SQL.
+        current = addon.current.get(
+            (data.get('version') or '').lower()) or [None]
+        statuses = set(self.served_status(addon.status, status)
+                       for status in current)
+
+        for candidate in addon.candidates:
+            if (candidate.app_id != app_id or
+                    candidate.platform_id not in platforms or
+                    candidate.file_status not in statuses or
+                    not self.in_range(candidate.min_int, '<=', version_int_)):
+                continue
+
+            if pinned_version and candidate.version != pinned_version:
+                continue
+
+            if compat_mode == 'ignore':
+                pass
+            elif compat_mode == 'normal':
+                if ((candidate.strict_compat or
+                     candidate.binary_components) and
+                        not self.in_range(candidate.max_int, '>=',
+                                          version_int_)):
+                    continue
+                if d2c_max and not self.in_range(candidate.max_int, '>=',
+                                                 d2c_max):
+                    continue
+                if self.is_incompatible(
+                        addon.incompatible.get(candidate.version_id, ()),
+                        app_id, version_int_):
+                    continue
+            elif not self.in_range(candidate.max_int, '>=', version_int_):
+                continue
+
+            return {
+                'guid': addon.guid, 'type': addon.type,
+                'disabled_by_user': 0, 'min': candidate.min,
+                'max': candidate.max, 'file_id': candidate.file_id,
+                'file_status': candidate.file_status, 'hash': candidate.hash,
+                'filename': candidate.filename,
+                'version_id': candidate.version_id,
+                'datestatuschanged': candidate.datestatuschanged,
+                'strict_compat': candidate.strict_compat,
+                'releasenotes': candidate.releasenotes,
+                'version': candidate.version,
+                'premium_type': addon.premium_type}
+
+        return None
+
+    def served_status(self, addon_status, current_status):
+        """The file status we serve, see the CASE in `get_update`."""
+        if current_status == base.STATUS_BETA:
+            # Only beta updates for beta users, and only for full add-ons.
+            if addon_status == base.STATUS_PUBLIC:
+                return base.STATUS_BETA
+            return None
+        if (addon_status in (base.STATUS_LITE,
+                             base.STATUS_LITE_AND_NOMINATED) and
+                current_status in (None, base.STATUS_LITE,
+                                   base.STATUS_DISABLED)):
+            return base.STATUS_LITE
+        return base.STATUS_PUBLIC
+
+    def in_range(self, value, op, version_int_):
+        # A NULL `version_int` never matches in SQL.
+        if value is None:
+            return False
+        if op == '<=':
+            return value <= version_int_
+        return value >= version_int_
+
+    def is_incompatible(self, ranges, app_id, version_int_):
+        # This follows the operator precedence of the compat override
+        # subquery in `get_update`: only the first condition is restricted
+        # to the requested app.
+        for r in ranges:
+            if ((r.app_id == app_id and r.min_app_version == '0' and
+                 self.in_range(r.max_int, '>=', version_int_)) or
+                    (self.in_range(r.min_int, '<=', version_int_) and
+                     r.max_app_version == '*') or
+                    (self.in_range(r.min_int, '<=', version_int_) and
+                     self.in_range(r.max_int, '>=', version_int_))):
+                return True
+        return False
+
+
+index = UpdateIndex()
+index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the worker's update index, or None if it's disabled in settings.
+    """
+    if not getattr(settings, 'SERVICES_UPDATE_INDEX', False):
+        return None
+    # Block until the first build is done. After that, a single thread picks
+    # up changes while the others keep serving from the current index.
+    if index_lock.acquire(not index.built):
+        try:
+            index.sync()
+        finally:
+            index_lock.release()
+    return index
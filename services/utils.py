@@ -109,11 +109,17 @@ def get_mirror(status, id, row):
 
 def getconn():
     db = settings.SERVICES_DATABASE
-    return mysql.connect(host=db['HOST'], user=db['USER'],
-                         passwd=db['PASSWORD'], db=db['NAME'])
+    driver = mysql
+    if getattr(settings, 'SERVICES_DATABASE_DRIVER', 'MySQLdb') == 'pymysql':
+        # Pure Python, so it cooperates with gevent's patched sockets.
+        import pymysql as driver
+    return driver.connect(host=db['HOST'], user=db['USER'],
+                          passwd=db['PASSWORD'], db=db['NAME'])
 
 
-mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
+mypool = pool.QueuePool(getconn, **getattr(
+    settings, 'SERVICES_DATABASE_POOL',
+    {'max_overflow': 10, 'pool_size': 5, 'recycle': 300}))
 
 
 def log_configure():
@@ -117,6 +117,8 @@ SQL_RESET_SEQUENCES = False
 
 ES_DEFAULT_NUM_REPLICAS = 0
 ES_DEFAULT_NUM_SHARDS = 3
+# Index saved add-ons right away, tests expect them to be searchable.
+ES_INDEX_QUEUE_WINDOW = 0
 
 # Ensure that exceptions aren't re-raised.
 DEBUG_PROPAGATE_EXCEPTIONS = False
@@ -373,8 +373,10 @@ z.StatsManager = (function() {
                         groupVal.data[field] += val;
                     });
                 }
+                // Means are over the days that have data, like the
+                // rollups of the series views (see stats/columnar.py).
+                groupCount++;
             }
-            groupCount++;
         }, this);
         if (group == 'all') performAggregation();
         groupedData.empty = _.isEmpty(groupedData);